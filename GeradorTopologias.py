@@ -11,17 +11,37 @@ import os
 import re
 import math
 import logging
-import uuid
-import chardet
+import hashlib
+import base64
+import codecs
 import json
+import io
+import zlib
 import networkx as nx
+import numpy as np
 import time
 import random
 import argparse
+import asyncio
+import multiprocessing
+import shutil
+import signal
+import tempfile
+import threading
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 import platform
 import glob
+import gc
+import importlib.util
+from contextlib import contextmanager
+from operator import itemgetter, attrgetter
+from itertools import compress, chain
+from bisect import bisect_left, insort
+from html import unescape
+from urllib.parse import quote, unquote
+import xml.etree.ElementTree as ET
 
 versionctr = "B1.31"
 
@@ -33,6 +53,17 @@ try:
 except ImportError:
     pass  # psutil não está instalado, mas não é crítico
 
+# Pillow é usado apenas na pré-visualização da GUI
+PIL_AVAILABLE = False
+try:
+    from PIL import Image, ImageColor, ImageDraw
+    PIL_AVAILABLE = True
+except ImportError:
+    pass
+
+# Sem scipy o spring_layout do networkx só resolve grafos com menos de 500 nós
+SCIPY_AVAILABLE = importlib.util.find_spec("scipy") is not None
+
 
 
 # =====================================================
@@ -84,6 +115,8 @@ Ferramenta para geração automática de diagramas de rede (.drawio) a partir da
   -o OPÇÕES   Opções de visualização:
               n = ocultar nomes dos nós
               c = ocultar camadas de conexão
+              a = agrupar conexões paralelas em uma única ligação por par
+                  de nós (rótulos concatenados, quantidade e maior espessura)
               Ex: -o nc → ativa ambas opções
   -d          Ignorar customizações nos CSVs (usar apenas config.json)
   -f FILTRO   Filtro para selecionar elementos/camadas:
@@ -93,6 +126,46 @@ Ferramenta para geração automática de diagramas de rede (.drawio) a partir da
               rc = remover camadas que iniciam com os filtros
               Ex: -f "in:RTIC;RTOC" → somente elementos começando com RTIC ou RTOC
               Ex: -f "rc:METRO;INNER" → remove elementos das camadas METRO ou INNER
+              Expressões combinam termos campo:valores com E/OU/NAO
+              (ou AND/OR/NOT) e parênteses. Campos:
+              nome   = nome inicia com    camada = camada inicia com
+              siteid = siteid inicia com  regiao = região do siteid
+              nivel  = nível (3 ou 2-4)   re     = expressão regular no nome
+              Ex: -f "camada:CORE E regiao:SUDESTE E NAO re:\"-LAB[0-9]+$\""
+  -a          Leitura agregada de conexões (arquivos muito grandes):
+              conexões paralelas com mesma origem, destino e estilo viram um
+              único registro com contagem e rótulos concatenados; o diagrama
+              continua desenhando uma curva por conexão
+  --focus NÓ[,NÓ]  Gera apenas a vizinhança dos nós informados
+  --hops K    Distância máxima (em conexões) a partir dos nós de --focus (padrão: 2)
+              Ex: --focus RTIC-SPO-01 --hops 2
+  --crop RECORTE  Recorte geográfico (graus decimais, negativos para S/W):
+              lat_min,lon_min,lat_max,lon_max → retângulo
+              lat,lon,raio_km                 → raio em torno de um ponto
+              SITEID,raio_km                  → raio em torno de um site
+              Somente nós com siteid dentro do recorte são lidos; o layout
+              geográfico usa a área recortada como canvas.
+              Ex: --crop=-24.0,-47.0,-23.0,-46.0   Ex: --crop SPO01,50
+  --sites CHAVE  Adiciona (como primeira página) a visão por site, agrupando
+              por siteid ou localidade: um vértice por site com a quantidade
+              de elementos e uma ligação ponderada por par de sites
+              Ex: --sites siteid   Ex: --sites localidade
+  --update ARQUIVO.drawio  Atualiza um diagrama gerado antes em vez de criar
+              outro: nós e conexões são casados pelo id, os que sumiram dos
+              CSVs são removidos, os alterados recebem rótulo/estilo novos e
+              os novos entram perto dos vizinhos; a geometria ajustada à mão
+              é mantida (-t é ignorado; apenas um arquivo de conexões)
+              Ex: --update rede_20250615143045_geografico.drawio rede.csv
+  --watch     Após gerar, monitora os CSVs e o config.json e gera de novo a
+              cada alteração (só as saídas afetadas, sempre com o mesmo nome)
+  --daemon [ENDERECO]  Servidor local de renderização: mantém config, índices
+              e workers carregados entre jobs. ENDERECO = host:porta local
+              (padrão 127.0.0.1:8765) ou caminho de socket Unix
+              POST /render com o job em JSON ({{"conexoes": "rede.csv",
+              "layouts": "c"}} ou {{"conexoes_csv": "<conteúdo>", ...}});
+              a resposta traz os eventos em NDJSON (fila, inicio, log, fim)
+              GET /stats traz fila, contadores e latência p50/p99
+  --workers N Jobs simultâneos no modo --daemon (padrão: núcleos, até 4)
   -h          Mostra esta ajuda
 
 📂 ARQUIVOS DE ENTRADA:
@@ -153,6 +226,8 @@ Controle completo da aparência e comportamento das topologias:
    • Define páginas/visões do diagrama
    • "visible_layers": null = mostra todas camadas
    • Ex: {{"name": "VISÃO NORTE", "visible_layers": ["CORE_NORTE"]}}
+   • "aggregate": "siteid" ou "localidade" = página agregada por site
+     Ex: {{"name": "SITES", "visible_layers": null, "aggregate": "siteid"}}
 
 6. PARÂMETROS DE LAYOUT (Personalize cada algoritmo):
    • CIRCULAR_LAYOUT: center_x, center_y, base_radius, radius_increment
@@ -215,37 +290,2005 @@ Use o Gerador de Topologias para Backbone Nacional, disponível em:
     https://github.com/flashbsb/Network-Topology-Generator-for-Drawio
 """.format(versionctr=versionctr)
 
-# Configuração de logging será feita no main() com timestamp
-logger = logging.getLogger(__name__)
+# Configuração de logging será feita no main() com timestamp; importado como
+# biblioteca, o módulo não emite nada até a aplicação configurar o logging
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+# Função para logar uso de memória
+def log_memory_usage(message=""):
+    """Registra uso de memória com mensagem opcional"""
+    if not PSUTIL_AVAILABLE:
+        return
+    
+    try:
+        process = psutil.Process(os.getpid())
+        mem = process.memory_info().rss / 1024 / 1024  # MB
+        logger.debug("🧠 %sUso de memória: %.2f MB", f"{message} - " if message else "", mem)
+    except Exception as e:
+        logger.error("Falha ao medir memória: %s", str(e))
+
+# Detecção de encoding: amostra limitada do início do arquivo, lida em blocos
+ENCODING_SAMPLE_BYTES = 1024 * 1024
+ENCODING_CHUNK_BYTES = 64 * 1024
+# Bytes sem caractere definido no cp1252 (presentes => latin-1)
+CP1252_UNDEFINED = frozenset(b'\x81\x8d\x8f\x90\x9d')
+_encoding_cache = {}  # (caminho, mtime, tamanho) -> encoding
+
+def detect_encoding(file_path):
+    """
+    Detecta o encoding de um arquivo CSV
+    
+    Verifica BOM, valida UTF-8 de forma incremental sobre até
+    ENCODING_SAMPLE_BYTES e, se inválido, assume cp1252 (ou latin-1 quando
+    há bytes indefinidos no cp1252). O resultado fica em cache por
+    (caminho, mtime, tamanho), evitando nova detecção do mesmo arquivo.
+    
+    Args:
+        file_path (str): Caminho do arquivo
+    
+    Returns:
+        str: Nome do encoding para open()
+    """
+    try:
+        stat = os.stat(file_path)
+        cache_key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+        encoding = _encoding_cache.get(cache_key)
+        if encoding is not None:
+            return encoding
+        
+        with open(file_path, 'rb') as f:
+            chunk = f.read(ENCODING_CHUNK_BYTES)
+            
+            # Verifica presença de BOM
+            if chunk.startswith(codecs.BOM_UTF8):
+                encoding = 'utf-8-sig'
+            elif chunk.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+                encoding = 'utf-16'
+            else:
+                decoder = codecs.getincrementaldecoder('utf-8')()
+                sample = b''
+                read_bytes = 0
+                encoding = 'utf-8-sig'  # Aceita arquivos com ou sem BOM
+                while chunk:
+                    read_bytes += len(chunk)
+                    try:
+                        # final=False: caractere multibyte cortado no fim do bloco não é erro
+                        decoder.decode(chunk, final=False)
+                    except UnicodeDecodeError:
+                        sample = chunk
+                        encoding = None
+                        break
+                    if read_bytes >= ENCODING_SAMPLE_BYTES:
+                        break
+                    chunk = f.read(ENCODING_CHUNK_BYTES)
+                
+                if encoding is None:
+                    encoding = 'latin-1' if CP1252_UNDEFINED.intersection(sample) else 'cp1252'
+        
+        _encoding_cache[cache_key] = encoding
+        return encoding
+    except Exception as e:
+        logger.error("Falha ao detectar encoding: %s", str(e))
+        return 'utf-8-sig'  # Padrão seguro para Windows
+
+# Templates XML para geração do arquivo draw.io
+DRAWIO_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<mxfile host="app.diagrams.net" modified="{timestamp}" agent="Mozilla/5.0" etag="{etag}" version="21.3.7">
+"""
+
+DRAWIO_DIAGRAM_TEMPLATE = """  <diagram name="{page_name}" id="{diagram_id}">
+    <mxGraphModel dx="1422" dy="793" grid="0" gridSize="10" guides="1" tooltips="1" connect="1" arrows="1" fold="1" page="0" pageScale="1" pageWidth="1169" pageHeight="827" math="0" shadow="1">
+      <root>
+        <mxCell id="0"/>
+        <mxCell id="1" parent="0"/>
+"""
+
+DRAWIO_FOOTER = """
+</mxfile>
+"""
+
+# Nome do layout (sufixo do arquivo gerado) -> seção do config.json
+LAYOUT_CONFIG_KEYS = {
+    'circular': 'CIRCULAR_LAYOUT',
+    'organico': 'ORGANIC_LAYOUT',
+    'geografico': 'GEOGRAPHIC_LAYOUT',
+    'hierarquico': 'HIERARCHICAL_LAYOUT'
+}
+
+# Cache de layouts entre execuções no mesmo processo (--watch / --daemon): as
+# posições só dependem do grafo, dos nós e das seções do config que não são
+# puramente visuais
+LAYOUT_CACHE_SIZE = 8
+LAYOUT_COSMETIC_CONFIG_KEYS = ('LAYER_COLORS', 'CONNECTION_STYLES', 'CONNECTION_STYLE_BASE',
+                               'LEGEND_CONFIG', 'PAGE_DEFINITIONS')
+_layout_cache = None  # impressão digital -> posições; None = desativado
+COMPONENT_CACHE_SIZE = 4096
+_component_cache = None  # impressão digital do componente -> posições locais; None = desativado
+
+
+def enable_layout_cache():
+    """Ativa o cache de layouts (modos que geram várias vezes no mesmo processo)"""
+    global _layout_cache, _component_cache
+    if _layout_cache is None:
+        _layout_cache = {}
+    if _component_cache is None:
+        _component_cache = {}
+
+# Atualização de arquivo existente (--update): afastamento dos nós novos em
+# relação ao baricentro dos vizinhos já posicionados (ângulo áureo entre eles)
+UPDATE_NEIGHBOR_RADIUS = 80
+UPDATE_ROW_SPACING = 120
+GOLDEN_ANGLE = math.pi * (3 - math.sqrt(5))
+# Layout geográfico: distância entre os nós sem coordenadas agrupados em filotaxia
+SEM_SITEID_SPACING = 120
+MERGED_STYLE_CACHE_SIZE = 4096
+_merged_style_cache = {}  # (estilo no arquivo, estilo gerado) -> estilo combinado
+
+# Chaves de agrupamento da visão por site (PAGE_DEFINITIONS "aggregate" / --sites)
+SITE_AGGREGATION_KEYS = ('siteid', 'localidade')
+SITE_VIEW_PAGE_NAMES = {'siteid': 'VISÃO POR SITE', 'localidade': 'VISÃO POR LOCALIDADE'}
+
+# Colunas opcionais de estilo do conexoes.csv e valor assumido quando ausentes
+CONEXAO_STYLE_COLUMNS = (
+    ('strokeWidth', None),
+    ('strokeColor', None),
+    ('dashed', '0'),
+    ('fontStyle', '1'),
+    ('fontSize', '14'),
+)
+
+# Leitura agregada (-a): máximo de rótulos distintos concatenados por conexão
+AGGREGATED_LABEL_LIMIT = 5
+AGGREGATED_LABEL_SEPARATOR = ' / '
+
+# Escape de valores de atributo XML: entidades para os caracteres especiais,
+# referências numéricas para quebras de linha/tab e remoção dos caracteres de
+# controle que o XML 1.0 não aceita
+_XML_ESCAPE_TABLE = str.maketrans({
+    '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&apos;',
+    '\n': '&#xa;', '\r': '&#xd;', '\t': '&#x9;',
+    **{chr(code): None for code in range(0x20) if chr(code) not in '\n\r\t'}
+})
+_xml_special_search = re.compile('[&<>"\'\x00-\x1f]').search
+_xml_text_search = re.compile('[&<>]').search
+
+
+def stable_id(key):
+    """
+    Id curto (11 caracteres) e determinístico para células e páginas do draw.io
+    
+    Derivado de uma chave estável (nome do nó, camada, par de nós + ordinal,
+    nome da página), o id se repete entre execuções e máquinas e não depende
+    da ordem das linhas dos CSVs. São 64 bits de hash: colisões são
+    desprezíveis mesmo com milhões de células na página.
+    
+    Args:
+        key (str): Chave estável, prefixada pelo tipo do objeto
+        
+    Returns:
+        str: Id em base64 url-safe
+    """
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return base64.urlsafe_b64encode(digest)[:11].decode('ascii')
+
+
+def xml_escape(text):
+    """
+    Escapa texto para uso em valor de atributo XML
+    
+    Textos sem caracteres especiais (o caso comum) são devolvidos sem cópia,
+    de modo que o valor escapado não duplica a memória do valor bruto.
+    
+    Args:
+        text (str): Texto bruto
+        
+    Returns:
+        str: Texto pronto para ser interpolado entre aspas duplas
+    """
+    if not text or _xml_special_search(text) is None:
+        return text
+    return text.translate(_XML_ESCAPE_TABLE)
+
+
+class NodeRecord:
+    """
+    Registro compacto de um nó (elemento de rede)
+    
+    O campo idx é o identificador inteiro denso do nó, usado pelas conexões,
+    pelos layouts e pela geração das páginas no lugar do nome. rotulo é o
+    texto exibido (apelido ou nome) já escapado para XML.
+    """
+    __slots__ = ('idx', 'nome', 'camada', 'nivel', 'cor', 'coordenadas',
+                 'regionalized', 'siteid', 'apelido', 'cell_id', 'rotulo')
+
+    def __init__(self, idx, nome, camada, nivel, cor=None, siteid='', apelido=''):
+        self.idx = idx
+        self.nome = nome
+        self.camada = camada
+        self.nivel = nivel
+        self.cor = cor
+        self.coordenadas = None
+        self.regionalized = False
+        self.siteid = siteid
+        self.apelido = apelido
+        self.cell_id = None
+        self.rotulo = xml_escape(apelido or nome)
+
+
+class ConnectionRecord:
+    """
+    Registro compacto de uma conexão lida do conexoes.csv
+    
+    origem/destino são os índices inteiros dos nós (NodeRecord.idx). O estilo
+    (strokeWidth, strokeColor, dashed, fontStyle, fontSize) é uma tupla
+    compartilhada entre todas as conexões com os mesmos valores no CSV.
+    count é o número de linhas do CSV representadas pelo registro (maior que 1
+    apenas na leitura agregada, opção -a). rotulo é texto_conexao já escapado
+    para XML.
+    """
+    __slots__ = ('origem', 'destino', 'camada', 'texto_conexao', 'estilo', 'count', 'rotulo')
+
+    def __init__(self, origem, destino, camada, texto_conexao, estilo, count=1):
+        self.origem = origem
+        self.destino = destino
+        self.camada = camada
+        self.texto_conexao = texto_conexao
+        self.estilo = estilo
+        self.count = count
+        self.rotulo = xml_escape(texto_conexao)
+
+    @property
+    def strokeWidth(self):
+        return self.estilo[0]
+
+    @property
+    def strokeColor(self):
+        return self.estilo[1]
+
+    @property
+    def dashed(self):
+        return self.estilo[2]
+
+    @property
+    def fontStyle(self):
+        return self.estilo[3]
+
+    @property
+    def fontSize(self):
+        return self.estilo[4]
+
+
+class PrefixIndex:
+    """
+    Índice de prefixos compilado uma única vez
+    
+    Responde em tempo praticamente constante às duas perguntas feitas por
+    nó/camada: qual o prefixo cadastrado mais longo que inicia um texto
+    (tabela por tamanho de prefixo) e quais chaves começam com um prefixo
+    (tupla ordenada + bisect).
+    """
+    __slots__ = ('_by_length', '_lengths', '_sorted')
+
+    def __init__(self, keys=()):
+        self._by_length = defaultdict(set)
+        for key in keys:
+            self._by_length[len(key)].add(key)
+        # Construção em lote: uma única ordenação em vez de insort por chave
+        self._lengths = sorted(self._by_length, reverse=True)
+        self._sorted = sorted(set().union(*self._by_length.values()))
+
+    def add(self, key):
+        """Inclui uma chave no índice"""
+        if key in self._by_length[len(key)]:
+            return
+        self._by_length[len(key)].add(key)
+        self._lengths = sorted(self._by_length, reverse=True)
+        insort(self._sorted, key)
+
+    def longest_prefix(self, text):
+        """Retorna a chave mais longa que é prefixo de text (ou None)"""
+        for length in self._lengths:
+            if length <= len(text) and text[:length] in self._by_length[length]:
+                return text[:length]
+        return None
+
+    def matches(self, text):
+        """Indica se alguma chave é prefixo de text"""
+        return self.longest_prefix(text) is not None
+
+    def keys_with_prefix(self, prefix):
+        """Retorna as chaves que começam com prefix, em ordem alfabética"""
+        keys = self._sorted
+        start = bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and keys[end].startswith(prefix):
+            end += 1
+        return keys[start:end]
+
+
+
+# Expressões de filtro (-f): campos aceitos, atalhos da sintaxe original e operadores
+FILTER_FIELDS = ('nome', 're', 'camada', 'regiao', 'siteid', 'nivel')
+FILTER_LEGACY_TYPES = {  # tipo -> (campo, negado)
+    'in': ('nome', False),
+    'rn': ('nome', True),
+    'ic': ('camada', False),
+    'rc': ('camada', True),
+}
+FILTER_OPERATORS = {
+    'AND': 'and', 'E': 'and',
+    'OR': 'or', 'OU': 'or',
+    'NOT': 'not', 'NAO': 'not', 'NÃO': 'not',
+}
+_FILTER_TOKEN_PATTERN = re.compile(
+    r'\s*(?:([()])|(\w+)\s*:\s*("(?:[^"\\]|\\.)*"|[^\s()"]*)|(\S+))'
+)
+# Espaços em volta de ';' fora de aspas ("in:RTIC ; RTOC"); valores entre aspas ficam intactos
+_FILTER_SEPARATOR_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"|\s*;\s*')
+
+
+class NodeSelectionIndex:
+    """
+    Índices dos nós ativos usados por FilterExpression.select()
+    
+    Montados uma vez por seleção, para que cada termo da expressão seja
+    resolvido por consulta (nome, camada, região, siteid, nível -> nós)
+    em vez de percorrer todos os nós.
+    """
+    __slots__ = ('universe', 'names', 'name_index', 'layers', 'layer_index',
+                 'regions', 'siteids', 'siteid_index', 'niveis')
+
+    def __init__(self, nodes, layers, region_of):
+        """
+        Args:
+            nodes (dict): nome -> NodeRecord dos nós ativos
+            layers (dict): camada -> índices dos nós
+            region_of (callable): siteid -> região ('' se desconhecida)
+        """
+        self.names = {name: data.idx for name, data in nodes.items()}
+        self.universe = set(self.names.values())
+        self.name_index = PrefixIndex(self.names)
+        self.layers = {layer: members for layer, members in layers.items() if members}
+        self.layer_index = PrefixIndex(self.layers)
+        self.regions = defaultdict(set)
+        self.siteids = defaultdict(set)
+        self.niveis = defaultdict(set)
+        site_regions = {}
+        for data in nodes.values():
+            siteid = data.siteid
+            self.siteids[siteid].add(data.idx)
+            self.niveis[data.nivel].add(data.idx)
+            regiao = site_regions.get(siteid)
+            if regiao is None:
+                regiao = site_regions[siteid] = region_of(siteid).upper()
+            self.regions[regiao].add(data.idx)
+        self.siteid_index = PrefixIndex(self.siteids)
+
+
+class FilterExpression:
+    """
+    Expressão de filtro compilada (-f)
+    
+    Termos campo:valores (nome, re, camada, regiao, siteid, nivel) combinados
+    com AND/OR/NOT (ou E/OU/NAO) e parênteses. Os tipos originais continuam
+    válidos como termos: in = nome, rn = NOT nome, ic = camada, rc = NOT camada.
+    
+    A mesma expressão é avaliada de duas formas: matches() decide um nó
+    isolado (filtro durante a leitura dos CSVs) e select() resolve a expressão
+    inteira com álgebra de conjuntos sobre um NodeSelectionIndex.
+    """
+    __slots__ = ('op', 'field', 'values', 'matcher', 'children', 'uses_node')
+
+    def __init__(self, op, field=None, values=(), children=()):
+        self.op = op  # 'term', 'and', 'or' ou 'not'
+        self.field = field
+        self.values = values
+        self.children = children
+        self.matcher = None
+        if op == 'term':
+            self.uses_node = field not in ('nome', 're')
+            if field in ('nome', 'camada', 'siteid'):
+                self.matcher = PrefixIndex(values)
+            elif field == 're':
+                try:
+                    self.matcher = [re.compile(value) for value in values]
+                except re.error as e:
+                    raise ValueError(f"Expressão regular inválida no filtro: {e}") from None
+            elif field == 'regiao':
+                self.matcher = frozenset(value.upper() for value in values)
+            else:  # nivel: valores "3" ou faixas "2-4"
+                self.matcher = tuple(self._parse_nivel(value) for value in values)
+        else:
+            self.uses_node = any(child.uses_node for child in children)
+
+    @staticmethod
+    def _parse_nivel(value):
+        low, sep, high = value.partition('-')
+        try:
+            low = int(low)
+            return (low, int(high) if sep else low)
+        except ValueError:
+            raise ValueError(f"Nível inválido no filtro: '{value}'") from None
+
+    def matches(self, nome, camada='', regiao='', siteid='', nivel=None):
+        """
+        Avalia a expressão para um único nó
+        
+        Args:
+            nome (str): Nome do nó
+            camada (str): Camada final (após regionalização)
+            regiao (str): Região do siteid ('' se desconhecida)
+            siteid (str): Siteid do nó
+            nivel (int): Nível do nó
+            
+        Returns:
+            bool: True se o nó deve ser mantido
+        """
+        op = self.op
+        if op == 'and':
+            return all(child.matches(nome, camada, regiao, siteid, nivel) for child in self.children)
+        if op == 'or':
+            return any(child.matches(nome, camada, regiao, siteid, nivel) for child in self.children)
+        if op == 'not':
+            return not self.children[0].matches(nome, camada, regiao, siteid, nivel)
+        
+        field = self.field
+        if field == 'nome':
+            return self.matcher.matches(nome)
+        if field == 'camada':
+            return self.matcher.matches(camada)
+        if field == 'siteid':
+            return self.matcher.matches(siteid)
+        if field == 're':
+            return any(pattern.search(nome) for pattern in self.matcher)
+        if field == 'regiao':
+            return regiao.upper() in self.matcher
+        return nivel is not None and any(low <= nivel <= high for low, high in self.matcher)
+
+    def select(self, index):
+        """
+        Resolve a expressão com álgebra de conjuntos
+        
+        Args:
+            index (NodeSelectionIndex): Índices dos nós ativos
+            
+        Returns:
+            set: Índices dos nós mantidos
+        """
+        op = self.op
+        if op == 'and':
+            selected = None
+            for child in self.children:
+                members = child.select(index)
+                selected = members if selected is None else selected & members
+                if not selected:
+                    break
+            return selected
+        if op == 'or':
+            return set().union(*(child.select(index) for child in self.children))
+        if op == 'not':
+            return index.universe - self.children[0].select(index)
+        
+        field = self.field
+        selected = set()
+        if field == 'nome':
+            names = index.names
+            for value in self.values:
+                selected.update(names[name] for name in index.name_index.keys_with_prefix(value))
+        elif field == 'camada':
+            for value in self.values:
+                for layer in index.layer_index.keys_with_prefix(value):
+                    selected |= index.layers[layer]
+        elif field == 'siteid':
+            for value in self.values:
+                for siteid in index.siteid_index.keys_with_prefix(value):
+                    selected |= index.siteids[siteid]
+        elif field == 'regiao':
+            for regiao in self.matcher:
+                selected |= index.regions.get(regiao, set())
+        elif field == 'nivel':
+            for nivel, members in index.niveis.items():
+                if nivel is not None and any(low <= nivel <= high for low, high in self.matcher):
+                    selected |= members
+        else:  # re: não há índice para expressões regulares
+            patterns = self.matcher
+            selected.update(idx for name, idx in index.names.items()
+                            if any(pattern.search(name) for pattern in patterns))
+        return selected
+
+
+def compile_filter(filter_string):
+    """
+    Compila uma expressão de filtro (-f / campo de filtro da GUI)
+    
+    Exemplos:
+        in:RTIC;RTOC
+        camada:CORE E regiao:SUDESTE E NAO re:"-LAB[0-9]+$"
+        (ic:METRO OR nivel:1-2) AND NOT siteid:TMP
+    
+    Args:
+        filter_string (str): Expressão de filtro
+        
+    Returns:
+        FilterExpression: Expressão compilada
+        
+    Raises:
+        ValueError: Se a expressão for inválida
+    """
+    tokens = []
+    text = _FILTER_SEPARATOR_PATTERN.sub(
+        lambda m: m.group() if m.group().startswith('"') else ';', filter_string.strip())
+    for match in _FILTER_TOKEN_PATTERN.finditer(text):
+        paren, field, value, word = match.groups()
+        if paren:
+            tokens.append((paren, None))
+        elif field:
+            field = field.lower()
+            if value.startswith('"'):
+                value = value[1:-1].replace('\\"', '"')
+                values = (value,)
+            else:
+                values = tuple(v for v in value.split(';') if v)
+            if not values or not all(values):
+                raise ValueError(f"Valor vazio no filtro: '{match.group().strip()}'")
+            if field in FILTER_LEGACY_TYPES:
+                field, negated = FILTER_LEGACY_TYPES[field]
+                term = FilterExpression('term', field, values)
+                tokens.append(('expr', FilterExpression('not', children=(term,)) if negated else term))
+            elif field in FILTER_FIELDS:
+                tokens.append(('expr', FilterExpression('term', field, values)))
+            else:
+                raise ValueError(f"Campo de filtro desconhecido: '{field}'")
+        elif word:
+            operator = FILTER_OPERATORS.get(word.upper())
+            if operator is None:
+                raise ValueError(f"Termo inválido no filtro: '{word}' (use campo:valor)")
+            tokens.append((operator, None))
+    if not tokens:
+        raise ValueError("Filtro vazio")
+    
+    position = 0
+    
+    def peek():
+        return tokens[position][0] if position < len(tokens) else None
+    
+    def parse_or():
+        children = [parse_and()]
+        while peek() == 'or':
+            advance()
+            children.append(parse_and())
+        return children[0] if len(children) == 1 else FilterExpression('or', children=tuple(children))
+    
+    def parse_and():
+        children = [parse_not()]
+        # Termos lado a lado sem operador também são combinados com AND
+        while peek() in ('and', 'not', 'expr', '('):
+            if peek() == 'and':
+                advance()
+            children.append(parse_not())
+        return children[0] if len(children) == 1 else FilterExpression('and', children=tuple(children))
+    
+    def parse_not():
+        if peek() == 'not':
+            advance()
+            return FilterExpression('not', children=(parse_not(),))
+        if peek() == '(':
+            advance()
+            expr = parse_or()
+            if peek() != ')':
+                raise ValueError("Parêntese não fechado no filtro")
+            advance()
+            return expr
+        if peek() == 'expr':
+            return advance()
+        raise ValueError("Expressão de filtro incompleta")
+    
+    def advance():
+        nonlocal position
+        token = tokens[position]
+        position += 1
+        return token[1]
+    
+    expr = parse_or()
+    if position != len(tokens):
+        raise ValueError(f"Símbolo inesperado no filtro: '{tokens[position][0]}'")
+    return expr
+
+class Adjacency:
+    """
+    Adjacência do grafo em formato CSR (arrays NumPy), construída uma vez após a leitura
+
+    src/dst guardam as pontas de cada conexão na mesma ordem de
+    TopologyGenerator.connections. indptr/indices formam a vizinhança não
+    direcionada de cada índice de nó: os vizinhos de i são
+    indices[indptr[i]:indptr[i + 1]]. pair_count/pair_rank dão, por conexão,
+    o total de conexões com o mesmo par (origem, destino) e a posição desta
+    conexão dentro do grupo, ponderados por weight (ConnectionRecord.count).
+    """
+    __slots__ = ('node_count', 'src', 'dst', 'weight', 'indptr', 'indices', 'degree',
+                 'pair_count', 'pair_rank')
+
+    def __init__(self, node_count, src, dst, weight=None):
+        self.node_count = node_count
+        self.src = src
+        self.dst = dst
+        self.weight = weight if weight is not None else np.ones(len(src), dtype=np.int32)
+
+        # Vizinhança não direcionada (cada conexão aparece nas duas pontas)
+        rows = np.concatenate((src, dst))
+        cols = np.concatenate((dst, src))
+        order = np.argsort(rows, kind='stable')
+        self.indices = cols[order]
+        counts = np.bincount(rows, minlength=node_count)
+        self.indptr = np.zeros(node_count + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.indptr[1:])
+        self.degree = counts
+
+        # Multiplicidade de cada par direcional (origem, destino)
+        keys = src.astype(np.int64) * max(node_count, 1) + dst
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        is_start = np.ones(len(keys), dtype=bool)
+        is_start[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        starts = np.flatnonzero(is_start)
+        group_sizes = np.diff(np.append(starts, len(keys)))
+        group_of = np.repeat(np.arange(len(starts)), group_sizes)
+        sorted_weight = self.weight[order]
+        offset = np.cumsum(sorted_weight) - sorted_weight  # Soma dos pesos anteriores
+        self.pair_count = np.empty(len(keys), dtype=np.int32)
+        self.pair_rank = np.empty(len(keys), dtype=np.int32)
+        if len(keys):
+            self.pair_count[order] = np.add.reduceat(sorted_weight, starts)[group_of]
+            self.pair_rank[order] = offset - offset[starts][group_of]
+
+    @classmethod
+    def from_connections(cls, node_count, connections):
+        """Constrói a adjacência a partir da lista de ConnectionRecord"""
+        src = np.fromiter(map(attrgetter('origem'), connections), dtype=np.int32, count=len(connections))
+        dst = np.fromiter(map(attrgetter('destino'), connections), dtype=np.int32, count=len(connections))
+        weight = np.fromiter(map(attrgetter('count'), connections), dtype=np.int32, count=len(connections))
+        return cls(node_count, src, dst, weight)
+
+    def neighbors(self, idx):
+        """Retorna os índices vizinhos de um nó (com repetição para conexões paralelas)"""
+        return self.indices[self.indptr[idx]:self.indptr[idx + 1]]
+
+    def k_hop(self, seeds, hops):
+        """
+        Nós a até hops saltos das sementes (BFS por níveis sobre o CSR)
+        
+        Cada nível expande a fronteira inteira com operações vetorizadas, de
+        modo que o custo é proporcional às conexões da vizinhança visitada.
+        
+        Args:
+            seeds (iterable): Índices dos nós de partida
+            hops (int): Distância máxima (em conexões)
+            
+        Returns:
+            np.ndarray: Máscara booleana por índice de nó
+        """
+        reached = np.zeros(self.node_count, dtype=bool)
+        frontier = np.unique(np.fromiter(seeds, dtype=np.int64))
+        reached[frontier] = True
+        for _ in range(hops):
+            if not len(frontier):
+                break
+            starts = self.indptr[frontier]
+            lengths = self.indptr[frontier + 1] - starts
+            total = int(lengths.sum())
+            if not total:
+                break
+            # Posições de todas as fatias indices[start:end] da fronteira, concatenadas
+            offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+            neighbors = self.indices[offsets + np.arange(total)]
+            frontier = np.unique(neighbors[~reached[neighbors]])
+            reached[frontier] = True
+        return reached
+
+    def edge_mask(self, alive):
+        """Máscara das conexões cujas duas pontas estão vivas (alive: array bool por índice)"""
+        return alive[self.src] & alive[self.dst]
+
+    def subgraph(self, mask):
+        """Nova adjacência contendo apenas as conexões selecionadas pela máscara"""
+        return Adjacency(self.node_count, self.src[mask], self.dst[mask], self.weight[mask])
+
+    def group_edges(self, group_of, mask=None):
+        """
+        Agrega as conexões entre grupos de nós em arestas não direcionadas ponderadas
+        
+        Uma única passada vetorizada sobre src/dst: conexões com alguma ponta
+        fora de grupo (group_of < 0) ou internas a um grupo são descartadas e
+        as demais são somadas (por weight) por par de grupos.
+        
+        Args:
+            group_of (np.ndarray): Grupo de cada índice de nó (-1 = sem grupo)
+            mask (np.ndarray): Máscara opcional das conexões consideradas
+            
+        Returns:
+            tuple: (grupo_a, grupo_b, peso) como arrays, com grupo_a < grupo_b
+        """
+        src_group = group_of[self.src]
+        dst_group = group_of[self.dst]
+        keep = (src_group >= 0) & (dst_group >= 0) & (src_group != dst_group)
+        if mask is not None:
+            keep &= mask
+        low = np.minimum(src_group[keep], dst_group[keep]).astype(np.int64)
+        high = np.maximum(src_group[keep], dst_group[keep]).astype(np.int64)
+        base = max(int(group_of.max(initial=0)) + 1, 1)
+        keys, inverse = np.unique(low * base + high, return_inverse=True)
+        weight = np.bincount(inverse, weights=self.weight[keep], minlength=len(keys)).astype(np.int64)
+        return keys // base, keys % base, weight
+
+    def unique_edges(self):
+        """Pares não direcionados distintos (u <= v), prontos para o networkx"""
+        if not len(self.src):
+            return []
+        base = max(self.node_count, 1)
+        low = np.minimum(self.src, self.dst).astype(np.int64)
+        high = np.maximum(self.src, self.dst).astype(np.int64)
+        keys = np.unique(low * base + high)
+        return list(zip((keys // base).tolist(), (keys % base).tolist()))
+
+
+def dms_to_decimal(dms_str, coord_type, site_id):
+    """
+    Converte coordenadas DMS para decimal com tratamento robusto
+    
+    Args:
+        dms_str (str): Coordenada no formato DMS
+        coord_type (str): 'lat' ou 'lon'
+        site_id (str): ID do site para logs
+        
+    Returns:
+        float: Valor decimal ou None se falhar
+    """
+    if not dms_str or str(dms_str).strip() == '':
+        logger.error("Coordenada vazia para site %s", site_id)
+        return None
+    
+    try:
+        # Pré-processamento da string
+        dms_clean = str(dms_str).strip().upper()
+        direcao = None
+        
+        # Extrair direção (N/S/E/W)
+        if dms_clean[-1] in ['N', 'S', 'E', 'W']:
+            direcao = dms_clean[-1]
+            dms_clean = dms_clean[:-1].strip()
+        
+        # Normalizar formato
+        dms_clean = dms_clean.replace(',', '.').replace(' ', '')
+        parts = [p for p in dms_clean.split('.') if p != '']
+        
+        if len(parts) < 2:
+            logger.error("Formato inválido para site %s: %s", site_id, dms_str)
+            return None
+        
+        # Combinar partes fracionadas
+        if len(parts) > 3:
+            seconds_str = '.'.join(parts[2:])
+            parts = parts[:2] + [seconds_str]
+        
+        # Converter para floats
+        try:
+            graus = float(parts[0])
+            minutos = float(parts[1])
+            segundos = float(parts[2]) if len(parts) > 2 else 0.0
+        except ValueError as e:
+            logger.error("Valor não numérico em %s: %s", site_id, dms_str)
+            return None
+        
+        # Calcular valor decimal
+        decimal = graus + minutos/60 + segundos/3600
+        
+        # Determinar direção padrão se não especificada
+        if not direcao:
+            if coord_type == 'lat': direcao = 'S'
+            elif coord_type == 'lon': direcao = 'W'
+        
+        # Aplicar sinal conforme direção
+        if direcao in ['S', 'W']:
+            decimal = -decimal
+            
+        return decimal
+        
+    except Exception as e:
+        logger.error("Erro na conversão para site %s: %s - %s", site_id, dms_str, str(e))
+        return None
+
+
+# Forma usual de DMS (ex: 23.32.33.S ou 23,32,33,5 W), uma coordenada por linha; a
+# segunda alternativa casa qualquer outra linha, que segue para dms_to_decimal
+_DMS_BULK_PATTERN = re.compile(
+    r'^[ \t]*(\d+)[.,](\d+)(?:[.,](\d+)(?:[.,](\d+))?)?[.,]*[ \t]*([NSEWnsew]?)[ \t]*$|^.*$',
+    re.MULTILINE
+)
+# Fração de sites já consultados a partir da qual o restante é convertido em lote
+LOCALIDADES_BULK_FRACTION = 0.25
+_localidades_cache = {}  # (caminho, mtime, tamanho) -> LocalidadesIndex
+
+
+def dms_to_decimal_bulk(values, coord_type):
+    """
+    Converte em lote uma sequência de coordenadas DMS
+    
+    Uma única regex percorre todas as coordenadas e a aritmética é feita com
+    NumPy; valores fora da forma usual passam por dms_to_decimal (mesmo
+    resultado e mesmos logs).
+    
+    Args:
+        values (list): Pares (site_id, coordenada DMS)
+        coord_type (str): 'lat' ou 'lon'
+        
+    Returns:
+        list: Valores decimais (None onde a conversão falhar)
+    """
+    coords = [dms_str for _, dms_str in values]
+    matches = _DMS_BULK_PATTERN.findall('\n'.join(coords))
+    if any('\n' in dms_str for dms_str in coords) or len(matches) != len(coords):
+        return [dms_to_decimal(dms_str, coord_type, site_id) for site_id, dms_str in values]
+    
+    count = len(matches)
+    default_sign = -1.0 if coord_type in ('lat', 'lon') else 1.0
+    signs = {'': default_sign, 'S': -1.0, 'W': -1.0, 's': -1.0, 'w': -1.0}
+    graus = np.fromiter((float(m[0] or 0) for m in matches), np.float64, count)
+    minutos = np.fromiter((float(m[1] or 0) for m in matches), np.float64, count)
+    segundos = np.fromiter((float(f"{m[2]}.{m[3]}" if m[3] else m[2] or 0) for m in matches), np.float64, count)
+    sinal = np.fromiter((signs.get(m[4], 1.0) for m in matches), np.float64, count)
+    decimal = (graus + minutos / 60 + segundos / 3600) * sinal
+    
+    result = decimal.tolist()
+    for i, match in enumerate(matches):
+        if not match[0]:  # Fora da forma usual
+            result[i] = dms_to_decimal(values[i][1], coord_type, values[i][0])
+    return result
+
+
+class LocalidadesIndex:
+    """
+    Índice de localidades.csv com conversão de coordenadas sob demanda
+    
+    A carga guarda apenas as linhas brutas por siteid. A conversão DMS é feita
+    na primeira consulta de cada site e memorizada; quando uma fração
+    relevante dos sites já foi consultada, o restante é convertido em lote.
+    O índice é compartilhado entre geradores do mesmo processo.
+    """
+    __slots__ = ('raw', 'converted', 'grid')
+
+    def __init__(self):
+        self.raw = {}  # siteid -> [(regiao, latitude, longitude, localidade), ...] na ordem do arquivo
+        self.converted = {}  # siteid -> {regiao, latitude, longitude, localidade} ou None (inválido)
+        self.grid = None  # SiteGrid montado na primeira consulta espacial
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __contains__(self, site_id):
+        return self.get(site_id) is not None
+
+    def __getitem__(self, site_id):
+        loc_data = self.get(site_id)
+        if loc_data is None:
+            raise KeyError(site_id)
+        return loc_data
+
+    def get(self, site_id, default=None):
+        """Retorna {regiao, latitude, longitude, localidade} do site, convertendo na primeira consulta"""
+        try:
+            loc_data = self.converted[site_id]
+        except KeyError:
+            rows = self.raw.get(site_id)
+            if rows is None:
+                return default
+            if len(self.converted) >= LOCALIDADES_BULK_FRACTION * len(self.raw):
+                self.convert_all()
+                loc_data = self.converted[site_id]
+            else:
+                loc_data = self.converted[site_id] = self._convert(site_id, rows)
+        return default if loc_data is None else loc_data
+
+    def _convert(self, site_id, rows):
+        """Converte as linhas de um site (a última linha válida prevalece)"""
+        loc_data = None
+        for regiao, lat_str, lon_str, localidade in rows:
+            lat_decimal = dms_to_decimal(lat_str, 'lat', site_id)
+            lon_decimal = dms_to_decimal(lon_str, 'lon', site_id)
+            if None not in [lat_decimal, lon_decimal]:
+                loc_data = {'regiao': regiao, 'latitude': lat_decimal, 'longitude': lon_decimal,
+                            'localidade': localidade}
+        return loc_data
+
+    def convert_all(self):
+        """Converte em lote todos os sites ainda não consultados"""
+        pending = [(site_id, row) for site_id, rows in self.raw.items()
+                   if site_id not in self.converted for row in rows]
+        if not pending:
+            return
+        lats = dms_to_decimal_bulk([(site_id, row[1]) for site_id, row in pending], 'lat')
+        lons = dms_to_decimal_bulk([(site_id, row[2]) for site_id, row in pending], 'lon')
+        converted = {}
+        for (site_id, row), lat_decimal, lon_decimal in zip(pending, lats, lons):
+            if lat_decimal is None or lon_decimal is None:
+                converted.setdefault(site_id, None)
+            else:
+                converted[site_id] = {'regiao': row[0], 'latitude': lat_decimal, 'longitude': lon_decimal,
+                                      'localidade': row[3]}
+        self.converted.update(converted)
+        logger.debug("Localidades convertidas em lote: %d sites", len(converted))
+
+    def spatial_index(self):
+        """Retorna (montando na primeira chamada) o SiteGrid com as coordenadas de todos os sites"""
+        if self.grid is None:
+            self.convert_all()
+            self.grid = SiteGrid({
+                site_id: (loc_data['latitude'], loc_data['longitude'])
+                for site_id, loc_data in self.converted.items() if loc_data is not None
+            })
+            logger.debug("Índice espacial de localidades: %d sites em %d células",
+                        len(self.grid.site_ids), len(self.grid.cells))
+        return self.grid
+
+
+SITE_GRID_CELL_DEGREES = 0.5
+EARTH_RADIUS_KM = 6371.0
+
+
+class SiteGrid:
+    """
+    Índice espacial em grade regular sobre as coordenadas dos sites
+    
+    Cada célula de SITE_GRID_CELL_DEGREES graus guarda as posições dos sites
+    que caem nela. Uma consulta visita só as células que cruzam a área pedida,
+    então o custo acompanha o tamanho da área e não o total de sites.
+    """
+    __slots__ = ('cell', 'site_ids', 'lats', 'lons', 'cells')
+
+    def __init__(self, coordinates, cell=SITE_GRID_CELL_DEGREES):
+        """
+        Args:
+            coordinates (dict): siteid -> (latitude, longitude) em graus decimais
+            cell (float): Tamanho da célula em graus
+        """
+        self.cell = cell
+        self.site_ids = list(coordinates)
+        count = len(self.site_ids)
+        self.lats = np.fromiter((coord[0] for coord in coordinates.values()), np.float64, count)
+        self.lons = np.fromiter((coord[1] for coord in coordinates.values()), np.float64, count)
+        cells = defaultdict(list)
+        rows = np.floor(self.lats / cell).astype(np.int64).tolist()
+        cols = np.floor(self.lons / cell).astype(np.int64).tolist()
+        for position, key in enumerate(zip(rows, cols)):
+            cells[key].append(position)
+        self.cells = {key: np.array(positions, dtype=np.int64) for key, positions in cells.items()}
+
+    def _candidates(self, lat_min, lon_min, lat_max, lon_max):
+        """Posições dos sites nas células que cruzam o retângulo"""
+        row_min, row_max = math.floor(lat_min / self.cell), math.floor(lat_max / self.cell)
+        col_min, col_max = math.floor(lon_min / self.cell), math.floor(lon_max / self.cell)
+        if (row_max - row_min + 1) * (col_max - col_min + 1) <= len(self.cells):
+            keys = ((row, col) for row in range(row_min, row_max + 1)
+                    for col in range(col_min, col_max + 1))
+            chunks = [self.cells[key] for key in keys if key in self.cells]
+        else:  # Retângulo maior que a área ocupada: percorrer só as células existentes
+            chunks = [positions for (row, col), positions in self.cells.items()
+                      if row_min <= row <= row_max and col_min <= col <= col_max]
+        return np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64)
+
+    def query_bbox(self, lat_min, lon_min, lat_max, lon_max):
+        """Siteids dentro do retângulo (limites inclusos)"""
+        candidates = self._candidates(lat_min, lon_min, lat_max, lon_max)
+        lats, lons = self.lats[candidates], self.lons[candidates]
+        inside = (lats >= lat_min) & (lats <= lat_max) & (lons >= lon_min) & (lons <= lon_max)
+        return [self.site_ids[position] for position in candidates[inside].tolist()]
+
+    def query_radius(self, lat, lon, radius_km):
+        """Siteids a até radius_km do ponto (distância de haversine)"""
+        lat_min, lon_min, lat_max, lon_max = radius_extent(lat, lon, radius_km)
+        candidates = self._candidates(lat_min, lon_min, lat_max, lon_max)
+        lat1, lon1 = math.radians(lat), math.radians(lon)
+        lat2, lon2 = np.radians(self.lats[candidates]), np.radians(self.lons[candidates])
+        a = (np.sin((lat2 - lat1) / 2) ** 2
+             + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+        distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        return [self.site_ids[position] for position in candidates[distance <= radius_km].tolist()]
+
+
+def radius_extent(lat, lon, radius_km):
+    """Retângulo lat/lon (lat_min, lon_min, lat_max, lon_max) que contém o círculo"""
+    angle = radius_km / EARTH_RADIUS_KM
+    delta_lat = math.degrees(angle)
+    if abs(lat) + delta_lat >= 90.0:  # Círculo alcança o polo: todas as longitudes
+        return (max(lat - delta_lat, -90.0), -180.0, min(lat + delta_lat, 90.0), 180.0)
+    # Maior afastamento em longitude ao longo do círculo (não só na latitude do centro)
+    delta_lon = math.degrees(math.asin(min(math.sin(angle) / math.cos(math.radians(lat)), 1.0)))
+    return (max(lat - delta_lat, -90.0), max(lon - delta_lon, -180.0),
+            min(lat + delta_lat, 90.0), min(lon + delta_lon, 180.0))
+
+
+class GeoCrop:
+    """
+    Recorte geográfico (--crop / GEOGRAPHIC_LAYOUT.crop)
+    
+    Formatos aceitos (graus decimais, negativos para S/W):
+        lat_min,lon_min,lat_max,lon_max  -> retângulo
+        lat,lon,raio_km                  -> raio em torno de um ponto
+        SITEID,raio_km                   -> raio em torno de um site do localidades.csv
+    """
+    __slots__ = ('lat_min', 'lon_min', 'lat_max', 'lon_max', 'center', 'radius_km', 'text')
+
+    def __init__(self, lat_min, lon_min, lat_max, lon_max, center=None, radius_km=None, text=''):
+        self.lat_min, self.lon_min = lat_min, lon_min
+        self.lat_max, self.lon_max = lat_max, lon_max
+        self.center = center
+        self.radius_km = radius_km
+        self.text = text
+
+    @classmethod
+    def parse(cls, value, localidades=None):
+        """
+        Interpreta o recorte da linha de comando (texto) ou do config.json (lista)
+        
+        Args:
+            value (str | list): Recorte em um dos formatos aceitos
+            localidades (LocalidadesIndex): Necessário para o formato SITEID,raio_km
+            
+        Returns:
+            GeoCrop: Recorte interpretado
+            
+        Raises:
+            ValueError: Se o recorte for inválido
+        """
+        parts = value.split(',') if isinstance(value, str) else list(value)
+        parts = [str(part).strip() for part in parts]
+        text = ','.join(parts)
+        try:
+            if len(parts) == 2:
+                loc_data = localidades.get(parts[0]) if localidades else None
+                if loc_data is None:
+                    raise ValueError(f"Site do recorte sem coordenadas no localidades.csv: '{parts[0]}'")
+                return cls.around(loc_data['latitude'], loc_data['longitude'], float(parts[1]), text)
+            numbers = [float(part) for part in parts]
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Recorte geográfico inválido '{text}': {e}") from None
+        if len(numbers) == 3:
+            return cls.around(numbers[0], numbers[1], numbers[2], text)
+        if len(numbers) == 4:
+            lat_min, lon_min, lat_max, lon_max = numbers
+            if lat_min >= lat_max or lon_min >= lon_max:
+                raise ValueError(f"Recorte geográfico vazio '{text}' (use lat_min,lon_min,lat_max,lon_max)")
+            return cls(lat_min, lon_min, lat_max, lon_max, text=text)
+        raise ValueError(f"Recorte geográfico inválido '{text}' (use 4 números, 3 números ou SITEID,raio_km)")
+
+    @classmethod
+    def around(cls, lat, lon, radius_km, text=''):
+        """Recorte circular de radius_km em torno de (lat, lon)"""
+        if radius_km <= 0:
+            raise ValueError(f"Raio do recorte deve ser positivo: {radius_km}")
+        return cls(*radius_extent(lat, lon, radius_km), center=(lat, lon), radius_km=radius_km, text=text)
+
+    def select(self, grid):
+        """Siteids dentro do recorte, consultando o SiteGrid"""
+        if self.center is not None:
+            return set(grid.query_radius(self.center[0], self.center[1], self.radius_km))
+        return set(grid.query_bbox(self.lat_min, self.lon_min, self.lat_max, self.lon_max))
+
+
+def load_localidades(localidades_file):
+    """
+    Carrega localidades.csv como índice bruto (sem conversão de coordenadas)
+    
+    O resultado fica em cache por (caminho, mtime, tamanho), de modo que
+    geradores do mesmo processo compartilham o índice e as conversões já feitas.
+    
+    Args:
+        localidades_file (str): Caminho do arquivo de localidades
+        
+    Returns:
+        LocalidadesIndex: Índice siteid -> dados da localidade
+    """
+    stat = os.stat(localidades_file)
+    cache_key = (os.path.abspath(localidades_file), stat.st_mtime_ns, stat.st_size)
+    index = _localidades_cache.get(cache_key)
+    if index is not None:
+        logger.info("Localidades reaproveitadas do cache: %d sites", len(index))
+        return index
+    
+    encoding = detect_encoding(localidades_file)
+    with open(localidades_file, 'r', encoding=encoding, errors='replace') as f:
+        reader = csv.DictReader(f, delimiter=';')
+        index = build_localidades_index((reader.line_num, row) for row in reader)
+    
+    _localidades_cache[cache_key] = index
+    return index
+
+
+def build_localidades_index(numbered_rows):
+    """
+    Monta o índice de localidades a partir de linhas já lidas
+    
+    Args:
+        numbered_rows (iterable): Pares (número da linha, dicionário com as colunas do localidades.csv)
+        
+    Returns:
+        LocalidadesIndex: Índice siteid -> dados da localidade
+    """
+    index = LocalidadesIndex()
+    incomplete_count = 0
+    for line_num, row in numbered_rows:
+        site_id = (row.get('siteid') or '').strip()
+        localidade = (row.get('Localidade') or '').strip()
+        regiao = (row.get('RegiaoGeografica') or '').strip()
+        lat_str = (row.get('Latitude') or '').strip()
+        lon_str = (row.get('Longitude') or '').strip()
+        
+        if not site_id:
+            site_id = f"Linha {line_num}"
+        
+        # Validar dados obrigatórios
+        if not all([localidade, regiao, lat_str, lon_str]):
+            logger.warning("Dados incompletos para site %s", site_id)
+            incomplete_count += 1
+            continue
+        
+        index.raw.setdefault(site_id, []).append((sys.intern(regiao), lat_str, lon_str, sys.intern(localidade)))
+    
+    logger.info("Índice de localidades carregado: %d sites, %d incompletos", len(index), incomplete_count)
+    return index
+
+
+def normalize_record(record):
+    """Registro em memória (API) com valores em texto, como uma linha do csv.DictReader"""
+    return {key: '' if value is None else str(value) for key, value in record.items()}
+
+
+def record_rows(records):
+    """
+    Converte registros em memória nas linhas de um csv.reader
+    
+    As chaves do primeiro registro fazem o papel do cabeçalho; chaves ausentes
+    nos demais registros viram colunas vazias.
+    
+    Args:
+        records (iterable): Dicionários com as colunas do CSV
+        
+    Yields:
+        list: Cabeçalho e, em seguida, os valores de cada registro
+    """
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return
+    header = list(first)
+    yield header
+    for record in chain((first,), records):
+        yield ['' if record.get(key) is None else str(record.get(key)) for key in header]
+
+
+_elementos_cache = {}  # (caminho, mtime, tamanho, encoding) -> ElementosIndex
+
+
+def line_encoding(encoding):
+    """
+    Encoding para decodificar linhas isoladas de um arquivo lido em modo binário
+    
+    O utf-8-sig (encoding de todo arquivo UTF-8/ASCII em detect_encoding) só
+    difere do utf-8 pelo BOM, que fica no cabeçalho.
+    
+    Returns:
+        str | None: Encoding das linhas, ou None se ';' não for o byte ASCII
+        (ex: UTF-16) e o arquivo não puder ser lido por offsets de linha
+    """
+    base = 'utf-8' if codecs.lookup(encoding).name == 'utf-8-sig' else encoding
+    return base if ';'.encode(base) == b';' else None
+
+
+class ElementosIndex:
+    """
+    Índice leve do elementos.csv: nome do elemento -> offsets das linhas
+    
+    Apenas a coluna 'elemento' é lida na construção. As linhas completas são
+    relidas sob demanda (read_rows) para os nós realmente referenciados.
+    """
+    __slots__ = ('path', 'encoding', 'header', 'offsets', 'row_count')
+
+    def __init__(self, path, encoding, header):
+        self.path = path
+        self.encoding = encoding
+        self.header = header
+        self.offsets = {}  # nome -> [offset, ...] na ordem do arquivo
+        self.row_count = 0
+
+    def __contains__(self, name):
+        return name in self.offsets
+
+    def first_offset(self, name):
+        """Offset da primeira linha do elemento (ordem original do arquivo)"""
+        return self.offsets[name][0]
+
+    def read_rows(self, handle, name):
+        """Relê as linhas do elemento como dicionários (mesmo formato do DictReader)"""
+        header = self.header
+        for offset in self.offsets[name]:
+            handle.seek(offset)
+            line = handle.readline().decode(self.encoding, errors='replace')
+            values = next(csv.reader([line], delimiter=';'), [])
+            if len(values) < len(header):
+                values.extend([''] * (len(header) - len(values)))
+            yield dict(zip(header, values))
+
+    @classmethod
+    def build(cls, path, encoding):
+        """
+        Constrói o índice lendo o arquivo em modo binário
+        
+        O cabeçalho é decodificado com o encoding detectado (sem o BOM) e as
+        demais linhas com line_encoding.
+        
+        Returns:
+            ElementosIndex | None: None se o arquivo não puder ser indexado por
+            linha (encoding não compatível com ASCII ou campo entre aspas com
+            quebra de linha); nesse caso a leitura completa é usada.
+        """
+        rows_encoding = line_encoding(encoding)
+        if rows_encoding is None:
+            return None
+        
+        with open(path, 'rb') as f:
+            header_line = f.readline()
+            header = next(csv.reader([header_line.decode(encoding, errors='replace')], delimiter=';'), [])
+            if 'elemento' not in header:
+                return None
+            encoding = rows_encoding
+            index = cls(path, encoding, header)
+            column = header.index('elemento')
+            offsets = index.offsets
+            position = len(header_line)
+            
+            for line in f:
+                offset = position
+                position += len(line)
+                if not line.strip():
+                    continue  # Linhas em branco (mesmo comportamento do DictReader)
+                index.row_count += 1
+                if b'"' in line:
+                    if line.count(b'"') % 2:
+                        return None  # Campo com quebra de linha: não indexável por linha
+                    fields = next(csv.reader([line.decode(encoding, errors='replace')], delimiter=';'), [])
+                    name = fields[column] if column < len(fields) else ''
+                else:
+                    fields = line.split(b';', column + 1)
+                    name = fields[column].decode(encoding, errors='replace') if column < len(fields) else ''
+                name = name.strip()
+                if name:
+                    offsets.setdefault(name, []).append(offset)
+        return index
+
+
+def load_elementos_index(elementos_file, encoding):
+    """
+    Retorna o índice do elementos.csv, reaproveitando-o entre arquivos de um lote
+    
+    Args:
+        elementos_file (str): Caminho do arquivo de elementos
+        encoding (str): Encoding detectado
+        
+    Returns:
+        ElementosIndex | None: Índice ou None se o arquivo não for indexável
+    """
+    stat = os.stat(elementos_file)
+    cache_key = (os.path.abspath(elementos_file), stat.st_mtime_ns, stat.st_size, encoding)
+    if cache_key in _elementos_cache:
+        return _elementos_cache[cache_key]
+    index = ElementosIndex.build(elementos_file, encoding)
+    _elementos_cache[cache_key] = index
+    return index
+
+
+
+def parse_style(style):
+    """
+    Converte um estilo do draw.io ("chave=valor;...") em dicionário ordenado
+    
+    Itens sem "=" (ex: "text", "ellipse") são mantidos com valor None.
+    """
+    items = {}
+    for part in style.split(';'):
+        if part:
+            key, sep, value = part.partition('=')
+            items[key] = value if sep else None
+    return items
+
+
+def merge_style(current, generated):
+    """
+    Estilo de uma célula existente atualizado com o estilo gerado
+    
+    As chaves definidas pelo gerador recebem o valor novo; chaves acrescentadas
+    à mão no draw.io (edgeStyle, rotation, waypoints...) são preservadas.
+    Se nenhum valor muda, o texto original é devolvido como está. Os pares
+    de estilos se repetem em quase todas as células, então o resultado fica
+    em cache.
+    
+    Args:
+        current (str): Estilo lido do arquivo
+        generated (str): Estilo calculado a partir dos CSVs (já escapado para XML)
+        
+    Returns:
+        str: Estilo combinado (sem escape XML)
+    """
+    cache_key = (current, generated)
+    merged = _merged_style_cache.get(cache_key)
+    if merged is not None:
+        return merged
+    items = parse_style(current)
+    updates = parse_style(unescape(generated))
+    if all(key in items and items[key] == value for key, value in updates.items()):
+        merged = current
+    else:
+        items.update(updates)
+        merged = ';'.join(key if value is None else f"{key}={value}" for key, value in items.items())
+    if len(_merged_style_cache) >= MERGED_STYLE_CACHE_SIZE:
+        _merged_style_cache.clear()
+    _merged_style_cache[cache_key] = merged
+    return merged
+
+
+def xml_text(text):
+    """Escapa texto entre tags (apenas &, < e >; espaços e quebras de linha ficam como estão)"""
+    if not text or _xml_text_search(text) is None:
+        return text or ''
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def xml_start_tag(elem):
+    """Tag de abertura de um elemento lido pelo iterparse, com os atributos escapados"""
+    attrs = ''.join(f' {key}="{xml_escape(value)}"' for key, value in elem.attrib.items())
+    return f'<{elem.tag}{attrs}>'
+
+
+def xml_element(elem):
+    """
+    Serializa um elemento lido do arquivo com os filhos e o texto interno
+    
+    Equivalente a ET.tostring para os elementos do draw.io (sem namespaces),
+    sem o custo de resolução de namespaces por elemento.
+    """
+    attrs = ''.join(f' {key}="{xml_escape(value)}"' for key, value in elem.attrib.items())
+    if not len(elem) and not elem.text:
+        return f'<{elem.tag}{attrs}/>'
+    children = ''.join(xml_element(child) + xml_text(child.tail) for child in elem)
+    return f'<{elem.tag}{attrs}>{xml_text(elem.text)}{children}</{elem.tag}>'
+
+
+def xml_cell(elem):
+    """Linha XML de uma célula lida do arquivo (sem o texto que a segue)"""
+    return f'        {xml_element(elem)}\n'
+
+
+def inflate_diagram(text):
+    """
+    Decodifica uma página comprimida pelo draw.io (base64 + deflate + URL encode)
+    
+    Args:
+        text (str): Conteúdo do elemento <diagram>
+        
+    Returns:
+        ET.Element: Elemento mxGraphModel
+    """
+    data = zlib.decompress(base64.b64decode(text), -15)
+    return ET.fromstring(unquote(data.decode('utf-8')))
+
+
+def deflate_diagram(page):
+    """
+    Comprime uma página gerada no formato do draw.io (URL encode + deflate + base64)
+    
+    Args:
+        page (str): Página completa, de <diagram ...> a </diagram>
+        
+    Returns:
+        str: A mesma página com o mxGraphModel comprimido (inverso de inflate_diagram)
+    """
+    start = page.index('<mxGraphModel')
+    end = page.rindex('</diagram>')
+    model = page[start:end].rstrip()
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    data = compressor.compress(quote(model, safe="~()*!.'").encode('ascii')) + compressor.flush()
+    return page[:start].rstrip() + base64.b64encode(data).decode('ascii') + '</diagram>'
+
+
+class EdgeSlots:
+    """
+    Curvas desenhadas por conexão, para casar as células de um arquivo existente
+
+    A conexão na posição pos de TopologyGenerator.connections ocupa copies[pos]
+    curvas (conn.count, ou uma só com -o a), numeradas a partir de offset[pos].
+    Os ids das curvas dependem do par (origem, destino) e do ordinal dentro do
+    par, de modo que a busca percorre apenas as conexões do mesmo par, achadas
+    por busca binária nas chaves ordenadas.
+    """
+    __slots__ = ('copies', 'offset', 'slot_count', 'base', 'order', 'sorted_keys',
+                 'pair_rank', 'pair_count')
+
+    def __init__(self, adjacency, collapse=False):
+        weight = adjacency.weight.astype(np.int64)
+        self.copies = np.ones_like(weight) if collapse else weight
+        self.offset = np.cumsum(self.copies) - self.copies
+        self.slot_count = int(self.copies.sum())
+        self.base = max(adjacency.node_count, 1)
+        keys = adjacency.src.astype(np.int64) * self.base + adjacency.dst
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+        self.pair_rank = adjacency.pair_rank
+        self.pair_count = np.ones_like(adjacency.pair_count) if collapse else adjacency.pair_count
+
+    def find(self, origem, destino, cell_id):
+        """
+        Localiza a curva de origem -> destino com o id informado
+        
+        Args:
+            origem (NodeRecord): Nó de origem da célula
+            destino (NodeRecord): Nó de destino da célula
+            cell_id (str): Id da célula no arquivo
+            
+        Returns:
+            tuple | None: (posição da conexão, índice da curva) ou None
+        """
+        key = origem.idx * self.base + destino.idx
+        lo = np.searchsorted(self.sorted_keys, key, 'left')
+        hi = np.searchsorted(self.sorted_keys, key, 'right')
+        for pos in self.order[lo:hi].tolist():
+            rank = int(self.pair_rank[pos])
+            for copy_index in range(int(self.copies[pos])):
+                if stable_id(f"{origem.cell_id}{destino.cell_id}{rank + copy_index}") == cell_id:
+                    return pos, copy_index
+        return None
+
+
+class DrawioPagePatcher:
+    """
+    Atualiza, célula a célula, uma página de um .drawio existente (--update)
+
+    As células chegam na ordem do arquivo e são casadas com nós e conexões
+    pelo id estável. Só são tocadas as células das camadas criadas pelo gerador
+    (objeto de camada cujo id é o stable_id do nome): nelas, nós e conexões que
+    sumiram dos CSVs (ou cuja camada deixou a página) são removidos e os demais
+    recebem rótulo, estilo e camada atuais, mantendo a geometria do arquivo.
+    Camadas próprias do usuário, legenda e fundo passam sem alteração. Ao final,
+    finish() devolve as camadas, nós e conexões que ainda não existiam.
+    """
+
+    def __init__(self, generator, page_def, cell_nodes, edge_slots, scale_factor=1.0):
+        self.generator = generator
+        self.cell_nodes = cell_nodes
+        self.edge_slots = edge_slots
+        self.scale_factor = scale_factor
+        self.visible_layers = generator._expand_visible_layers(page_def)
+        self.layer_by_id = {generator.layer_ids[layer]: layer for layer in self.visible_layers
+                            if layer in generator.layer_ids}
+        self.pending_layers = dict(self.layer_by_id)  # Camadas ainda não vistas no arquivo
+        self.managed_layers = set()
+        self.layers_flushed = False
+        self.seen_nodes = set()
+        self.centers = {}  # Índice do nó -> centro (x, y) no arquivo
+        self.seen_slots = np.zeros(edge_slots.slot_count, dtype=bool)
+        self.visible_connections = np.fromiter(
+            (conn.camada in self.visible_layers for conn in generator.connections),
+            dtype=bool, count=len(generator.connections))
+        self.connection_styles = {}  # (camada, estilo) -> estilo gerado
+        self.kept = self.updated = self.removed = self.added = 0
+
+    def _connection_style(self, conn):
+        """Estilo gerado para a conexão, compartilhado pelas conexões de mesma camada e estilo"""
+        key = (conn.camada, conn.estilo)
+        style = self.connection_styles.get(key)
+        if style is None:
+            style = self.generator._get_connection_style(conn, self.scale_factor)
+            self.connection_styles[key] = style
+        return style
+
+    def cell(self, elem):
+        """
+        Processa uma célula (filho de <root>) lida do arquivo
+        
+        Args:
+            elem (ET.Element): <mxCell> ou <object>/<UserObject> com o mxCell dentro
+            
+        Returns:
+            str: XML a escrever no lugar da célula ('' para removê-la)
+        """
+        inner = elem if elem.tag == 'mxCell' else elem.find('mxCell')
+        parent = inner.get('parent') if inner is not None else None
+        if parent is None:
+            return xml_cell(elem)
+        if parent == '0':
+            return self._layer(elem, inner)
+
+        if parent not in self.managed_layers and parent not in self.layer_by_id:
+            return xml_cell(elem)
+        # Camadas que faltam no arquivo entram antes da primeira célula do gerador
+        prefix = self._flush_layers()
+        if inner.get('edge') == '1':
+            return prefix + self._edge(elem, inner)
+        if inner.get('vertex') == '1':
+            return prefix + self._node(elem, inner)
+        return prefix + xml_cell(elem)
+
+    def _layer(self, elem, inner):
+        """Objeto de camada: registra as camadas criadas pelo gerador"""
+        cell_id = elem.get('id')
+        label = elem.get('value' if elem is inner else 'label')
+        if not label or label == 'LEGENDA' or cell_id != stable_id(f"camada\x1f{label}"):
+            return xml_cell(elem)
+        if cell_id in self.managed_layers:
+            self.removed += 1  # Camada repetida
+            return ''
+        self.managed_layers.add(cell_id)
+        self.pending_layers.pop(cell_id, None)
+        return xml_cell(elem)
+
+    def _flush_layers(self):
+        """XML das camadas visíveis que ainda não existem no arquivo"""
+        if self.layers_flushed:
+            return ''
+        self.layers_flushed = True
+        lines = []
+        for cell_id, layer in sorted(self.pending_layers.items(), key=itemgetter(1)):
+            lines.extend(self.generator._layer_cell(layer))
+            self.managed_layers.add(cell_id)
+            self.added += 1
+        self.pending_layers.clear()
+        return ''.join(line + '\n' for line in lines)
+
+    def _set(self, elem, key, value):
+        """Atribui value a elem[key]; retorna True se o valor mudou"""
+        if elem.get(key) == value:
+            return False
+        elem.set(key, value)
+        return True
+
+    def _count(self, changed):
+        if changed:
+            self.updated += 1
+        else:
+            self.kept += 1
+
+    def _node(self, elem, inner):
+        """Vértice de nó: atualiza rótulo, estilo e camada e guarda o centro"""
+        generator = self.generator
+        data = self.cell_nodes.get(elem.get('id'))
+        if data is None or data.camada not in self.visible_layers or data.idx in self.seen_nodes:
+            self.removed += 1
+            return ''
+        self.seen_nodes.add(data.idx)
+
+        center = (0.0, 0.0)
+        geometry = inner.find('mxGeometry')
+        if geometry is not None:
+            try:
+                center = (float(geometry.get('x', 0)) + float(geometry.get('width', 0)) / 2,
+                          float(geometry.get('y', 0)) + float(geometry.get('height', 0)) / 2)
+            except ValueError:
+                pass
+        self.centers[data.idx] = center
+
+        label = '' if generator.hide_node_names else (data.apelido or data.nome)
+        style = generator._get_node_style(data, self.scale_factor)["style"]
+        changed = self._set(elem, 'value' if elem is inner else 'label', label)
+        changed |= self._set(inner, 'style', merge_style(inner.get('style', ''), style))
+        changed |= self._set(inner, 'parent', generator.layer_ids[data.camada])
+        self._count(changed)
+        return xml_cell(elem)
+
+    def _edge(self, elem, inner):
+        """Curva de conexão: atualiza rótulo, estilo e camada mantendo os pontos de controle"""
+        generator = self.generator
+        origem = self.cell_nodes.get(inner.get('source'))
+        destino = self.cell_nodes.get(inner.get('target'))
+        found = None
+        if origem is not None and destino is not None:
+            found = self.edge_slots.find(origem, destino, elem.get('id'))
+        if found is None:
+            self.removed += 1
+            return ''
+        pos, copy_index = found
+        slot = self.edge_slots.offset[pos] + copy_index
+        if self.seen_slots[slot] or not self.visible_connections[pos]:
+            self.removed += 1
+            return ''
+        self.seen_slots[slot] = True
+
+        conn = generator.connections[pos]
+        style = self._connection_style(conn)
+        if self.edge_slots.pair_count[pos] > 1:
+            style += ";curved=1"
+        label = conn.texto_conexao if copy_index == 0 else ''
+        changed = self._set(elem, 'value' if elem is inner else 'label', label)
+        changed |= self._set(inner, 'style', merge_style(inner.get('style', ''), style))
+        changed |= self._set(inner, 'parent', generator.layer_ids[conn.camada])
+        self._count(changed)
+        return xml_cell(elem)
+
+    def finish(self):
+        """
+        XML das células que não existiam no arquivo
+        
+        Nós novos são posicionados em torno do baricentro dos vizinhos já
+        presentes (ângulo áureo entre nós sucessivos); sem vizinhos, entram
+        em fila abaixo do desenho. Conexões novas só são criadas quando as
+        duas pontas estão na página e vêm depois dos nós novos, para que
+        toda curva seja escrita após os vértices que ela liga.
+        
+        Returns:
+            str: XML das novas camadas, nós e conexões
+        """
+        generator = self.generator
+        lines = [self._flush_layers()]
+        centers = self.centers
+        node_list = generator.node_list
+        new_nodes = [data for data in node_list
+                     if data is not None and data.camada in self.visible_layers
+                     and data.idx not in self.seen_nodes]
+
+        if centers:
+            row_x = min(x for x, _ in centers.values())
+            row_y = max(y for _, y in centers.values()) + UPDATE_ROW_SPACING * self.scale_factor
+        else:
+            row_x = row_y = 0.0
+        radius = UPDATE_NEIGHBOR_RADIUS * self.scale_factor
+        for k, data in enumerate(new_nodes):
+            placed = [centers[n] for n in generator.adjacency.neighbors(data.idx).tolist() if n in centers]
+            if placed:
+                angle = (k + 1) * GOLDEN_ANGLE
+                x = sum(p[0] for p in placed) / len(placed) + radius * math.cos(angle)
+                y = sum(p[1] for p in placed) / len(placed) + radius * math.sin(angle)
+            else:
+                x, y = row_x, row_y
+                row_x += UPDATE_ROW_SPACING * self.scale_factor
+            centers[data.idx] = (x, y)
+            lines.extend(line + '\n' for line in generator._node_cell(data, x, y, self.scale_factor))
+            self.added += 1
+
+        # Conexões com alguma curva ainda não vista no arquivo
+        slots = self.edge_slots
+        if slots.slot_count:
+            unseen = np.add.reduceat((~self.seen_slots).astype(np.int64), slots.offset) > 0
+            candidates = np.flatnonzero(unseen & self.visible_connections).tolist()
+        else:
+            candidates = []
+        for pos in candidates:
+            conn = generator.connections[pos]
+            if conn.origem not in centers or conn.destino not in centers:
+                continue
+            origem_id = node_list[conn.origem].cell_id
+            destino_id = node_list[conn.destino].cell_id
+            base_style = self._connection_style(conn)
+            rank = int(slots.pair_rank[pos])
+            total_conns = int(slots.pair_count[pos])
+            for copy_index in range(int(slots.copies[pos])):
+                if self.seen_slots[slots.offset[pos] + copy_index]:
+                    continue
+                lines.extend(line + '\n' for line in generator._edge_cell(
+                    conn, rank + copy_index, total_conns,
+                    conn.rotulo if copy_index == 0 else '', base_style,
+                    centers, origem_id, destino_id
+                ))
+                self.added += 1
+
+        return ''.join(lines)
+
+# =====================================================
+# LAYOUT ORGÂNICO POR COMPONENTES
+# =====================================================
+
+# Processos separados só com ORGANIC_LAYOUT.parallel_workers > 0 (desligado por padrão:
+# o spawn exige o guarda if __name__ == "__main__" no script de quem chama render_topology).
+# Cada worker reimporta numpy/networkx (~0.5-1s medido), então só vão para processos os
+# componentes com custo estimado (ORGANIC_PAIR_SECONDS x n² x iterações) acima deste
+ORGANIC_PARALLEL_MIN_SECONDS = 2.0
+ORGANIC_COMPONENT_SPACING = 150     # Largura máxima por nó dos componentes pequenos (px)
+ORGANIC_COMPONENT_GAP = 150         # Espaço entre os retângulos dos componentes (px)
+
+
+def organic_parameters(cfg, num_nodes):
+    """
+    Parâmetros do spring_layout para um grafo (ou componente) de num_nodes nós
+    
+    Args:
+        cfg (dict): Seção ORGANIC_LAYOUT do config
+        num_nodes (int): Quantidade de nós
+        
+    Returns:
+        tuple: (k, iterações, escala)
+    """
+    k_value = max(cfg.get("k_min", 0.8), min(cfg.get("k_max", 2.5),
+                                             cfg.get("k_base", 0.25) * math.sqrt(num_nodes)))
+    iterations_value = max(cfg.get("iterations_min", 500),
+                           min(cfg.get("iterations_max", 2000), num_nodes * cfg.get("iterations_per_node", 10)))
+    scale_value = max(cfg.get("scale_min", 5.0),
+                      min(cfg.get("scale_max", 30.0), num_nodes * cfg.get("scale_per_node", 0.5)))
+    return k_value, iterations_value, scale_value
+
+
+def spring_component(size, edges, k_value, iterations_value, scale_value):
+    """
+    spring_layout de um componente com nós 0..size-1 (executável em outro processo)
+    
+    O resultado só depende da quantidade de nós e do conjunto de arestas, não
+    da ordem em que as arestas são informadas.
+    
+    Returns:
+        np.ndarray: Posições (size x 2) na ordem dos nós
+    """
+    G = nx.Graph()
+    G.add_nodes_from(range(size))
+    G.add_edges_from(edges)
+    pos = nx.spring_layout(
+        G,
+        k=k_value,
+        iterations=iterations_value,
+        seed=42,
+        scale=scale_value,
+        threshold=0.0001
+    )
+    return np.array([pos[node] for node in range(size)], dtype=float)
+
+
+def component_fingerprint(size, edges, layers, params):
+    """Impressão digital de um componente: estrutura, camadas dos nós e parâmetros do layout"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([size, layers, params]).encode('utf-8'))
+    digest.update(np.asarray(edges, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def cache_component(fingerprint, positions):
+    """Guarda as posições de um componente no cache (se ativo)"""
+    if fingerprint is None or _component_cache is None:
+        return
+    if len(_component_cache) >= COMPONENT_CACHE_SIZE:
+        del _component_cache[next(iter(_component_cache))]  # Remove o mais antigo
+    _component_cache[fingerprint] = positions
+
+
+def pack_rectangles(sizes, gap, aspect=1.0):
+    """
+    Empacotamento em prateleiras: retângulos em ordem decrescente de altura,
+    preenchendo linhas com largura proporcional à raiz da área total
+    
+    Args:
+        sizes (list): (largura, altura) de cada retângulo
+        gap (float): Espaço entre retângulos
+        aspect (float): Proporção largura/altura desejada para o conjunto
+        
+    Returns:
+        list: (x, y) do canto superior esquerdo de cada retângulo, na ordem de sizes
+    """
+    if not sizes:
+        return []
+    area = sum((width + gap) * (height + gap) for width, height in sizes)
+    row_width = max(max(width for width, _ in sizes), math.sqrt(area * aspect))
+    offsets = [None] * len(sizes)
+    x = y = shelf_height = 0
+    for i in sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], i)):
+        width, height = sizes[i]
+        if x and x + width > row_width:
+            x, y, shelf_height = 0, y + shelf_height + gap, 0
+        offsets[i] = (x, y)
+        x += width + gap
+        shelf_height = max(shelf_height, height)
+    return offsets
+
+# =====================================================
+# PRÉ-VISUALIZAÇÃO (GUI)
+# =====================================================
+
+PREVIEW_SIZE = (480, 320)           # Pixels da miniatura
+PREVIEW_MAX_NODES = 400             # Acima disso, amostra estratificada por camada
+PREVIEW_MAX_EDGES = 4000            # Conexões desenhadas na miniatura
+PREVIEW_ORGANIC_ITERATIONS = 30     # Iterações do layout orgânico na miniatura
+PREVIEW_MARGIN = 12
+PREVIEW_NODE_RADIUS = 3
+PREVIEW_CACHE_SIZE = 32
+PREVIEW_DELAY_MS = 150              # Espera após a última alteração na GUI antes de atualizar
+PREVIEW_LAYOUTS = {"Circular": "circular", "Orgânico": "organico",
+                   "Geográfico": "geografico", "Hierárquico": "hierarquico"}
+PREVIEW_MAX_ROWS = 20000            # Acima disso, conexões lidas em blocos espaçados do arquivo
+PREVIEW_BLOCK_ROWS = 500            # Linhas consecutivas por bloco amostrado
+PREVIEW_ROWS_CACHE_SIZE = 4
+_preview_cache = {}  # entradas e opções -> (png, nós desenhados, nós totais)
+_preview_rows_cache = {}  # (caminho, mtime, tamanho) -> linhas amostradas
+
+
+def sample_conexoes_rows(conexoes_file, max_rows=PREVIEW_MAX_ROWS, block_rows=PREVIEW_BLOCK_ROWS):
+    """
+    Amostra de linhas de um arquivo de conexões grande, em blocos espaçados
+    
+    O custo não depende do tamanho do arquivo: são lidos max_rows/block_rows
+    blocos de block_rows linhas consecutivas a partir de offsets igualmente
+    espaçados (a linha parcial no início de cada bloco é descartada). A
+    amostra fica em cache pela assinatura do arquivo (mtime, tamanho), de
+    modo que mudanças de opção na GUI não releem o arquivo.
+    
+    Args:
+        conexoes_file (str): Arquivo de conexões
+        max_rows (int): Linhas a partir das quais o arquivo é amostrado
+        block_rows (int): Linhas consecutivas por bloco
+        
+    Returns:
+        list | None: Registros (dicionários com as colunas do cabeçalho) ou None
+        se o arquivo é pequeno ou não pode ser lido por offsets (ler inteiro)
+    """
+    key = (os.path.abspath(conexoes_file), file_signature(conexoes_file))
+    if key in _preview_rows_cache:
+        return _preview_rows_cache[key]
+    
+    rows = None
+    encoding = detect_encoding(conexoes_file)
+    rows_encoding = line_encoding(encoding)
+    if rows_encoding is not None and ExecutionPlanner.estimate_rows(conexoes_file) > max_rows:
+        size = os.path.getsize(conexoes_file)
+        blocks = max(1, max_rows // block_rows)
+        lines = []
+        with open(conexoes_file, 'rb') as f:
+            header_line = f.readline()
+            header = next(csv.reader([header_line.decode(encoding, errors='replace')], delimiter=';'), [])
+            start = f.tell()
+            for block in range(blocks):
+                f.seek(start + (size - start) * block // blocks)
+                if block:
+                    f.readline()  # Linha parcial
+                for _ in range(block_rows):
+                    line = f.readline()
+                    if not line:
+                        break
+                    lines.append(line.decode(rows_encoding, errors='replace'))
+        rows = [dict(zip(header, values)) for values in csv.reader(lines, delimiter=';') if values]
+        logger.info("Pré-visualização: %d linhas amostradas de %s", len(rows), conexoes_file)
+    
+    if len(_preview_rows_cache) >= PREVIEW_ROWS_CACHE_SIZE:
+        del _preview_rows_cache[next(iter(_preview_rows_cache))]  # Remove o mais antigo
+    _preview_rows_cache[key] = rows
+    return rows
+
 
-# Função para logar uso de memória
-def log_memory_usage(message=""):
-    """Registra uso de memória com mensagem opcional"""
-    if not PSUTIL_AVAILABLE:
-        return
+def stratified_sample(generator, budget, candidates=None):
+    """
+    Amostra estratificada dos nós: cada camada contribui na proporção do seu
+    tamanho (ao menos um nó), escolhendo os nós de maior grau
     
-    try:
-        process = psutil.Process(os.getpid())
-        mem = process.memory_info().rss / 1024 / 1024  # MB
-        logger.debug("🧠 %sUso de memória: %.2f MB", f"{message} - " if message else "", mem)
-    except Exception as e:
-        logger.error("Falha ao medir memória: %s", str(e))
+    Args:
+        generator (TopologyGenerator): Gerador com os dados já lidos
+        budget (int): Quantidade aproximada de nós da amostra
+        candidates (Collection): Índices entre os quais amostrar (padrão: todos os nós)
+        
+    Returns:
+        set: Índices dos nós mantidos
+    """
+    by_layer = defaultdict(list)
+    for data in generator.nodes.values():
+        if candidates is None or data.idx in candidates:
+            by_layer[data.camada].append(data.idx)
+    total = len(generator.nodes) if candidates is None else len(candidates)
+    degree = generator.adjacency.degree
+    keep = set()
+    for members in by_layer.values():
+        quota = max(1, round(len(members) * budget / total))
+        members.sort(key=lambda idx: -degree[idx])
+        keep.update(members[:quota])
+    if len(keep) > budget:  # Arredondamento e mínimo de um nó por camada
+        keep = set(sorted(keep, key=lambda idx: (-degree[idx], idx))[:budget])
+    return keep
 
-# Templates XML para geração do arquivo draw.io
-DRAWIO_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
-<mxfile host="app.diagrams.net" modified="{timestamp}" agent="Mozilla/5.0" etag="{etag}" version="21.3.7">
-"""
 
-DRAWIO_DIAGRAM_TEMPLATE = """  <diagram name="{page_name}" id="{diagram_id}">
-    <mxGraphModel dx="1422" dy="793" grid="0" gridSize="10" guides="1" tooltips="1" connect="1" arrows="1" fold="1" page="0" pageScale="1" pageWidth="1169" pageHeight="827" math="0" shadow="1">
-      <root>
-        <mxCell id="0"/>
-        <mxCell id="1" parent="0"/>
-"""
+def preview_colors(generator):
+    """Cor de preenchimento (RGB) de cada nó, pelo mesmo estilo usado no diagrama"""
+    colors = {}
+    by_style = {}
+    for data in generator.nodes.values():
+        key = (data.camada, data.cor)
+        rgb = by_style.get(key)
+        if rgb is None:
+            fill = parse_style(generator._get_node_style(data)["style"]).get("fillColor") or ''
+            try:
+                rgb = ImageColor.getrgb(fill)
+            except ValueError:
+                rgb = (128, 128, 128)
+            rgb = by_style[key] = rgb
+        colors[data.idx] = rgb
+    return colors
 
-DRAWIO_FOOTER = """
-</mxfile>
-"""
+
+def render_preview(conexoes_file, config, layout_type, elementos_file='elementos.csv',
+                   localidades_file='localidades.csv', size=PREVIEW_SIZE, **options):
+    """
+    Miniatura PNG de um layout, com orçamento reduzido para responder em menos de 1s
+    
+    A leitura é agregada (conexões paralelas viram uma) e, em arquivos com
+    mais de PREVIEW_MAX_ROWS linhas, limitada a uma amostra em blocos
+    (sample_conexoes_rows); grafos grandes são
+    reduzidos a uma amostra estratificada de PREVIEW_MAX_NODES nós, o layout
+    orgânico roda com PREVIEW_ORGANIC_ITERATIONS iterações e o geográfico sem
+    a prevenção de sobreposição. O resultado fica em cache por arquivos
+    (caminho, mtime, tamanho), config, layout e opções.
+    
+    Args:
+        conexoes_file (str): Arquivo de conexões
+        config (dict): Configuração carregada
+        layout_type (str): circular, organico, geografico ou hierarquico
+        elementos_file (str): Arquivo de elementos
+        localidades_file (str): Arquivo de localidades
+        size (tuple): Largura e altura da miniatura
+        **options: Opções do TopologyGenerator (include_orphans, regionalization, filter_string, ...)
+        
+    Returns:
+        tuple: (PNG em bytes, nós desenhados, nós da topologia lida; com
+        linhas amostradas, só os nós presentes na amostra)
+        
+    Raises:
+        ValueError: Falha na leitura ou nenhum nó a desenhar
+    """
+    key = (
+        tuple((os.path.abspath(path), file_signature(path)) if path else None
+              for path in (conexoes_file, elementos_file, localidades_file)),
+        json.dumps(config, sort_keys=True, default=str), layout_type, tuple(size),
+        tuple(sorted(options.items()))
+    )
+    cached = _preview_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    # Orçamento reduzido: poucas iterações no orgânico, sem ajuste de sobreposição no geográfico
+    preview_config = dict(config)
+    preview_config["ORGANIC_LAYOUT"] = dict(config.get("ORGANIC_LAYOUT", {}),
+                                            iterations_min=PREVIEW_ORGANIC_ITERATIONS,
+                                            iterations_max=PREVIEW_ORGANIC_ITERATIONS)
+    preview_config["GEOGRAPHIC_LAYOUT"] = dict(config.get("GEOGRAPHIC_LAYOUT", {}), overlap_iterations=0)
+    options = dict(options, aggregate_links=True)
+    
+    generator = TopologyGenerator(elementos_file, conexoes_file, preview_config,
+                                  localidades_file=localidades_file,
+                                  conexoes_records=sample_conexoes_rows(conexoes_file), **options)
+    if not generator.valid or not generator.read_elementos() or not generator.read_conexoes():
+        raise ValueError("Falha na leitura dos arquivos (ver log)")
+    if generator.filter_string and generator.ingest_filter is None:
+        generator.apply_filters()
+    total = len(generator.nodes)
+    if total > PREVIEW_MAX_NODES:
+        generator._restrict_nodes(stratified_sample(generator, PREVIEW_MAX_NODES))
+    positions = generator.calculate_positions(layout_type) if generator.nodes else {}
+    if not positions:
+        raise ValueError("Nenhum nó a desenhar")
+    
+    # Escalar posições para a miniatura mantendo a proporção
+    indices = list(positions)
+    xy = np.array([positions[idx] for idx in indices], dtype=np.float64)
+    low = xy.min(axis=0)
+    span = np.maximum(xy.max(axis=0) - low, 1.0)
+    width, height = size
+    scale = min((width - 2 * PREVIEW_MARGIN) / span[0], (height - 2 * PREVIEW_MARGIN) / span[1])
+    offset = (np.array([width, height]) - span * scale) / 2
+    pixels = dict(zip(indices, ((xy - low) * scale + offset).tolist()))
+    
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for origem, destino in generator.adjacency.unique_edges()[:PREVIEW_MAX_EDGES]:
+        if origem in pixels and destino in pixels:
+            draw.line((*pixels[origem], *pixels[destino]), fill=(190, 190, 190), width=1)
+    colors = preview_colors(generator)
+    r = PREVIEW_NODE_RADIUS
+    for idx, (x, y) in pixels.items():
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=colors.get(idx, (128, 128, 128)), outline=(60, 60, 60))
+    
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    result = (buffer.getvalue(), len(pixels), total)
+    if len(_preview_cache) >= PREVIEW_CACHE_SIZE:
+        del _preview_cache[next(iter(_preview_cache))]  # Remove o mais antigo
+    _preview_cache[key] = result
+    return result
 
 
 def run_gui():
@@ -287,11 +2330,21 @@ def run_gui():
             self.ignore_optional = tk.BooleanVar(value=False)
             self.hide_connection_layers = tk.BooleanVar(value=False)
             self.hide_node_names = tk.BooleanVar(value=False)
+            self.collapse_links = tk.BooleanVar(value=False)
+            self.aggregate_links = tk.BooleanVar(value=False)
+            self.site_view = tk.BooleanVar(value=False)
             
             # Inicialização das variáveis de filtro (CORREÇÃO ADICIONADA)
             self.filter_type = tk.StringVar(value="none")  # "none", "in", "rn", "ic", "rc"
             self.filter_value = tk.StringVar()
             
+            # Pré-visualização
+            self.preview_layout = tk.StringVar(value="Circular")
+            self.preview_image = None  # Referência ao PhotoImage exibido
+            self.preview_job = None  # Atualização agendada (after)
+            self.preview_thread = None  # Geração em andamento (thread de fundo)
+            self.preview_pending = None  # Parâmetros pedidos durante a geração em andamento
+            
             # Verificar disponibilidade de recursos
             self.has_elementos = os.path.exists("elementos.csv")
             self.has_localidades = os.path.exists("localidades.csv")
@@ -577,6 +2630,20 @@ def run_gui():
             )
             self.ignore_optional_check.pack(anchor="w", padx=5, pady=5)
             
+            self.aggregate_check = ttk.Checkbutton(
+                col1_frame, 
+                text="Leitura agregada de conexões paralelas", 
+                variable=self.aggregate_links
+            )
+            self.aggregate_check.pack(anchor="w", padx=5, pady=5)
+            
+            self.site_view_check = ttk.Checkbutton(
+                col1_frame, 
+                text="Página de visão por site", 
+                variable=self.site_view
+            )
+            self.site_view_check.pack(anchor="w", padx=5, pady=5)
+            
             self.logs_check = ttk.Checkbutton(
                 col1_frame, 
                 text="Gerar arquivo de logs", 
@@ -602,6 +2669,37 @@ def run_gui():
             )
             self.hide_conn_check.pack(anchor="w", padx=5, pady=5)
             
+            self.collapse_check = ttk.Checkbutton(
+                col2_frame, 
+                text="Uma ligação por par de nós", 
+                variable=self.collapse_links
+            )
+            self.collapse_check.pack(anchor="w", padx=5, pady=5)
+            
+            # ========= PRÉ-VISUALIZAÇÃO =========
+            preview_frame = ttk.LabelFrame(
+                scrollable_frame, 
+                text="Pré-visualização",
+                style="Section.TLabelframe"
+            )
+            preview_frame.grid(row=4, column=0, columnspan=2, sticky="we", padx=5, pady=10)
+            
+            preview_ctrl = ttk.Frame(preview_frame)
+            preview_ctrl.pack(fill="x", padx=10, pady=(5, 0))
+            ttk.Label(preview_ctrl, text="Layout:").pack(side="left", padx=(0, 10))
+            ttk.Combobox(
+                preview_ctrl,
+                textvariable=self.preview_layout,
+                values=list(PREVIEW_LAYOUTS),
+                state="readonly",
+                width=14
+            ).pack(side="left")
+            self.preview_info = ttk.Label(preview_ctrl, text="", foreground="gray")
+            self.preview_info.pack(side="left", padx=10)
+            
+            self.preview_label = ttk.Label(preview_frame, text="Selecione um arquivo de conexões", anchor="center")
+            self.preview_label.pack(padx=10, pady=10)
+            
             # ========= FILTROS =========
             filters_frame = ttk.LabelFrame(
                 scrollable_frame, 
@@ -621,7 +2719,8 @@ def run_gui():
                 ("Incluir elementos (in)", "in"),
                 ("Remover elementos (rn)", "rn"),
                 ("Incluir camadas (ic)", "ic"),
-                ("Remover camadas (rc)", "rc")
+                ("Remover camadas (rc)", "rc"),
+                ("Expressão (E/OU/NAO)", "expr")
             ]
     
             # Organizar em 2 colunas
@@ -648,7 +2747,7 @@ def run_gui():
             filter_value_frame = ttk.Frame(filters_frame)
             filter_value_frame.pack(fill="x", padx=10, pady=(0, 10))
     
-            ttk.Label(filter_value_frame, text="Valores (separados por ;):").pack(side="left", padx=(0, 10))
+            ttk.Label(filter_value_frame, text="Valores (separados por ;) ou expressão:").pack(side="left", padx=(0, 10))
     
             self.filter_entry = ttk.Entry(
                 filter_value_frame, 
@@ -749,8 +2848,92 @@ def run_gui():
             self.update_ui_state()
             self.update_filter_state()
             canvas.bind("<Motion>", lambda e: canvas.focus_set())  # Melhora resposta ao touchpad
+            
+            # Opções que mudam o desenho atualizam a pré-visualização
+            for var in (self.include_orphans, self.regionalization, self.ignore_optional,
+                        self.collapse_links, self.filter_type, self.filter_value, self.preview_layout):
+                var.trace_add("write", lambda *args: self.schedule_preview())
     
         
+        def schedule_preview(self):
+            """Agenda a atualização da pré-visualização (agrupa alterações seguidas)"""
+            if self.preview_job is not None:
+                self.root.after_cancel(self.preview_job)
+            self.preview_job = self.root.after(PREVIEW_DELAY_MS, self.update_preview)
+    
+        def update_preview(self):
+            """Pede a miniatura do primeiro arquivo de conexões (gerada em segundo plano)"""
+            self.preview_job = None
+            if not PIL_AVAILABLE:
+                self.preview_label.config(image="", text="Instale o Pillow para ver a pré-visualização")
+                return
+            if not self.connection_files:
+                self.preview_pending = None
+                self.preview_image = None
+                self.preview_info.config(text="")
+                self.preview_label.config(image="", text="Selecione um arquivo de conexões")
+                return
+            
+            filter_str = None
+            filter_value = self.filter_value.get().strip()
+            if self.filter_type.get() != "none" and filter_value:
+                if self.filter_type.get() == "expr":
+                    filter_str = filter_value
+                else:
+                    filter_str = f"{self.filter_type.get()}:{filter_value}"
+            
+            # As variáveis do Tk só são lidas aqui, na thread principal
+            args = (self.connection_files[0], self.config, PREVIEW_LAYOUTS[self.preview_layout.get()],
+                    self.elementos_file, self.localidades_file)
+            options = dict(
+                include_orphans=self.include_orphans.get(),
+                regionalization=self.regionalization.get(),
+                ignore_optional=self.ignore_optional.get(),
+                filter_string=filter_str,
+                collapse_links=self.collapse_links.get()
+            )
+            if self.preview_thread is not None:
+                self.preview_pending = (args, options)  # Gerado quando a atual terminar
+                return
+            self.start_preview(args, options)
+    
+        def start_preview(self, args, options):
+            """Inicia a geração da miniatura em uma thread de fundo"""
+            self.preview_pending = None
+            self.preview_info.config(text="Atualizando...")
+            self.preview_thread = threading.Thread(target=self.preview_worker, args=(args, options), daemon=True)
+            self.preview_thread.start()
+    
+        def preview_worker(self, args, options):
+            """Thread de fundo: gera a miniatura e devolve o resultado à thread do Tk"""
+            start_time = time.perf_counter()
+            try:
+                result, error = render_preview(*args, **options), None
+            except Exception as e:
+                result, error = None, e
+            self.root.after(0, self.show_preview, result, error, time.perf_counter() - start_time)
+    
+        def show_preview(self, result, error, elapsed):
+            """Exibe a miniatura gerada (thread do Tk); pedidos feitos no meio da geração vêm antes"""
+            self.preview_thread = None
+            if self.preview_pending is not None:
+                self.start_preview(*self.preview_pending)  # Resultado já desatualizado
+                return
+            if not self.connection_files:
+                return  # Arquivos removidos durante a geração
+            self.preview_image = None
+            if error is not None:
+                logger.warning("Pré-visualização indisponível: %s", error)
+                self.preview_info.config(text="")
+                self.preview_label.config(image="", text=f"Pré-visualização indisponível: {error}")
+                return
+            
+            png, shown, total = result
+            self.preview_image = tk.PhotoImage(data=base64.b64encode(png).decode("ascii"))
+            self.preview_label.config(image=self.preview_image, text="")
+            sample = f"{shown} de {total} nós (amostra)" if shown < total else f"{total} nós"
+            self.preview_info.config(text=f"{sample} · {elapsed:.2f}s")
+    
         # Adicione este novo método na classe:
         def update_filter_state(self):
             """Atualiza o estado do campo de entrada baseado no tipo de filtro"""
@@ -857,6 +3040,7 @@ def run_gui():
                 if len(files) > 3:
                     file_names += f", ... (+{len(files)-3} mais)"
                 self.connections_label.config(text=file_names, foreground="blue")
+                self.schedule_preview()
     
         def select_elementos_file(self):
             file = filedialog.askopenfilename(
@@ -867,6 +3051,7 @@ def run_gui():
                 self.elementos_file = file
                 self.elementos_label.config(text=os.path.basename(file), foreground="blue")
                 self.update_ui_state()
+                self.schedule_preview()
     
         def select_localidades_file(self):
             file = filedialog.askopenfilename(
@@ -877,6 +3062,7 @@ def run_gui():
                 self.localidades_file = file
                 self.localidades_label.config(text=os.path.basename(file), foreground="blue")
                 self.update_ui_state()
+                self.schedule_preview()
     
         def generate_topologies(self):
             hide_node_names = self.hide_node_names.get()
@@ -898,7 +3084,15 @@ def run_gui():
                 if not filter_value:
                     messagebox.showwarning("Aviso", "Filtro selecionado mas sem valores definidos!")
                     return
-                filter_str = f"{self.filter_type.get()}:{filter_value}" 
+                if self.filter_type.get() == "expr":
+                    filter_str = filter_value
+                else:
+                    filter_str = f"{self.filter_type.get()}:{filter_value}"
+                try:
+                    compile_filter(filter_str)
+                except ValueError as e:
+                    messagebox.showerror("Erro", f"Filtro inválido: {e}")
+                    return
     
      
             # Configurar logging se necessário
@@ -938,6 +3132,12 @@ def run_gui():
                     logger.info("  Ocultar nomes dos nós")
                 if self.hide_connection_layers.get():
                     logger.info("  Ocultar camadas de conexão")
+                if self.aggregate_links.get():
+                    logger.info("  Leitura agregada de conexões")
+                if self.site_view.get():
+                    logger.info("  Página de visão por site")
+                if self.collapse_links.get():
+                    logger.info("  Uma ligação por par de nós")
             
             # Registrar informações do sistema
             logger.debug("Sistema: %s %s", sys.platform, platform.platform())
@@ -975,7 +3175,10 @@ def run_gui():
                         hide_node_names,          # Corrigido
                         hide_connection_layers,    # Corrigido
                         ignore_optional=self.ignore_optional.get(),
-                        filter_string=filter_str
+                        filter_string=filter_str,
+                        aggregate_links=self.aggregate_links.get(),
+                        site_view='siteid' if self.site_view.get() else None,
+                        collapse_links=self.collapse_links.get()
                     )
                     if not result:
                         success = False
@@ -1000,93 +3203,19 @@ def run_gui():
         def process_single_file(self, conexoes_file, config, include_orphans, layouts_choice, 
                                 regionalization, elementos_file, localidades_file, 
                                 hide_node_names, hide_connection_layers, ignore_optional,
-                                filter_string=None):
-            """Processa um arquivo de conexões completo"""
-            file_start = time.perf_counter()
-            logger.info("⏱️ [INICIO] Processando arquivo: %s", conexoes_file)
-            logger.debug("Parâmetros: orphans=%s, layouts=%s, regional=%s, hide_names=%s, hide_cnx=%s",
-                        include_orphans, layouts_choice, regionalization, 
-                        hide_node_names, hide_connection_layers)
-            
-            try:
-                # Criar instância do gerador com arquivos personalizados
-                generator = TopologyGenerator(
-                    elementos_file=elementos_file, 
-                    conexoes_file=conexoes_file, 
-                    config=config, 
-                    include_orphans=include_orphans, 
-                    regionalization=regionalization,
-                    localidades_file=localidades_file,
-                    hide_node_names=hide_node_names,
-                    hide_connection_layers=hide_connection_layers,
-                    ignore_optional=ignore_optional,
-                    filter_string=filter_string
-                )
-                
-                if not generator.valid:
-                    return False
-                    
-                if not generator.read_elementos():
-                    return False
-                    
-                if not generator.read_conexoes():
-                    return False
-                    
-                base_name = os.path.splitext(conexoes_file)[0]
-                timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                
-                success = True
-                
-                # Dicionário de mapeamento de layouts
-                layout_map = {
-                    'c': ('circular', 'Circular'),
-                    'o': ('organico', 'Orgânico'),
-                    'g': ('geografico', 'Geográfico'),
-                    'h': ('hierarquico', 'Hierárquico')
-                }
-                
-                generated_layouts = []
-                
-                # Gerar layouts selecionados
-                for char in layouts_choice:
-                    if char in layout_map:
-                        layout_key, layout_name = layout_map[char]
-                        
-                        # Verificar disponibilidade do geográfico
-                        if char == 'g' and not generator.has_geographic_data:
-                            logger.warning("Layout geográfico solicitado mas sem dados geográficos. Ignorando.")
-                            continue
-                        
-                        layout_start = time.perf_counter()
-                        output_file = f"{base_name}_{timestamp}_{layout_key}.drawio"
-                        if generator.generate_drawio(output_file, layout_key):
-                            gen_time = time.perf_counter() - layout_start
-                            logger.info("✅ %s gerado em %.2fs (%.1fKB)", 
-                                      layout_name, gen_time, os.path.getsize(output_file)/1024)
-                            generated_layouts.append(layout_name)
-                        else:
-                            success = False
-                
-                # Log de performance detalhada
-                file_time = time.perf_counter() - file_start
-                logger.info("✅ [SUCESSO] Arquivo processado em %.2fs | Layouts: %s | Nós: %d | Conexões: %d",
-                          file_time, ', '.join(generated_layouts), 
-                          len(generator.nodes), len(generator.connections))
-                
-                # Registrar elementos sem siteid
-                if generator.nodes_without_siteid:
-                    nodes_list = ", ".join(generator.nodes_without_siteid[:10])
-                    if len(generator.nodes_without_siteid) > 10:
-                        nodes_list += f", ... (+{len(generator.nodes_without_siteid) - 10} mais)"
-                    logger.debug("%d elementos sem siteid movidos para camada especial: %s", 
-                                  len(generator.nodes_without_siteid), nodes_list)        
-                
-                return success
-            except Exception as e:
-                logger.exception("💥 [FALHA] Erro no processamento")
-                logger.error("Contexto: layouts=%s, regional=%s, elementos=%s",
-                           layouts_choice, regionalization, elementos_file)
-                return False
+                                filter_string=None, aggregate_links=False, site_view=None,
+                                collapse_links=False):
+            """Processa um arquivo de conexões completo (mesmo fluxo da linha de comando)"""
+            return process_file(
+                conexoes_file, config, include_orphans, layouts_choice,
+                regionalization, elementos_file, localidades_file,
+                hide_node_names, hide_connection_layers,
+                ignore_optional=ignore_optional,
+                filter_string=filter_string,
+                aggregate_links=aggregate_links,
+                site_view=site_view,
+                collapse_links=collapse_links
+            )
     # Código que inicializa a GUI
     root = tk.Tk()
     app = TopologyGUI(root)
@@ -1096,19 +3225,30 @@ def run_gui():
 # CORE FUNCTIONALITY
 # =====================================================
 
+def normalize_config(config):
+    """Converte a estrutura antiga LAYER_SHAPES para LAYER_STYLES (altera e retorna o config)"""
+    if "LAYER_SHAPES" in config and "LAYER_STYLES" not in config:
+        config["LAYER_STYLES"] = {}
+        for layer, shape in config["LAYER_SHAPES"].items():
+            config["LAYER_STYLES"][layer] = {"shape": shape}
+        logger.info("Convertido LAYER_SHAPES para LAYER_STYLES")
+    return config
+
+
 def load_config(config_file='config.json'):
-    """Carrega configurações do arquivo JSON com tratamento robusto de erros"""
+    """
+    Carrega configurações do arquivo JSON com tratamento robusto de erros
+    
+    Raises:
+        OSError: Arquivo inexistente ou ilegível
+        ValueError: JSON inválido (json.JSONDecodeError)
+    """
     try:
         with open(config_file, 'r') as f:
             config = json.load(f)
         logger.info("Configurações carregadas de %s", config_file)
         
-        # Converter estrutura antiga LAYER_SHAPES para nova LAYER_STYLES
-        if "LAYER_SHAPES" in config and "LAYER_STYLES" not in config:
-            config["LAYER_STYLES"] = {}
-            for layer, shape in config["LAYER_SHAPES"].items():
-                config["LAYER_STYLES"][layer] = {"shape": shape}
-            logger.info("Convertido LAYER_SHAPES para LAYER_STYLES")
+        normalize_config(config)
             
         # Logar informações da configuração
         logger.debug("⚙️ Configurações carregadas:")
@@ -1124,17 +3264,17 @@ def load_config(config_file='config.json'):
         
     except FileNotFoundError:
         logger.critical("Arquivo de configuração não encontrado: %s", config_file)
-        sys.exit(1)
+        raise
     except json.JSONDecodeError as e:
         logger.critical("Erro ao decodificar JSON em %s: %s", config_file, str(e))
-        sys.exit(1)
+        raise
         
 def verificar_dependencias():
     """Verifica dependências críticas e informa como instalar"""
     dependencias = {
         "tkinter": "Interface gráfica (normalmente já incluída no Python)",
         "networkx": "Gerenciamento de grafos e layouts",
-        "chardet": "Detecção de codificação de arquivos"
+        "numpy": "Adjacência do grafo em arrays (CSR)"
     }
     
     faltando = []
@@ -1160,178 +3300,323 @@ class TopologyGenerator:
     def __init__(self, elementos_file, conexoes_file, config, include_orphans=False, 
                  regionalization=False, localidades_file='localidades.csv',
                  hide_node_names=False, hide_connection_layers=False,
-                 ignore_optional=False, filter_string=None):
+                 ignore_optional=False, filter_string=None, aggregate_links=False,
+                 focus_nodes=None, focus_hops=2, geo_crop=None, site_view=None,
+                 collapse_links=False, elementos_records=None, conexoes_records=None,
+                 localidades_records=None):
         self.elementos_file = elementos_file
         self.conexoes_file = conexoes_file
+        # Registros em memória (render_topology): substituem os CSVs correspondentes
+        # (elementos_file/localidades_file None = sem o arquivo)
+        self.elementos_records = elementos_records
+        self.conexoes_records = conexoes_records
+        self.localidades_records = localidades_records
         self.config = config
         self.include_orphans = include_orphans
         self.regionalization = regionalization
         self.localidades_file = localidades_file
-        self.nodes = defaultdict(dict)
+        self.nodes = {}  # nome -> NodeRecord (apenas nós ativos)
+        self.node_list = []  # índice inteiro -> NodeRecord (None se removido)
         self.connections = []
-        self.layers = defaultdict(list)
-        self.node_ids = {}
+        self._organic_graph = None  # nx.Graph do layout orgânico (ver organic_graph)
+        self._organic_components = None  # Componentes conexos do grafo orgânico
+        self.adjacency = None  # Adjacency (CSR) alinhada a self.connections
+        self.layers = defaultdict(set)  # camada -> índices dos nós
         self.layer_ids = {}
-        self.circular_alignments = defaultdict(list)
+        self.layer_labels = {}  # camada -> nome escapado para XML
+        self.connection_layers = {}  # camada de nós -> camada de conexões (_CNX)
+        self.circular_alignments = defaultdict(set)
         self.node_colors = defaultdict(list)
+        self.prefix_map = config.get("LAYER_DEFAULT_BY_PREFIX", {})
+        self.prefix_index = PrefixIndex(self.prefix_map)  # Prefixos de LAYER_DEFAULT_BY_PREFIX
+        self.layer_index = None  # PrefixIndex das camadas existentes (montado em generate_drawio)
         self.valid = True
         self.localidades_map = self._load_localidades()
         self.has_geographic_data = False
         self.nodes_without_siteid = []  # Nova lista para nós sem siteid
+        self.elementos_index = None  # ElementosIndex quando a leitura é sob demanda
+        self._elementos_handle = None
+        self._element_rank = {}  # índice do nó -> offset da linha no elementos.csv
+        self._element_sem_siteid = []  # nós sem siteid registrados ao materializar elementos
         self.ignore_optional = ignore_optional
         self.filter_string = filter_string
+        self.ingest_filter = None  # FilterExpression aplicada durante a leitura
+        self._excluded_nodes = set()  # nomes descartados pelo filtro
+        self._excluded_layers = set()  # camadas finais dos nós descartados
+        self._filter_anchored = set()  # nós mantidos com conexões descartadas pelo filtro
+        self.geo_crop = None  # GeoCrop (--crop ou GEOGRAPHIC_LAYOUT.crop)
+        self._crop_sites = None  # siteids dentro do recorte
+        self.ingest_pruning = False  # filtro e/ou recorte aplicados durante a leitura
+        self.aggregate_links = aggregate_links
+        self.collapse_links = collapse_links  # Uma única ligação por par de nós (-o a)
+        self.focus_nodes = focus_nodes or []  # Nós centrais do modo --focus
+        self.focus_hops = focus_hops
         self.hide_node_names = hide_node_names
         self.hide_connection_layers = hide_connection_layers
         logger.info(f"Opções: hide_node_names={hide_node_names}, hide_connection_layers={hide_connection_layers}")
         
         self._initialize() 
+        self._compile_filter()
+        self._compile_geo_crop(geo_crop)
+        self.ingest_pruning = self.ingest_filter is not None or self._crop_sites is not None
+        self.page_definitions = self._page_definitions(site_view)
         logger.info("Inicialização concluída")
         
     def apply_filters(self):
-        """Aplica filtros aos nós e conexões com base no filter_string"""
+        """Aplica filtros aos nós e conexões já carregados (seleção por álgebra de conjuntos)"""
         if not self.filter_string:
             return
             
         logger.info(f"Aplicando filtro: {self.filter_string}")
-        filter_type, filter_list = self.filter_string.split(':', 1)
-        filters = [f.strip() for f in filter_list.split(';') if f.strip()]
-        
-        # Criar cópias para iteração segura
-        all_nodes = list(self.nodes.keys())
-        all_connections = list(self.connections)
-        
-        # Filtragem de nós
-        nodes_to_remove = set()
-        for node in all_nodes:
-            node_data = self.nodes[node]
-            camada = node_data['camada']
-            
-            if filter_type == 'in':  # Filtrar INclusão de Nós
-                if not any(node.startswith(f) for f in filters):
-                    nodes_to_remove.add(node)
-                    
-            elif filter_type == 'rn':  # Filtrar Remoção de Nós
-                if any(node.startswith(f) for f in filters):
-                    nodes_to_remove.add(node)
-                    
-            elif filter_type == 'ic':  # Filtrar INclusão de Camadas
-                if not any(camada.startswith(f) for f in filters):
-                    nodes_to_remove.add(node)
-                    
-            elif filter_type == 'rc':  # Filtrar Remoção de Camadas
-                if any(camada.startswith(f) for f in filters):
-                    nodes_to_remove.add(node)
+        expression = self.ingest_filter or compile_filter(self.filter_string)
         
-        # Remover nós marcados
-        for node in nodes_to_remove:
-            # Remover nó das estruturas
-            if node in self.nodes:
-                del self.nodes[node]
-            if node in self.node_ids:
-                del self.node_ids[node]
-            
-            # Remover das camadas
-            for layer in list(self.layers.keys()):
-                if node in self.layers[layer]:
-                    self.layers[layer].remove(node)
-                    if not self.layers[layer]:  # Remover camada vazia
-                        del self.layers[layer]
-                        del self.layer_ids[layer]
-        
-        # Filtrar conexões que envolvem nós removidos
-        self.connections = [
-            conn for conn in all_connections
-            if conn['origem'] not in nodes_to_remove and conn['destino'] not in nodes_to_remove
-        ]
+        all_connections = self.connections
         
-        logger.info(f"Filtro aplicado: {len(nodes_to_remove)} nós removidos, "
+        # Filtragem de nós: cada termo é resolvido pelos índices (nome, camada, região...)
+        index = NodeSelectionIndex(self.nodes, self.layers, self._site_region)
+        removed = self._restrict_nodes(expression.select(index))
+        
+        logger.info(f"Filtro aplicado: {removed} nós removidos, "
                   f"{len(all_connections) - len(self.connections)} conexões removidas")    
 
-    def _dms_to_decimal(self, dms_str, coord_type, site_id):
+    def _restrict_nodes(self, keep):
         """
-        Converte coordenadas DMS para decimal com tratamento robusto
+        Mantém apenas os nós indicados, removendo os demais e suas conexões
         
         Args:
-            dms_str (str): Coordenada no formato DMS
-            coord_type (str): 'lat' ou 'lon'
-            site_id (str): ID do site para logs
+            keep (set): Índices dos nós mantidos
             
         Returns:
-            float: Valor decimal ou None se falhar
+            int: Quantidade de nós removidos
         """
-        if not dms_str or str(dms_str).strip() == '':
-            logger.error("Coordenada vazia para site %s", site_id)
-            return None
+        nodes_to_remove = [data for data in self.nodes.values() if data.idx not in keep]
         
-        try:
-            # Pré-processamento da string
-            dms_clean = str(dms_str).strip().upper()
-            direcao = None
-            
-            # Extrair direção (N/S/E/W)
-            if dms_clean[-1] in ['N', 'S', 'E', 'W']:
-                direcao = dms_clean[-1]
-                dms_clean = dms_clean[:-1].strip()
-            
-            # Normalizar formato
-            dms_clean = dms_clean.replace(',', '.').replace(' ', '')
-            parts = [p for p in dms_clean.split('.') if p != '']
-            
-            if len(parts) < 2:
-                logger.error("Formato inválido para site %s: %s", site_id, dms_str)
-                return None
-            
-            # Combinar partes fracionadas
-            if len(parts) > 3:
-                seconds_str = '.'.join(parts[2:])
-                parts = parts[:2] + [seconds_str]
-            
-            # Converter para floats
-            try:
-                graus = float(parts[0])
-                minutos = float(parts[1])
-                segundos = float(parts[2]) if len(parts) > 2 else 0.0
-            except ValueError as e:
-                logger.error("Valor não numérico em %s: %s", site_id, dms_str)
-                return None
-            
-            # Calcular valor decimal
-            decimal = graus + minutos/60 + segundos/3600
-            
-            # Determinar direção padrão se não especificada
-            if not direcao:
-                if coord_type == 'lat': direcao = 'S'
-                elif coord_type == 'lon': direcao = 'W'
-            
-            # Aplicar sinal conforme direção
-            if direcao in ['S', 'W']:
-                decimal = -decimal
-                
-            return decimal
-            
-        except Exception as e:
-            logger.error("Erro na conversão para site %s: %s - %s", site_id, dms_str, str(e))
-            return None
+        # Remover nós marcados
+        for node_data in nodes_to_remove:
+            self._remove_node(node_data)
             
-    def _update_node_layer(self, node_name, old_camada, new_camada, nivel):
+            # Remover camada que ficou vazia
+            layer = node_data.camada
+            if layer in self.layers and not self.layers[layer]:
+                del self.layers[layer]
+                del self.layer_ids[layer]
+        
+        # Filtrar conexões que envolvem nós removidos (máscara sobre a adjacência)
+        keep = self.adjacency.edge_mask(self._alive_mask())
+        if not keep.all():
+            self.connections = list(compress(self.connections, keep.tolist()))
+            self.adjacency = self.adjacency.subgraph(keep)
+        self.nodes_without_siteid = [n for n in self.nodes_without_siteid if n in self.nodes]
+        return len(nodes_to_remove)
+
+    def apply_focus(self):
+        """
+        Restringe o grafo à vizinhança de até focus_hops saltos dos nós de foco (--focus)
+        
+        Executado logo após a leitura: layouts e páginas passam a trabalhar só
+        com o subgrafo, com custo proporcional à vizinhança e não à rede.
+        
+        Returns:
+            bool: False se nenhum nó de foco existir no grafo
+        """
+        start_time = time.perf_counter()
+        seeds = []
+        for name in self.focus_nodes:
+            node_data = self.nodes.get(name)
+            if node_data is None:
+                logger.warning("Nó de foco não encontrado: %s", name)
+            else:
+                seeds.append(node_data.idx)
+        if not seeds:
+            logger.error("Nenhum nó de foco encontrado entre: %s", ", ".join(self.focus_nodes))
+            return False
+        
+        reached = self.adjacency.k_hop(seeds, self.focus_hops)
+        total_nodes, total_connections = len(self.nodes), len(self.connections)
+        self._restrict_nodes(set(np.flatnonzero(reached).tolist()))
+        
+        # Camadas de conexão sem nenhuma conexão restante não vão para o diagrama
+        used = {conn.camada for conn in self.connections}
+        for camada, camada_conexao in list(self.connection_layers.items()):
+            if camada_conexao not in used:
+                del self.connection_layers[camada]
+                self.layers.pop(camada_conexao, None)
+                self.layer_ids.pop(camada_conexao, None)
+        
+        logger.info("Foco em %s (%d saltos): %d/%d nós, %d/%d conexões em %.3fs",
+                   ", ".join(self.focus_nodes), self.focus_hops, len(self.nodes), total_nodes,
+                   len(self.connections), total_connections, time.perf_counter() - start_time)
+        return True
+
+    def _compile_filter(self):
+        """Compila o filtro uma única vez para aplicação durante a leitura dos CSVs"""
+        if not self.filter_string:
+            return
+        try:
+            self.ingest_filter = compile_filter(self.filter_string)
+        except ValueError as e:
+            logger.error("Filtro inválido: %s (%s)", self.filter_string, e)
+            self.valid = False
+            return
+        logger.info("Filtro aplicado durante a leitura: %s", self.filter_string)
+
+    def _compile_geo_crop(self, geo_crop):
+        """Seleciona pelo índice espacial os sites do recorte geográfico, antes da leitura dos nós"""
+        if geo_crop is None:
+            geo_crop = self.config.get("GEOGRAPHIC_LAYOUT", {}).get("crop")
+        if not geo_crop:
+            return
+        if not isinstance(self.localidades_map, LocalidadesIndex) or not self.localidades_map:
+            logger.error("Recorte geográfico requer localidades.csv com coordenadas")
+            self.valid = False
+            return
+        try:
+            self.geo_crop = GeoCrop.parse(geo_crop, self.localidades_map)
+        except ValueError as e:
+            logger.error("%s", e)
+            self.valid = False
+            return
+        start_time = time.perf_counter()
+        self._crop_sites = self.geo_crop.select(self.localidades_map.spatial_index())
+        logger.info("Recorte geográfico %s: %d sites selecionados em %.3fs",
+                   self.geo_crop.text, len(self._crop_sites), time.perf_counter() - start_time)
+
+    def _page_definitions(self, site_view):
+        """
+        Páginas a gerar: PAGE_DEFINITIONS do config, precedidas da visão por site (--sites)
+        
+        A visão por site entra como primeira página, que é a aberta pelo draw.io.
+        """
+        pages = list(self.config["PAGE_DEFINITIONS"])
+        if site_view:
+            pages.insert(0, {"name": SITE_VIEW_PAGE_NAMES.get(site_view, site_view),
+                             "visible_layers": None, "aggregate": site_view})
+        # Nome da página já escapado para XML (atributo name e título da legenda) e
+        # id derivado do nome (com ordinal quando o nome se repete)
+        seen_names = defaultdict(int)
+        for position, page_def in enumerate(pages):
+            ordinal = seen_names[page_def["name"]]
+            seen_names[page_def["name"]] += 1
+            pages[position] = dict(page_def, label=xml_escape(page_def["name"]),
+                                   id=stable_id(f"pagina\x1f{page_def['name']}\x1f{ordinal}"))
+        for page_def in pages:
+            aggregate = page_def.get("aggregate")
+            if aggregate and aggregate not in SITE_AGGREGATION_KEYS:
+                logger.error("Página '%s': agregação inválida '%s' (use %s)",
+                             page_def["name"], aggregate, " ou ".join(SITE_AGGREGATION_KEYS))
+                self.valid = False
+        return pages
+
+    def _site_region(self, siteid):
+        """Região do siteid segundo o localidades.csv ('' se desconhecida)"""
+        loc_data = self.localidades_map.get(siteid) if siteid else None
+        return loc_data['regiao'] if loc_data is not None else ''
+
+    def _excluded_by_name(self, node):
+        """Indica se o filtro descarta o nó só pelo nome (antes de criá-lo), registrando o descarte"""
+        expression = self.ingest_filter
+        if expression is None or expression.uses_node:
+            return False
+        excluded = not expression.matches(node)
+        if excluded:
+            self._excluded_nodes.add(node)
+        return excluded
+
+    def _excluded_by_node(self, node_data):
+        """
+        Descarta o nó se o recorte geográfico ou o filtro o excluírem pelos seus
+        dados finais (siteid, camada após regionalização)
+        """
+        expression = self.ingest_filter
+        siteid = node_data.siteid
+        camada = self._regionalized_layer(node_data)
+        if self._crop_sites is not None and siteid not in self._crop_sites:
+            excluded = True  # Fora do recorte (ou sem coordenadas)
+        elif expression is not None and expression.uses_node:
+            excluded = not expression.matches(
+                node_data.nome, camada, self._site_region(siteid), siteid, node_data.nivel
+            )
+        else:
+            return False
+        if excluded:
+            self._excluded_nodes.add(node_data.nome)
+            self._excluded_layers.add(camada)
+            self._remove_node(node_data)
+        return excluded
+
+    def _finish_ingest_filter(self):
+        """Remove camadas esvaziadas pelos nós descartados (filtro/recorte), como na filtragem posterior"""
+        for layer in self._excluded_layers:
+            if layer in self.layers and not self.layers[layer]:
+                del self.layers[layer]
+                del self.layer_ids[layer]
+        self.nodes_without_siteid = [n for n in self.nodes_without_siteid if n in self.nodes]
+        logger.info("Filtro/recorte na leitura: %d nós descartados, %d nós mantidos com conexões descartadas",
+                   len(self._excluded_nodes), len(self._filter_anchored))
+
+    def _alive_mask(self):
+        """Array booleano por índice de nó indicando os nós ainda ativos"""
+        alive = np.zeros(len(self.node_list), dtype=bool)
+        alive[[data.idx for data in self.nodes.values()]] = True
+        return alive
+
+    def _build_adjacency(self):
+        """Constrói a adjacência CSR uma única vez, logo após a leitura das conexões"""
+        start_time = time.perf_counter()
+        self.adjacency = Adjacency.from_connections(len(self.node_list), self.connections)
+        logger.debug("⚙️ Adjacência construída em %.3fs | Nós: %d | Conexões: %d",
+                   time.perf_counter() - start_time, len(self.node_list), len(self.connections))
+
+    @property
+    def adjacency(self):
+        """Adjacency (CSR) alinhada a self.connections"""
+        return self._adjacency
+
+    @adjacency.setter
+    def adjacency(self, value):
+        """Troca a adjacência e descarta o grafo networkx derivado dela"""
+        self._adjacency = value
+        self._drop_organic_cache()
+
+    def _drop_organic_cache(self):
+        """Descarta o grafo e os componentes do layout orgânico (nós ou conexões mudaram)"""
+        self._organic_graph = None
+        self._organic_components = None
+
+    def _remove_node(self, node_data):
+        """Remove um nó de todas as estruturas internas (o índice inteiro não é reutilizado)"""
+        node = node_data.nome
+        idx = node_data.idx
+        self._drop_organic_cache()
+        self.nodes.pop(node, None)
+        self.node_list[idx] = None
+        
+        if node_data.camada in self.layers:
+            self.layers[node_data.camada].discard(idx)
+        for members in self.circular_alignments.values():
+            members.discard(idx)
+        self.node_colors.pop(node, None)
+
+    def _update_node_layer(self, node_data, new_camada, nivel):
         """Atualiza o registro de camadas quando a camada de um nó é alterada"""
         # Remover da camada antiga
-        if old_camada in self.layers and node_name in self.layers[old_camada]:
-            self.layers[old_camada].remove(node_name)
+        old_camada = node_data.camada
+        if old_camada in self.layers:
+            self.layers[old_camada].discard(node_data.idx)
         
         # Atualizar camada no nó
-        self.nodes[node_name]['camada'] = new_camada
+        node_data.camada = new_camada
         
         # Registrar na nova camada
-        self._register_node(node_name, nivel)
+        self._register_node(node_data, nivel)
 
     def _determine_layer_by_prefix(self, node_name):
         """Determina camada/nível baseado em prefixos do config"""
-        prefix_map = self.config.get("LAYER_DEFAULT_BY_PREFIX", {})
-        for prefix in sorted(prefix_map.keys(), key=len, reverse=True):
-            if node_name.startswith(prefix):
-                layer_info = prefix_map[prefix]
-                return layer_info["camada"], layer_info["nivel"]
+        prefix_map = self.prefix_map
+        prefix = self.prefix_index.longest_prefix(node_name)
+        if prefix is not None:
+            layer_info = prefix_map[prefix]
+            return layer_info["camada"], layer_info["nivel"]
         
         # Se não encontrado, usa default
         default_info = prefix_map.get("default", {"camada": "default", "nivel": 10})
@@ -1343,59 +3628,31 @@ class TopologyGenerator:
         Carrega mapeamento de localidades para dados geográficos
         
         Returns:
-            dict: Mapeamento localidade -> {regiao, latitude, longitude}
+            LocalidadesIndex | dict: Mapeamento siteid -> {regiao, latitude, longitude}
         """
+        if self.localidades_records is not None:
+            return build_localidades_index(enumerate(map(normalize_record, self.localidades_records), 1))
+        if self.localidades_file is None:
+            return {}  # Registros em memória sem localidades
         if not os.path.exists(self.localidades_file):
             logger.info("Arquivo localidades.csv não encontrado")
             return {}
         
         try:
-            encoding = self._detect_encoding(self.localidades_file)
-            mapping = {}
-            with open(self.localidades_file, 'r', encoding=encoding, errors='replace') as f:
-                reader = csv.DictReader(f, delimiter=';')
-                valid_count = 0
-                invalid_count = 0
-                
-                for row in reader:
-                    site_id = row.get('siteid', '').strip()
-                    localidade = row.get('Localidade', '').strip()
-                    regiao = row.get('RegiaoGeografica', '').strip()
-                    lat_str = row.get('Latitude', '').strip()
-                    lon_str = row.get('Longitude', '').strip()
-                    
-                    if not site_id:
-                        site_id = f"Linha {reader.line_num}"
-                    
-                    # Validar dados obrigatórios
-                    if not all([localidade, regiao, lat_str, lon_str]):
-                        logger.warning("Dados incompletos para site %s", site_id)
-                        continue
-                    
-                    # Converter coordenadas
-                    lat_decimal = self._dms_to_decimal(lat_str, 'lat', site_id)
-                    lon_decimal = self._dms_to_decimal(lon_str, 'lon', site_id)
-                    
-                    if None in [lat_decimal, lon_decimal]:
-                        invalid_count += 1
-                        continue
-                    
-                    # Armazenar dados válidos
-                    mapping[site_id] = {  # Alterado para usar siteid como chave
-                        'regiao': regiao,
-                        'latitude': lat_decimal,
-                        'longitude': lon_decimal
-                    }
-                    valid_count += 1
-                
-                logger.info("Mapeamento carregado: %d válidas, %d inválidas", valid_count, invalid_count)
-            return mapping
+            return load_localidades(self.localidades_file)
         except Exception as e:
             logger.error("Erro ao carregar localidades: %s", str(e))
             return {}
 
     def _initialize(self):
         """Verifica arquivos (elementos.csv agora opcional)"""
+        if self.conexoes_records is not None:
+            # Registros em memória: nada a verificar nem decodificar (exceto um elementos.csv informado)
+            self.encoding_conexoes = 'utf-8'
+            self.encoding_elementos = 'utf-8'
+            if self.elementos_file is not None and os.path.exists(self.elementos_file):
+                self.encoding_elementos = self._detect_encoding(self.elementos_file)
+            return
         if not os.path.exists(self.conexoes_file):
             logger.error("Arquivo de conexões não encontrado: %s", self.conexoes_file)
             self.valid = False
@@ -1413,21 +3670,8 @@ class TopologyGenerator:
                    self.encoding_elementos, self.encoding_conexoes)
 
     def _detect_encoding(self, file_path):
-        try:
-            with open(file_path, 'rb') as f:
-                raw_data = f.read(4)  # Lê suficiente para detectar BOM
-                
-                # Verifica presença de BOM UTF-8
-                if raw_data.startswith(b'\xef\xbb\xbf'):
-                    return 'utf-8-sig'
-                
-                # Detecção padrão para outros casos
-                result = chardet.detect(raw_data)
-                encoding = result['encoding'] or 'utf-8'
-                return 'utf-8-sig' if encoding.lower() == 'utf-8' else encoding
-        except Exception as e:
-            logger.error("Falha ao detectar encoding: %s", str(e))
-            return 'utf-8-sig'  # Padrão seguro para Windows
+        """Detecta o encoding do arquivo (com cache compartilhado entre geradores)"""
+        return detect_encoding(file_path)
 
     def _normalize_color(self, color_str):
         """
@@ -1450,6 +3694,11 @@ class TopologyGenerator:
         return color_str
 
     def read_elementos(self):
+        if self.elementos_records is not None:
+            self._read_elemento_rows(map(normalize_record, self.elementos_records))
+            return True
+        if self.elementos_file is None:
+            return True  # Registros em memória sem elementos: camadas pelo prefixo
         if not os.path.exists(self.elementos_file):
             logger.warning("Arquivo de elementos não encontrado. Continuando sem ele.")
             return True
@@ -1462,83 +3711,180 @@ class TopologyGenerator:
                     logger.error("Cabeçalho 'elemento' não encontrado em elementos.csv")
                     return False
                     
-                f.seek(0)  # Voltar ao início
-                reader = csv.DictReader(f, delimiter=';')
-                row_count = 0
-                for row in reader:
-                    row_count += 1
-                    self._process_elemento_row(row)
+                # Sem -y só interessam os elementos referenciados pelas conexões:
+                # indexar nomes e materializar os nós durante a leitura de conexões
+                if not self.include_orphans:
+                    self.elementos_index = load_elementos_index(self.elementos_file, self.encoding_elementos)
+                    if self.elementos_index is not None:
+                        logger.info("Índice de elementos: %d linhas, %d nomes (nós criados sob demanda)",
+                                   self.elementos_index.row_count, len(self.elementos_index.offsets))
+                        return True
+                    logger.info("elementos.csv não indexável por linha, usando leitura completa")
                 
-                logger.info("Processadas %d linhas de elementos", row_count)
+                f.seek(0)  # Voltar ao início
+                self._read_elemento_rows(csv.DictReader(f, delimiter=';'))
                 return True
                 
         except Exception as e:
             logger.error("Falha na leitura de elementos: %s", str(e), exc_info=True)
             return False
 
+    def _read_elemento_rows(self, rows):
+        """Leitura completa de elementos (linhas do csv.DictReader ou registros em memória)"""
+        row_count = 0
+        for row in rows:
+            row_count += 1
+            self._process_elemento_row(row)
+        
+        # Filtro por dados do nó: decidido com a camada final de cada elemento
+        if self.ingest_pruning:
+            for node_data in list(self.nodes.values()):
+                self._excluded_by_node(node_data)
+        
+        logger.info("Processadas %d linhas de elementos", row_count)
+        log_memory_usage("Após leitura de elementos")
+
     def _apply_regionalization(self, node_name, node_data):
         """Aplica dados regionais se a flag estiver ativa (modifica a camada)"""
         if not self.regionalization or not self.localidades_map:
             return
             
         # Verificar se a regionalização já foi aplicada
-        if node_data.get('regionalized'):
+        if node_data.regionalized:
             return
             
-        siteid = node_data.get('siteid', '')
-        if siteid and siteid in self.localidades_map:
-            loc_data = self.localidades_map[siteid]
+        siteid = node_data.siteid
+        loc_data = self.localidades_map.get(siteid) if siteid else None
+        if loc_data is not None:
             regiao = loc_data['regiao']
-            old_camada = node_data['camada']
+            old_camada = node_data.camada
             
             # Aplicar apenas se ainda não tiver sufixo regional
             if not old_camada.endswith(f"_{regiao}"):
-                new_camada = f"{old_camada}_{regiao}"
+                new_camada = sys.intern(f"{old_camada}_{regiao}")
                 
                 # Aplicar atualização de camada
-                self._update_node_layer(node_name, old_camada, new_camada, node_data['nivel'])
+                self._update_node_layer(node_data, new_camada, node_data.nivel)
                 logger.debug(f"Regionalização aplicada a {node_name}: {old_camada} -> {new_camada}")
                 
                 # Marcar como regionalizado
-                node_data['regionalized'] = True
+                node_data.regionalized = True
         else:
             # Mover para camada especial SEM_SITEID
-            old_camada = node_data['camada']
-            new_camada = "SEM_SITEID"
-            self._update_node_layer(node_name, old_camada, new_camada, 10)  # Nível 10
+            self._update_node_layer(node_data, "SEM_SITEID", 10)  # Nível 10
             logger.debug(f"Elemento sem siteid movido para camada especial: {node_name}")  # Alterado para DEBUG
             self.nodes_without_siteid.append(node_name)
 
+    def _regionalized_layer(self, node_data):
+        """Camada que o nó terá após a regionalização, sem alterá-lo"""
+        camada = node_data.camada
+        if not self.regionalization or not self.localidades_map or node_data.regionalized:
+            return camada
+        siteid = node_data.siteid
+        loc_data = self.localidades_map.get(siteid) if siteid else None
+        if loc_data is None:
+            return "SEM_SITEID"
+        regiao = loc_data['regiao']
+        return camada if camada.endswith(f"_{regiao}") else f"{camada}_{regiao}"
+
+    def _apply_regionalization_bulk(self):
+        """
+        Aplica a regionalização uma única vez a cada nó distinto, após a leitura
+        das conexões, e atualiza o registro de camadas em lote
+
+        Nós já regionalizados ou já movidos para SEM_SITEID na leitura dos
+        elementos são mantidos como estão (reaplicar não alteraria a camada).
+
+        Returns:
+            int: Quantidade de nós que mudaram de camada
+        """
+        if not self.regionalization or not self.localidades_map:
+            return 0
+
+        start_time = time.perf_counter()
+        localidades = self.localidades_map
+        layers = self.layers
+        alignments = self.circular_alignments
+        handled = set(self.nodes_without_siteid)
+        moves = defaultdict(list)  # (camada antiga, camada nova) -> nós
+        new_layers = {}  # Camadas regionais já internadas
+
+        for node_name, node_data in self.nodes.items():
+            if node_data.regionalized or node_name in handled:
+                continue
+            siteid = node_data.siteid
+            loc_data = localidades.get(siteid) if siteid else None
+            old_camada = node_data.camada
+            if loc_data is not None:
+                key = (old_camada, loc_data['regiao'])
+                new_camada = new_layers.get(key)
+                if new_camada is None:
+                    regiao = key[1]
+                    new_camada = new_layers[key] = (
+                        None if old_camada.endswith(f"_{regiao}")
+                        else sys.intern(f"{old_camada}_{regiao}")
+                    )
+                if new_camada is None:
+                    continue
+                node_data.regionalized = True
+            else:
+                new_camada = "SEM_SITEID"
+                handled.add(node_name)
+                self.nodes_without_siteid.append(node_name)
+            moves[old_camada, new_camada].append(node_data)
+
+        # Atualizar camadas e alinhamentos por grupo de mudança
+        moved = 0
+        for (old_camada, new_camada), group in moves.items():
+            members = [data.idx for data in group]
+            if old_camada in layers:
+                layers[old_camada].difference_update(members)
+            if new_camada not in self.layer_ids:
+                self._register_layer(new_camada)
+            layers[new_camada].update(members)
+            for data in group:
+                data.camada = new_camada
+                alignments[10 if new_camada == "SEM_SITEID" else data.nivel].add(data.idx)
+            moved += len(members)
+
+        # Cada nó sem siteid aparece uma única vez (na ordem do primeiro registro)
+        self.nodes_without_siteid = list(dict.fromkeys(self.nodes_without_siteid))
+        logger.info("Regionalização em lote: %d nós alterados (%d sem siteid) em %.3fs",
+                   moved, len(self.nodes_without_siteid), time.perf_counter() - start_time)
+        return moved
+
     def _apply_geodata(self, node_name, node_data):
         """Aplica dados geográficos (coordenadas) se disponíveis, sem alterar a camada"""
         if not self.localidades_map:
             return
             
-        siteid = node_data.get('siteid', '')
-        if siteid and siteid in self.localidades_map:
-            loc_data = self.localidades_map[siteid]
+        siteid = node_data.siteid
+        loc_data = self.localidades_map.get(siteid) if siteid else None
+        if loc_data is not None:
             # Apenas atribui as coordenadas
-            node_data['coordenadas'] = (loc_data['latitude'], loc_data['longitude'])
+            node_data.coordenadas = (loc_data['latitude'], loc_data['longitude'])
             logger.debug(f"Dados geográficos aplicados a {node_name} via siteid: {siteid}")
         else:
             # Marcar para processamento especial no layout geográfico
-            node_data['coordenadas'] = None
+            node_data.coordenadas = None
             logger.debug(f"Sem dados geográficos para {node_name}")
 
     def _process_elemento_row(self, row):
         origem = row['elemento'].strip()
         if not origem:
             return
+        if self.ingest_filter is not None and (origem in self._excluded_nodes or self._excluded_by_name(origem)):
+            return
             
         # Usar 'camada' em vez de 'tipo'
-        camada_original = row.get('camada', '').strip()
+        camada_original = sys.intern(row.get('camada', '').strip())
         nivel_str = row.get('nivel', '').strip()
         
-        siteid = row.get('siteid', '').strip()  # Novo campo
+        siteid = sys.intern(row.get('siteid', '').strip())  # Novo campo
         if self.ignore_optional:
             origemcor = None  # Ignorar cor definida no CSV
         else:
-            origemcor = row.get('cor', '').strip()
+            origemcor = xml_escape(row.get('cor', '').strip())
         
         nivel = None
         if nivel_str:
@@ -1573,36 +3919,29 @@ class TopologyGenerator:
         # CORREÇÃO PRINCIPAL: NÃO aplicar regionalização aqui
         # A regionalização será aplicada posteriormente no fluxo
         camada_final = camada_original
-        coordenadas = None
         
         apelido = row.get('apelido', '').strip()  # Novo campo
         
         # Atualizar dados do nó
-        if origem not in self.nodes:
-            self.nodes[origem] = {
-                'camada': camada_final,
-                'nivel': nivel,
-                'cor': origemcor if origemcor else None,
-                'coordenadas': coordenadas,
-                'regionalized': False,
-                'siteid': siteid,
-                'apelido': apelido  # Novo campo
-            }
+        node_data = self.nodes.get(origem)
+        if node_data is None:
+            node_data = self._new_node(origem, camada_final, nivel, origemcor if origemcor else None, siteid, apelido)
         else:
-            self.nodes[origem]['apelido'] = apelido  # Atualizar apelido
-            self.nodes[origem]['nivel'] = nivel
+            node_data.apelido = apelido  # Atualizar apelido
+            node_data.rotulo = xml_escape(apelido or origem)
+            node_data.nivel = nivel
             if origemcor:
-                self.nodes[origem]['cor'] = origemcor
-            self.nodes[origem]['siteid'] = siteid  # Novo campo
+                node_data.cor = origemcor
+            node_data.siteid = siteid  # Novo campo
 
         # Aplicar dados geográficos independentemente da regionalização
-        self._apply_geodata(origem, self.nodes[origem])
+        self._apply_geodata(origem, node_data)
         
         # Aplicar regionalização APENAS se flag ativa
         if self.regionalization:
-            self._apply_regionalization(origem, self.nodes[origem])
+            self._apply_regionalization(origem, node_data)
         
-        self._register_node(origem, nivel)
+        self._register_node(node_data, nivel)
         logger.info(f"Processado: {origem} | Camada: {camada_final} | Nível: {nivel} | Cor: {origemcor} | SiteID: {siteid}")
         if self.ignore_optional and row.get('cor'):
             logger.debug("Ignorando cor definida para %s (opção -d)", origem)
@@ -1612,47 +3951,149 @@ class TopologyGenerator:
             logger.info(f"Abrindo arquivo: {self.conexoes_file}")
             
             # Adicionar log de debug para verificar caminho real
-            if not os.path.exists(self.conexoes_file):
+            if self.conexoes_records is None and not os.path.exists(self.conexoes_file):
                 logger.error(f"Arquivo não encontrado: {self.conexoes_file}")
                 return False        
         
-            with open(self.conexoes_file, 'r', encoding=self.encoding_conexoes, errors='replace') as f:
-                reader = csv.DictReader(f, delimiter=';')
-                row_count = 0
-                for row in reader:
-                    row_count += 1
-                    origem = row['ponta-a'].strip()
-                    destino = row['ponta-b'].strip()
-                    
-                    for node in [origem, destino]:
-                        if node not in self.nodes:
-                            camada, nivel = self._determine_layer_by_prefix(node)
-                            node_data = {
-                                'camada': camada,
-                                'nivel': nivel,
-                                'cor': None,
-                                'coordenadas': None,
-                                'regionalized': False,  # Novo campo
-                                'siteid': ''            # Novo campo
-                            }
-                            self.nodes[node] = node_data
-                            # Aplicar dados geográficos
-                            self._apply_geodata(node, node_data)
-                            # Registrar o nó criado
-                            self._register_node(node, nivel)
-                            
-                        # Aplicar regionalização se ativa (apenas uma vez)
-                        if self.regionalization:
-                            self._apply_regionalization(node, self.nodes[node])
-                                
-                    self._process_conexao_row(row)
+            with self._conexoes_reader() as reader:
+                
+                # Resolver posições das colunas uma única vez
+                header = next(reader, None) or []
+                logger.debug("Cabeçalhos detectados: %s", header)
+                columns = {name: idx for idx, name in enumerate(header)}
+                if 'ponta-a' not in columns or 'ponta-b' not in columns:
+                    logger.error("Cabeçalhos 'ponta-a'/'ponta-b' não encontrados em %s", self.conexoes_file)
+                    return False
+                
+                width = len(header)
+                idx_texto = columns.get('textoconexao')
+                get_ends = itemgetter(columns['ponta-a'], columns['ponta-b'])
+                get_style, resolve_style = self._conexao_style_reader(columns)
+                styles = {}  # Estilos já resolvidos (valores brutos -> tupla compartilhada)
+                
+                nodes = self.nodes
+                excluded = self._excluded_nodes  # Nós descartados pelo filtro (-f)
+                anchored = self._filter_anchored
+                # Com regionalização a camada da conexão depende da camada final da
+                # origem: ela é definida após a regionalização em lote
+                regionalization = bool(self.regionalization and self.localidades_map)
+                append_connection = self.connections.append
+                connection_layers = self.connection_layers
+                
+                # Leitura agregada: uma conexão por (origem, destino, estilo), com contagem.
+                # A memória passa a depender das conexões distintas, não das linhas do arquivo.
+                # Com -o a a chave é o par de nós (sem direção e sem estilo) e o registro
+                # fica com a maior espessura entre as conexões do par.
+                collapse = self.collapse_links
+                aggregate = self.aggregate_links or collapse
+                aggregated = {}  # (origem, destino, estilo) ou par de nós -> ConnectionRecord
+                widened = {}  # (estilo atual, estilo da linha) -> estilo com a maior espessura
+                labels = {}  # ConnectionRecord -> rótulos distintos (até AGGREGATED_LABEL_LIMIT)
+                overflow = defaultdict(int)  # ConnectionRecord -> linhas com rótulo além do limite
+                
+                # Carga em massa: o coletor de ciclos não tem o que liberar aqui
+                gc_was_enabled = gc.isenabled()
+                gc.disable()
+                if self.elementos_index is not None:
+                    self._elementos_handle = open(self.elementos_index.path, 'rb')
+                try:
+                    row_count = 0
+                    for row in reader:
+                        if not row:  # Linhas em branco (mesmo comportamento do DictReader)
+                            continue
+                        row_count += 1
+                        if len(row) < width:
+                            row.extend([''] * (width - len(row)))
+                        origem, destino = get_ends(row)
+                        origem = origem.strip()
+                        destino = destino.strip()
+                        if not origem or not destino:
+                            continue
+                        
+                        origem_data = nodes.get(origem) or (None if origem in excluded else self._create_node(origem))
+                        destino_data = nodes.get(destino) or (None if destino in excluded else self._create_node(destino))
+                        if origem_data is None or destino_data is None:
+                            # Linha descartada pelo filtro: a ponta mantida não é órfã
+                            if origem_data is not None:
+                                anchored.add(origem_data.idx)
+                            elif destino_data is not None:
+                                anchored.add(destino_data.idx)
+                            continue
+
+                        raw_style = get_style(row)
+                        style = styles.get(raw_style)
+                        if style is None:
+                            style = styles[raw_style] = resolve_style(raw_style)
+                        
+                        texto_conexao = row[idx_texto].strip() if idx_texto is not None else ''
+                        if aggregate:
+                            if not collapse:
+                                key = (origem_data.idx, destino_data.idx, style)
+                            elif origem_data.idx <= destino_data.idx:
+                                key = (origem_data.idx, destino_data.idx)
+                            else:
+                                key = (destino_data.idx, origem_data.idx)
+                            conn = aggregated.get(key)
+                            if conn is not None:
+                                conn.count += 1
+                                if conn.estilo is not style:
+                                    widest = widened.get((conn.estilo, style))
+                                    if widest is None:
+                                        widest = widened[(conn.estilo, style)] = self._widest_style(conn.estilo, style)
+                                    conn.estilo = widest
+                                if texto_conexao:
+                                    conn_labels = labels.setdefault(conn, [])
+                                    if texto_conexao not in conn_labels:
+                                        if len(conn_labels) < AGGREGATED_LABEL_LIMIT:
+                                            conn_labels.append(texto_conexao)
+                                        else:
+                                            overflow[conn] += 1
+                                continue
+                        
+                        if regionalization:
+                            camada_conexao = None
+                        else:
+                            camada = origem_data.camada
+                            camada_conexao = connection_layers.get(camada) or self._connection_layer(camada)
+                        conn = ConnectionRecord(
+                            origem_data.idx, destino_data.idx, camada_conexao, texto_conexao, style
+                        )
+                        append_connection(conn)
+                        if aggregate:
+                            aggregated[key] = conn
+                            if texto_conexao:
+                                labels[conn] = [texto_conexao]
+                finally:
+                    if gc_was_enabled:
+                        gc.enable()
+                    if self._elementos_handle is not None:
+                        self._elementos_handle.close()
+                        self._elementos_handle = None
                 
-                logger.info("Processadas %d linhas de conexões", row_count)
+                logger.info("Processadas %d linhas de conexões (%d estilos distintos)", row_count, len(styles))
+                if self.elementos_index is not None:
+                    logger.info("Elementos materializados a partir do índice: %d", len(self._element_rank))
+                    self._restore_element_order()
+                if regionalization:
+                    self._apply_regionalization_bulk()
+                    self._assign_connection_layers()
+                if self.ingest_pruning:
+                    self._finish_ingest_filter()
+                if aggregate:
+                    self._merge_aggregated_labels(labels, overflow)
+                    if collapse:
+                        self._label_collapsed_links()
+                    logger.info("Leitura agregada: %d linhas representadas por %d conexões distintas",
+                               sum(conn.count for conn in self.connections), len(self.connections))
+                log_memory_usage("Após leitura de conexões")
+                self._build_adjacency()
                 self._validate_data()
+                if self.focus_nodes and not self.apply_focus():
+                    return False
                 
                 # Verificação de dados geográficos
                 self.has_geographic_data = any(
-                    data.get('coordenadas') is not None 
+                    data.coordenadas is not None 
                     for data in self.nodes.values()
                 )
                 
@@ -1660,102 +4101,204 @@ class TopologyGenerator:
                            "Sim" if self.has_geographic_data else "Não")
                 return True
                 
-            # VERIFICAR CABEÇALHOS (novo código)
-            first_row = next(reader, None)
-            if first_row:
-                logger.debug("Cabeçalhos detectados: %s", list(first_row.keys()))
-                
         except Exception as e:
             logger.error("Falha na leitura de conexões: %s", str(e), exc_info=True)
             return False
 
+    @contextmanager
+    def _conexoes_reader(self):
+        """Linhas do conexoes.csv (csv.reader) ou dos registros em memória, cabeçalho primeiro"""
+        if self.conexoes_records is not None:
+            yield record_rows(self.conexoes_records)
+            return
+        with open(self.conexoes_file, 'r', encoding=self.encoding_conexoes, errors='replace') as f:
+            yield csv.reader(f, delimiter=';')
+
+    def _merge_aggregated_labels(self, labels, overflow):
+        """Concatena os rótulos distintos das conexões agregadas (-a)"""
+        for conn, conn_labels in labels.items():
+            texto = AGGREGATED_LABEL_SEPARATOR.join(conn_labels)
+            if conn in overflow:
+                texto += f" (+{overflow[conn]})"
+            conn.texto_conexao = texto
+            conn.rotulo = xml_escape(texto)
+
+    @staticmethod
+    def _widest_style(current, candidate):
+        """Estilo current com a maior espessura (strokeWidth) entre current e candidate"""
+        def width(style):
+            try:
+                return float(style[0])
+            except (TypeError, ValueError):
+                return 0.0
+        if width(candidate) > width(current):
+            return (candidate[0],) + current[1:]
+        return current
+
+    def _label_collapsed_links(self):
+        """Acrescenta a quantidade de conexões ao rótulo das ligações agrupadas (-o a)"""
+        for conn in self.connections:
+            if conn.count > 1:
+                conn.texto_conexao = (f"{conn.texto_conexao} ({conn.count}x)" if conn.texto_conexao
+                                      else f"{conn.count}x")
+                conn.rotulo = xml_escape(conn.texto_conexao)
+
+    def _conexao_style_reader(self, columns):
+        """
+        Monta as funções de leitura das colunas de estilo do conexoes.csv
+        
+        Args:
+            columns (dict): Mapeamento nome da coluna -> posição
+            
+        Returns:
+            tuple: (extrai valores brutos da linha, converte valores brutos em
+                    tupla strokeWidth, strokeColor, dashed, fontStyle, fontSize)
+        """
+        if self.ignore_optional:
+            # Opção -d: estilo fixo, colunas do CSV desprezadas
+            fixed = (None, None, '0', '1', '14')
+            return (lambda row: ()), (lambda raw: fixed)
+        
+        present = [columns[name] for name, _ in CONEXAO_STYLE_COLUMNS if name in columns]
+        if len(present) > 1:
+            get_style = itemgetter(*present)
+        elif present:
+            idx = present[0]
+            get_style = lambda row: (row[idx],)
+        else:
+            get_style = lambda row: ()
+        
+        def resolve_style(raw):
+            values = iter(raw)
+            style = []
+            for name, default in CONEXAO_STYLE_COLUMNS:
+                if name not in columns:
+                    style.append(default)
+                    continue
+                value = next(values)
+                if default is None:
+                    style.append(xml_escape(value.strip()) if value else None)
+                else:
+                    style.append(xml_escape(value.strip()))
+            return tuple(style)
+        
+        return get_style, resolve_style
+
     def _validate_colors(self):
         """Verifica consistência de cores e reporta divergências"""
         for node, colors in self.node_colors.items():
             if len(set(colors)) > 1:
                 logger.warning("Divergência de cores para %s: %s", node, ', '.join(set(colors)))
                 if node in self.nodes:
-                    self.nodes[node]['cor'] = colors[0]  # Usar primeira cor
+                    self.nodes[node].cor = colors[0]  # Usar primeira cor
+
+    def _new_node(self, node_name, camada, nivel, cor=None, siteid='', apelido=''):
+        """Cria o registro de um nó com o próximo índice inteiro livre"""
+        node_data = NodeRecord(len(self.node_list), node_name, camada, nivel, cor, siteid, apelido)
+        self.nodes[node_name] = node_data
+        self.node_list.append(node_data)
+        return node_data
+
+    def _register_layer(self, camada):
+        """Atribui o id da camada no draw.io e guarda o nome escapado para XML"""
+        self.layer_ids[camada] = stable_id(f"camada\x1f{camada}")
+        self.layer_labels[camada] = xml_escape(camada)
 
-    def _register_node(self, node_name, nivel):
+    def _register_node(self, node_data, nivel):
         """Registra nó nas estruturas internas"""
-        if node_name not in self.node_ids:
-            self.node_ids[node_name] = str(uuid.uuid4())
-            logger.debug(f"Registrado nó: {node_name} | ID: {self.node_ids[node_name]}")
-            
-        node_data = self.nodes[node_name]
+        if node_data.cell_id is None:
+            node_data.cell_id = stable_id(f"no\x1f{node_data.nome}")
+            logger.debug(f"Registrado nó: {node_data.nome} | ID: {node_data.cell_id}")
         
-        if node_data['camada'] not in self.layer_ids:
-            self.layer_ids[node_data['camada']] = str(uuid.uuid4())
-            
-        if node_name not in self.layers[node_data['camada']]:
-            self.layers[node_data['camada']].append(node_name)
+        camada = node_data.camada
+        if camada not in self.layer_ids:
+            self._register_layer(camada)
             
-        if node_name not in self.circular_alignments[nivel]:
-            self.circular_alignments[nivel].append(node_name)
+        self.layers[camada].add(node_data.idx)
+        self.circular_alignments[nivel].add(node_data.idx)
 
-    def _process_conexao_row(self, row):
-        """Processa uma linha de conexão com chaves normalizadas"""
-        # Alteração crítica: manter hífens nos nomes das colunas
-        normalized_row = {k.lower().replace(' ', ''): v for k, v in row.items()}
-        
-        # Usar nomes originais sem remover hífens
-        origem = normalized_row.get('ponta-a', '').strip()  # Mantém o hífen!
-        destino = normalized_row.get('ponta-b', '').strip()  # Mantém o hífen!
-        
-        if not origem or not destino:
-            return
-            
-        # Criar camada específica para conexões
-        camada_original = self.nodes[origem]['camada']
-        camada_conexao = f"{camada_original}_CNX"
+    def _create_node(self, node):
+        """
+        Cria nó referenciado pelo conexoes.csv: pelo elementos.csv (índice) ou pelo prefixo
 
-        # Se a opção estiver ativa, ignorar propriedades opcionais
-        if self.ignore_optional:
-            conn_data = {
-                'origem': origem,
-                'destino': destino,
-                'camada': camada_conexao,
-                'texto_conexao': row.get('textoconexao', '').strip(),
-                'strokeWidth': None,
-                'strokeColor': None,
-                'dashed': '0',
-                'fontStyle': '1',
-                'fontSize': '14'
-            }
-        else:
-            conn_data = {
-                'origem': origem,
-                'destino': destino,
-                'camada': camada_conexao,
-                'texto_conexao': row.get('textoconexao', '').strip(),
-                'strokeWidth': row.get('strokeWidth', '').strip() if 'strokeWidth' in row and row['strokeWidth'] else None,
-                'strokeColor': row.get('strokeColor', '').strip() if 'strokeColor' in row and row['strokeColor'] else None,
-                'dashed': row.get('dashed', '0').strip() if 'dashed' in row else '0',
-                'fontStyle': row.get('fontStyle', '1').strip() if 'fontStyle' in row else '1',
-                'fontSize': row.get('fontSize', '14').strip() if 'fontSize' in row else '14'
-            }
-        
-        self.connections.append(conn_data)
-        
-        # Registrar camada de conexões se nova
-        if camada_conexao not in self.layer_ids:
-            self.layer_ids[camada_conexao] = str(uuid.uuid4())
-        
-        if camada_conexao not in self.layers:
-            self.layers[camada_conexao] = []
-        if self.ignore_optional and any(row.get(k) for k in ['strokeWidth', 'strokeColor', 'dashed']):
-            logger.debug("Ignorando propriedades de conexão para %s-%s (opção -d)", origem, destino)            
+        Returns:
+            NodeRecord | None: O nó criado, ou None se descartado pelo filtro
+        """
+        if self.ingest_filter is not None and self._excluded_by_name(node):
+            return None
+        index = self.elementos_index
+        if index is not None and node in index:
+            mark = len(self.nodes_without_siteid)
+            for row in index.read_rows(self._elementos_handle, node):
+                self._process_elemento_row(row)
+            node_data = self.nodes.get(node)
+            if node_data is not None and self.ingest_pruning and self._excluded_by_node(node_data):
+                del self.nodes_without_siteid[mark:]
+                return None
+            # Registros em nodes_without_siteid feitos pela linha do elemento vão
+            # para o início da lista, como na leitura completa
+            self._element_sem_siteid.extend(self.nodes_without_siteid[mark:])
+            del self.nodes_without_siteid[mark:]
+            if node_data is not None:
+                self._element_rank[node_data.idx] = index.first_offset(node)
+                return node_data
+        node_data = self._create_node_from_prefix(node)
+        if self.ingest_pruning and self._excluded_by_node(node_data):
+            return None
+        return node_data
+
+    def _restore_element_order(self):
+        """
+        Reordena os nós como na leitura completa: primeiro os do elementos.csv na
+        ordem do arquivo, depois os criados por prefixo na ordem das conexões
+        """
+        rank = self._element_rank
+        order_key = lambda data: (0, rank[data.idx]) if data.idx in rank else (1, data.idx)
+        self.nodes = {data.nome: data for data in sorted(self.nodes.values(), key=order_key)}
+        if self._element_sem_siteid:
+            self._element_sem_siteid.sort(key=lambda name: order_key(self.nodes[name]))
+            self.nodes_without_siteid[:0] = self._element_sem_siteid
+            self._element_sem_siteid = []
+
+    def _create_node_from_prefix(self, node):
+        """Cria nó presente apenas no conexoes.csv, com camada/nível inferidos do prefixo"""
+        camada, nivel = self._determine_layer_by_prefix(node)
+        node_data = self._new_node(node, camada, nivel)
+        # Aplicar dados geográficos
+        self._apply_geodata(node, node_data)
+        # Registrar o nó criado
+        self._register_node(node_data, nivel)
+        return node_data
+
+    def _connection_layer(self, camada):
+        """Retorna (registrando se nova) a camada de conexões associada a uma camada de nós"""
+        camada_conexao = self.connection_layers.get(camada)
+        if camada_conexao is None:
+            camada_conexao = self.connection_layers[camada] = camada + "_CNX"
+            if camada_conexao not in self.layer_ids:
+                self._register_layer(camada_conexao)
+                self.layers[camada_conexao] = set()
+        return camada_conexao
+
+    def _assign_connection_layers(self):
+        """Define a camada de cada conexão a partir da camada final do nó de origem"""
+        node_list = self.node_list
+        by_origem = {}  # índice da origem -> camada de conexões
+        for conn in self.connections:
+            camada_conexao = by_origem.get(conn.origem)
+            if camada_conexao is None:
+                camada = node_list[conn.origem].camada
+                camada_conexao = by_origem[conn.origem] = (
+                    self.connection_layers.get(camada) or self._connection_layer(camada)
+                )
+            conn.camada = camada_conexao
 
     def _validate_data(self):
         """Valida dados e trata nós sem conexões, listando os nós removidos"""
-        all_nodes = set(self.nodes.keys())
-        connected_nodes = set()
-        for conn in self.connections:
-            connected_nodes.add(conn['origem'])
-            connected_nodes.add(conn['destino'])
-            
-        orphan_nodes = all_nodes - connected_nodes
+        degree = self.adjacency.degree
+        anchored = self._filter_anchored
+        orphan_nodes = [node for node, data in self.nodes.items()
+                        if not degree[data.idx] and data.idx not in anchored]
         if orphan_nodes:
             orphan_list = sorted(orphan_nodes)
             orphan_count = len(orphan_list)
@@ -1780,37 +4323,80 @@ class TopologyGenerator:
                 )
                 # Remover nós órfãos
                 for node in orphan_list:
-                    if node in self.nodes:
-                        node_data = self.nodes[node]
-                        camada = node_data['camada']
-                        nivel = node_data['nivel']
-                        
-                        if camada in self.layers and node in self.layers[camada]:
-                            self.layers[camada].remove(node)
-                        
-                        if nivel in self.circular_alignments and node in self.circular_alignments[nivel]:
-                            self.circular_alignments[nivel].remove(node)
-                        
-                        del self.nodes[node]
-                    
-                    # REMOVER DA LISTA DE NÓS SEM SITEID
-                    if node in self.nodes_without_siteid:
-                        self.nodes_without_siteid.remove(node)
-                    
-                    if node in self.node_ids:
-                        del self.node_ids[node]
-                    
-                    if node in self.node_colors:
-                        del self.node_colors[node]
+                    self._remove_node(self.nodes[node])
+                
+                # REMOVER DA LISTA DE NÓS SEM SITEID
+                self.nodes_without_siteid = [n for n in self.nodes_without_siteid if n in self.nodes]
         else:
             logger.info("Nenhum nó sem conexões encontrado")
 
+    def _layout_fingerprint(self, layout_type):
+        """
+        Impressão digital das entradas de um layout
+        
+        Cobre o config (exceto seções só de estilo), os nós em ordem de índice
+        com camada, nível, siteid e coordenadas, as conexões (pontas e
+        multiplicidade) e o recorte geográfico. Rótulos e estilos de conexão
+        não entram: mudá-los não exige recalcular posições.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        layout_config = {key: value for key, value in self.config.items()
+                         if key not in LAYOUT_COSMETIC_CONFIG_KEYS}
+        digest.update(json.dumps([layout_type, layout_config, self.geo_crop.text if self.geo_crop else None],
+                                 sort_keys=True, default=str).encode('utf-8'))
+        without_siteid = set(self.nodes_without_siteid)
+        digest.update('\x1e'.join(
+            '' if data is None else
+            f"{data.nome}\x1f{data.camada}\x1f{data.nivel}\x1f{data.siteid}\x1f{data.coordenadas}"
+            f"\x1f{data.nome in without_siteid}"
+            for data in self.node_list
+        ).encode('utf-8'))
+        adjacency = self.adjacency
+        for array in (adjacency.src, adjacency.dst, adjacency.weight):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()
+
+    def calculate_positions(self, layout_type):
+        """
+        Calcula as posições do layout, reaproveitando o cache quando ativo
+        
+        Com o cache ativo (enable_layout_cache), um layout cujas entradas não
+        mudaram desde a última geração no processo (ver _layout_fingerprint)
+        é devolvido sem recálculo.
+        
+        Args:
+            layout_type (str): circular, organico, geografico ou hierarquico
+            
+        Returns:
+            dict: Índice do nó -> (x, y)
+        """
+        calculators = {
+            'circular': self.calculate_circular_positions,
+            'organico': self.calculate_organico_positions,
+            'geografico': self.calculate_geographic_positions,
+            'hierarquico': self.calculate_hierarchical_positions
+        }
+        if _layout_cache is None:
+            return calculators[layout_type]()
+
+        fingerprint = self._layout_fingerprint(layout_type)
+        positions = _layout_cache.get(fingerprint)
+        if positions is not None:
+            logger.info("Layout %s reaproveitado do cache (grafo e parâmetros inalterados)", layout_type)
+            return positions
+        positions = calculators[layout_type]()
+        if positions:
+            if len(_layout_cache) >= LAYOUT_CACHE_SIZE:
+                del _layout_cache[next(iter(_layout_cache))]  # Remove o mais antigo
+            _layout_cache[fingerprint] = positions
+        return positions
+
     def calculate_circular_positions(self):
         """
         Calcula posições para layout circular baseado em níveis
         
         Returns:
-            dict: Mapeamento nó -> (x, y)
+            dict: Mapeamento índice do nó -> (x, y)
         """
         start_time = time.perf_counter()
         logger.info("Calculando layout circular...")
@@ -1822,9 +4408,8 @@ class TopologyGenerator:
         
         # Agrupar nós por nível
         level_nodes = defaultdict(list)
-        for node, data in self.nodes.items():
-            level = data['nivel']
-            level_nodes[level].append(node)
+        for data in self.nodes.values():
+            level_nodes[data.nivel].append(data.idx)
         
         levels = sorted(level_nodes.keys())
         min_level = min(levels) if levels else 1
@@ -1844,15 +4429,13 @@ class TopologyGenerator:
                 positions[node] = (x, y)
         
         # Tratar nós sem nível definido
-        placed_nodes = set(positions.keys())
-        all_defined_nodes = set(self.nodes.keys())
-        missing_nodes = all_defined_nodes - placed_nodes
+        missing_nodes = [node for node, data in self.nodes.items() if data.idx not in positions]
         
         if missing_nodes:
             logger.warning("%d nós sem nível, posicionando no nível %d", len(missing_nodes), max_level+1)
             level = max_level + 1
             radius = base_radius + (level - min_level) * radius_increment
-            missing_list = sorted(missing_nodes)
+            missing_list = [self.nodes[node].idx for node in sorted(missing_nodes)]
             angle_step = 2 * math.pi / len(missing_list)
             
             for idx, node in enumerate(missing_list):
@@ -1866,18 +4449,52 @@ class TopologyGenerator:
                    elapsed, len(self.circular_alignments))
         return positions
 
+    def organic_graph(self):
+        """
+        Grafo networkx (nós por índice, uma aresta por par) usado pelo layout orgânico
+        
+        Construído uma única vez a partir da adjacência e reaproveitado pelo
+        planejador e pelos layouts; trocar a adjacência ou remover um nó o
+        descarta. Quem o recebe não deve alterá-lo.
+        """
+        if self._organic_graph is None:
+            G = nx.Graph()
+            G.add_nodes_from(data.idx for data in self.nodes.values())
+            G.add_edges_from(self.adjacency.unique_edges())
+            self._organic_graph = G
+        return self._organic_graph
+
+    def organic_components(self):
+        """
+        Componentes conexos do grafo orgânico, do maior para o menor
+        
+        Calculados uma vez e reaproveitados pelo planejador e pelo layout
+        (descartados junto com organic_graph).
+        
+        Returns:
+            list: Listas de nós, cada uma na ordem do grafo
+        """
+        if self._organic_components is None:
+            G = self.organic_graph()
+            order = {node: i for i, node in enumerate(G)}
+            components = [sorted(component, key=order.__getitem__) for component in nx.connected_components(G)]
+            components.sort(key=lambda nodes: (-len(nodes), order[nodes[0]]))
+            self._organic_components = components
+        return self._organic_components
+
     def calculate_organico_positions(self):
         """
         Calcula posições para layout orgânico usando algoritmo de força
         
+        Grafos com mais de um componente conexo são calculados por componente
+        e empacotados (ver _packed_organico_positions).
+        
         Returns:
-            dict: Mapeamento nó -> (x, y)
+            dict: Mapeamento índice do nó -> (x, y)
         """
         start_time = time.perf_counter()
         logger.info("Calculando layout orgânico...")
-        G = nx.Graph()
-        G.add_nodes_from(self.nodes.keys())
-        G.add_edges_from([(c['origem'], c['destino']) for c in self.connections])
+        G = self.organic_graph()
         
         num_nodes = len(G.nodes)
         if num_nodes == 0:
@@ -1885,35 +4502,36 @@ class TopologyGenerator:
             return {}
         
         cfg = self.config.get("ORGANIC_LAYOUT", {})
-        k_base = cfg.get("k_base", 0.25)
-        k_min = cfg.get("k_min", 0.8)
-        k_max = cfg.get("k_max", 2.5)
-        iterations_per_node = cfg.get("iterations_per_node", 10)
-        iterations_min = cfg.get("iterations_min", 500)
-        iterations_max = cfg.get("iterations_max", 2000)
-        scale_per_node = cfg.get("scale_per_node", 0.5)
-        scale_min = cfg.get("scale_min", 5.0)
-        scale_max = cfg.get("scale_max", 30.0)
         base_width = cfg.get("base_width", 1400)
         base_height = cfg.get("base_height", 1000)
         
+        components = self.organic_components()
+        if len(components) > 1:
+            result = self._packed_organico_positions(G, components, cfg)
+            elapsed = time.perf_counter() - start_time
+            logger.debug("⚙️ Layout orgânico calculado em %.3fs | Nós: %d | Arestas: %d | Componentes: %d",
+                       elapsed, len(G.nodes), len(G.edges), len(components))
+            return result
+        
         # Calcular parâmetros dinâmicos baseados na rede
-        k_value = max(k_min, min(k_max, k_base * math.sqrt(num_nodes)))
-        iterations_value = max(iterations_min, min(iterations_max, num_nodes * iterations_per_node))
-        scale_value = max(scale_min, min(scale_max, num_nodes * scale_per_node))
+        k_value, iterations_value, scale_value = organic_parameters(cfg, num_nodes)
         
         logger.info("Parâmetros orgânicos: k=%.2f, iterações=%d, escala=%.2f", 
                    k_value, iterations_value, scale_value)
         
-        # Calcular layout com networkx
-        pos = nx.spring_layout(
-            G,
-            k=k_value,
-            iterations=iterations_value,
-            seed=42,  # Semente fixa para reprodutibilidade
-            scale=scale_value,
-            threshold=0.0001
-        )
+        # Calcular layout com networkx (na amostra, se o planejador assim decidiu)
+        sample_nodes = cfg.get("sample_nodes")
+        if sample_nodes and num_nodes > sample_nodes:
+            pos = self._sampled_spring_layout(G, sample_nodes, k_value, iterations_value, scale_value)
+        else:
+            pos = nx.spring_layout(
+                G,
+                k=k_value,
+                iterations=iterations_value,
+                seed=42,  # Semente fixa para reprodutibilidade
+                scale=scale_value,
+                threshold=0.0001
+            )
         
         # Normalizar posições
         all_x = [x for x, _ in pos.values()]
@@ -1953,6 +4571,147 @@ class TopologyGenerator:
                    elapsed, len(G.nodes), len(G.edges))
         return result
 
+    def _packed_organico_positions(self, G, components, cfg):
+        """
+        Layout de força por componente conexo, com os componentes empacotados lado a lado
+        
+        Cada componente é calculado isoladamente com os parâmetros do seu
+        tamanho (com parallel_workers > 0, os de custo estimado acima de
+        ORGANIC_PARALLEL_MIN_SECONDS em até parallel_workers processos
+        separados), escalado como um grafo do seu
+        tamanho (base_width x log n, limitado a component_spacing px por nó nos
+        componentes pequenos) e posicionado por pack_rectangles. Com o cache ativo, um
+        componente com a mesma estrutura, camadas e parâmetros reaproveita as
+        posições, mesmo que outro componente tenha mudado.
+        
+        Args:
+            G (nx.Graph): Grafo do layout orgânico
+            components (list): Componentes conexos (ver organic_components)
+            cfg (dict): Seção ORGANIC_LAYOUT do config
+            
+        Returns:
+            dict: Mapeamento índice do nó -> (x, y)
+        """
+        sample_nodes = cfg.get("sample_nodes")
+        spacing = cfg.get("component_spacing", ORGANIC_COMPONENT_SPACING)
+        gap = cfg.get("component_gap", ORGANIC_COMPONENT_GAP)
+        node_list = self.node_list
+        layouts = [None] * len(components)
+        pending = []  # (componente, nós, arestas locais, parâmetros, impressão digital)
+        cached = 0
+        
+        for i, nodes in enumerate(components):
+            if len(nodes) == 1:
+                layouts[i] = np.zeros((1, 2))
+                continue
+            local = {node: j for j, node in enumerate(nodes)}
+            edges = sorted((local[u], local[v]) for u in nodes for v in G[u] if local[u] < local[v])
+            params = organic_parameters(cfg, len(nodes))
+            sampled = bool(sample_nodes) and len(nodes) > sample_nodes
+            fingerprint = None
+            if _component_cache is not None:
+                layers = [node_list[node].camada for node in nodes]
+                fingerprint = component_fingerprint(len(nodes), edges, layers,
+                                                    list(params) + [sample_nodes if sampled else None])
+                if fingerprint in _component_cache:
+                    layouts[i] = _component_cache[fingerprint]
+                    cached += 1
+                    continue
+            if sampled:
+                pos = self._sampled_spring_layout(G.subgraph(nodes), sample_nodes, *params)
+                layouts[i] = np.array([pos[node] for node in nodes], dtype=float)
+                cache_component(fingerprint, layouts[i])
+            else:
+                pending.append((i, len(nodes), edges, params, fingerprint))
+        
+        logger.info("Layout orgânico por componentes: %d componentes (maior: %d nós, isolados: %d, em cache: %d)",
+                   len(components), len(components[0]), sum(1 for nodes in components if len(nodes) == 1), cached)
+        
+        # Componentes grandes em paralelo, se pedido (workers do --daemon não podem criar processos)
+        large = [job for job in pending
+                 if ORGANIC_PAIR_SECONDS * job[1] ** 2 * job[3][1] >= ORGANIC_PARALLEL_MIN_SECONDS]
+        workers = min(len(large), cfg.get("parallel_workers", 0), os.cpu_count() or 1)
+        pool = None
+        futures = {}
+        if workers > 1 and not multiprocessing.current_process().daemon:
+            logger.info("Calculando %d componentes grandes em %d processos", len(large), workers)
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            futures = {i: pool.submit(spring_component, size, edges, *params)
+                       for i, size, edges, params, _ in large}
+        try:
+            for i, size, edges, params, fingerprint in pending:
+                layouts[i] = futures[i].result() if i in futures else spring_component(size, edges, *params)
+                cache_component(fingerprint, layouts[i])
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        
+        # Escalar cada componente para o seu retângulo (como o grafo inteiro seria) e empacotar
+        base_size = np.array([cfg.get("base_width", 1400), cfg.get("base_height", 1000)], dtype=float)
+        frames = []
+        sizes = []
+        for nodes, xy in zip(components, layouts):
+            size_factor = min(max(1.0, math.log(len(nodes) + 1)), spacing * len(nodes) / base_size[0])
+            target = base_size * size_factor
+            low = xy.min(axis=0)
+            extent = xy.max(axis=0) - low
+            factor = np.divide(target, extent, out=np.zeros(2), where=extent > 0)
+            frames.append((low, factor))
+            sizes.append(tuple((extent * factor).tolist()))
+        offsets = pack_rectangles(sizes, gap, base_size[0] / base_size[1])
+        
+        result = {}
+        for nodes, xy, (low, factor), offset in zip(components, layouts, frames, offsets):
+            placed = (xy - low) * factor + np.asarray(offset)
+            result.update(zip(nodes, map(tuple, placed.tolist())))
+        return {node: result[node] for node in G}
+
+    def _sampled_spring_layout(self, G, sample_nodes, k_value, iterations_value, scale_value):
+        """
+        Layout de força em uma amostra estratificada, com os demais nós no baricentro dos vizinhos
+        
+        Os nós fora da amostra são posicionados em ordem de distância (busca em
+        largura) até ela, cada um no baricentro dos vizinhos já posicionados com
+        um deslocamento pelo ângulo áureo; componentes sem nó amostrado ficam em
+        uma fila abaixo do desenho.
+        
+        Returns:
+            dict: Índice do nó -> (x, y) na escala do spring_layout
+        """
+        sample = sorted(stratified_sample(self, sample_nodes, G))
+        logger.info("Layout orgânico em amostra: %d de %d nós", len(sample), len(G))
+        pos = {node: tuple(xy) for node, xy in nx.spring_layout(
+            G.subgraph(sample),
+            k=k_value,
+            iterations=iterations_value,
+            seed=42,
+            scale=scale_value,
+            threshold=0.0001
+        ).items()}
+        
+        radius = scale_value / math.sqrt(len(sample))
+        queue = deque(sample)
+        placed_count = 0
+        while queue:
+            node = queue.popleft()
+            for neighbor in G[node]:
+                if neighbor in pos:
+                    continue
+                anchors = [pos[other] for other in G[neighbor] if other in pos]
+                angle = placed_count * GOLDEN_ANGLE
+                placed_count += 1
+                pos[neighbor] = (sum(x for x, _ in anchors) / len(anchors) + radius * math.cos(angle),
+                                 sum(y for _, y in anchors) / len(anchors) + radius * math.sin(angle))
+                queue.append(neighbor)
+        
+        unreached = [node for node in G if node not in pos]
+        if unreached:
+            row_y = max(y for _, y in pos.values()) + 2 * radius
+            min_x = min(x for x, _ in pos.values())
+            for i, node in enumerate(unreached):
+                pos[node] = (min_x + i * radius, row_y)
+        return pos
+
     def calculate_geographic_positions(self):
         """Versão corrigida com tratamento especial para SEM_SITEID"""
         start_time = time.perf_counter()
@@ -1961,55 +4720,43 @@ class TopologyGenerator:
         
         # FILTRAR APENAS NÓS QUE AINDA EXISTEM
         valid_nodes = {}
-        for node, data in list(self.nodes.items()):
-            if data.get('coordenadas') is not None:
-                valid_nodes[node] = data['coordenadas']
+        for data in self.nodes.values():
+            if data.coordenadas is not None:
+                valid_nodes[data.idx] = data.coordenadas
         
-        # FILTRAR NÓS SEM SITEID QUE AINDA EXISTEM
-        valid_nodes_without_siteid = [n for n in self.nodes_without_siteid if n in self.nodes]
+        # FILTRAR NÓS SEM COORDENADAS QUE AINDA EXISTEM: primeiro os da camada
+        # SEM_SITEID (regionalização), depois os demais sem siteid em localidades.csv
+        valid_nodes_without_siteid = [self.nodes[n].idx for n in self.nodes_without_siteid if n in self.nodes]
+        listed = set(valid_nodes_without_siteid)
+        valid_nodes_without_siteid.extend(data.idx for data in self.nodes.values()
+                                          if data.coordenadas is None and data.idx not in listed)
         
         # Se não houver nós com coordenadas, usar apenas os sem siteid
         if not valid_nodes and not valid_nodes_without_siteid:
             return {}
         
-        # ================================================
-        # TRATAMENTO ESPECIAL PARA ELEMENTOS SEM SITEID
-        # ================================================
-        # Calcular centro do canvas
+        # Calcular centro do canvas (âncora dos nós sem coordenadas e sem vizinhos posicionados)
         canvas_width = cfg.get("canvas_width", 5000)
         canvas_height = cfg.get("canvas_height", 5000)
-        center_x = canvas_width / 2
-        center_y = canvas_height / 2
-        
-        # Posicionar elementos SEM_SITEID em espiral no centro
-        sem_siteid_positions = {}
-        spiral_radius = 200
-        angle_step = 0.5
-        
-        # USAR APENAS NÓS VÁLIDOS
-        for idx, node in enumerate(valid_nodes_without_siteid):
-            angle = idx * angle_step
-            radius = spiral_radius + idx * 50  # Aumenta o raio a cada nó
-            
-            x = center_x + radius * math.cos(angle)
-            y = center_y + radius * math.sin(angle)
-            
-            sem_siteid_positions[node] = (x, y)
-            logger.info(f"Posicionando elemento sem siteid no centro: {node} em ({x:.1f}, {y:.1f})")
-        # ================================================
+        center = (canvas_width / 2, canvas_height / 2)
         
         # Se não houver nós com coordenadas, usar apenas os sem siteid
         if not valid_nodes:
-            return sem_siteid_positions
+            return self._place_unlocated_nodes(valid_nodes_without_siteid, {}, center, cfg)
         
         # Usar .values() para acessar as coordenadas diretamente
         coords = valid_nodes.values()
         
-        # Calcular bounding box
-        lats = [c[0] for c in coords]  # Corrigido!
-        lons = [c[1] for c in coords]  # Corrigido!
-        min_lat, max_lat = min(lats), max(lats)
-        min_lon, max_lon = min(lons), max(lons)
+        # Calcular bounding box (com recorte, o canvas corresponde à área recortada)
+        if self.geo_crop is not None:
+            crop = self.geo_crop
+            min_lat, max_lat = crop.lat_min, crop.lat_max
+            min_lon, max_lon = crop.lon_min, crop.lon_max
+        else:
+            lats = [c[0] for c in coords]  # Corrigido!
+            lons = [c[1] for c in coords]  # Corrigido!
+            min_lat, max_lat = min(lats), max(lats)
+            min_lon, max_lon = min(lons), max(lons)
         
         # Configurações
         margin = cfg["margin"]
@@ -2047,13 +4794,14 @@ class TopologyGenerator:
         logger.info("Aplicando prevenção de sobreposição...")
         node_sizes = {}
         for node in positions:
-            style = self._get_node_style(self.nodes[node])
+            style = self._get_node_style(self.node_list[node])
             node_sizes[node] = max(style["width"], style["height"])
         
         # Converter para lista para iterar
         nodes = list(positions.keys())
+        rng = random.Random(42)  # Semente fixa para reprodutibilidade
         changed = True
-        max_iterations = 20
+        max_iterations = cfg.get("overlap_iterations", 20)
         iter_count = 0
         
         while changed and iter_count < max_iterations:
@@ -2079,7 +4827,7 @@ class TopologyGenerator:
                         dy = y2 - y1
                         if dx == 0 and dy == 0:
                             # Caso raro de mesma posição
-                            angle = random.uniform(0, 2 * math.pi)
+                            angle = rng.uniform(0, 2 * math.pi)
                             dx = math.cos(angle)
                             dy = math.sin(angle)
                             distance = 1
@@ -2105,8 +4853,8 @@ class TopologyGenerator:
         logger.info(f"Prevenção de sobreposição concluída em {iter_count} iterações")
         # ================================================
         
-        # Combinar todas as posições
-        positions.update(sem_siteid_positions)   # Adiciona posições dos elementos sem siteid
+        # Combinar todas as posições (elementos sem coordenadas junto aos vizinhos já posicionados)
+        positions.update(self._place_unlocated_nodes(valid_nodes_without_siteid, positions, center, cfg))
         
         elapsed = time.perf_counter() - start_time
         logger.debug("⚙️ Layout geográfico calculado em %.3fs | Nós com coord: %d | Sem coord: %d", 
@@ -2114,6 +4862,74 @@ class TopologyGenerator:
         return positions
 
 
+    def _place_unlocated_nodes(self, nodes, positions, center, cfg):
+        """
+        Posiciona os nós sem coordenadas em área limitada, perto dos vizinhos posicionados
+        
+        Uma passada vetorizada sobre as conexões dá o baricentro dos vizinhos
+        já posicionados de cada nó (ponderado pela quantidade de conexões); nós
+        sem vizinho posicionado usam center. Nós cuja âncora cai na mesma
+        célula de sem_siteid_spacing px formam um disco em filotaxia ao redor
+        dela (k-ésimo nó a sem_siteid_spacing·√(k/π) px, ângulo áureo), com o
+        centro livre para o vizinho. A área ocupada cresce linearmente com a
+        quantidade de nós (raio proporcional a √n).
+        
+        Args:
+            nodes (list): Índices dos nós sem coordenadas, na ordem de posicionamento
+            positions (dict): Posições já calculadas (índice -> (x, y))
+            center (tuple): Âncora dos nós sem vizinho posicionado
+            cfg (dict): Seção GEOGRAPHIC_LAYOUT do config
+            
+        Returns:
+            dict: Índice do nó -> (x, y)
+        """
+        if not nodes:
+            return {}
+        spacing = cfg.get("sem_siteid_spacing", SEM_SITEID_SPACING)
+        adjacency = self.adjacency
+        node_count = adjacency.node_count
+        
+        # Baricentro dos vizinhos posicionados (uma passada sobre as conexões)
+        xy = np.zeros((node_count, 2))
+        placed = np.zeros(node_count, dtype=bool)
+        if positions:
+            placed_idx = np.fromiter(positions.keys(), dtype=np.int64, count=len(positions))
+            xy[placed_idx] = np.array(list(positions.values()), dtype=float)
+            placed[placed_idx] = True
+        counts = np.zeros(node_count)
+        sum_x = np.zeros(node_count)
+        sum_y = np.zeros(node_count)
+        for ends, others in ((adjacency.src, adjacency.dst), (adjacency.dst, adjacency.src)):
+            mask = placed[others] & ~placed[ends]
+            ends, others = ends[mask], others[mask]
+            counts += np.bincount(ends, minlength=node_count)
+            sum_x += np.bincount(ends, weights=xy[others, 0], minlength=node_count)
+            sum_y += np.bincount(ends, weights=xy[others, 1], minlength=node_count)
+        
+        # Disco em filotaxia por célula de âncora (k começa em 2: centro livre)
+        groups = {}  # célula -> [âncora, nós já posicionados + 1]
+        result = {}
+        near_neighbors = 0
+        for node in nodes:
+            if counts[node]:
+                anchor = (float(sum_x[node] / counts[node]), float(sum_y[node] / counts[node]))
+                near_neighbors += 1
+            else:
+                anchor = center
+            cell = (round(anchor[0] / spacing), round(anchor[1] / spacing))
+            group = groups.get(cell)
+            if group is None:
+                group = groups[cell] = [anchor, 1]
+            group[1] += 1
+            k = group[1]
+            radius = spacing * math.sqrt(k / math.pi)
+            angle = k * GOLDEN_ANGLE
+            result[node] = (group[0][0] + radius * math.cos(angle), group[0][1] + radius * math.sin(angle))
+        
+        logger.info("Elementos sem coordenadas: %d (%d junto a vizinhos posicionados, %d no centro) em %d grupos",
+                   len(nodes), near_neighbors, len(nodes) - near_neighbors, len(groups))
+        return result
+
     def calculate_hierarchical_positions(self):
         """Calcula posições para layout hierárquico"""
         start_time = time.perf_counter()
@@ -2127,9 +4943,9 @@ class TopologyGenerator:
         # Agrupar nós por nível
         nodes_by_level = defaultdict(list)
         max_width_per_level = defaultdict(int)
-        for node, data in self.nodes.items():
-            level = data.get('nivel', 10)  # Default para nível 10
-            nodes_by_level[level].append(node)
+        for data in self.nodes.values():
+            level = data.nivel if data.nivel is not None else 10  # Default para nível 10
+            nodes_by_level[level].append(data)
             
             # Pré-calcular tamanhos dos nós
             style = self._get_node_style(data)
@@ -2152,15 +4968,14 @@ class TopologyGenerator:
             
             # Distribuir nós horizontalmente
             x = start_x
-            for node in nodes:
-                data = self.nodes[node]
+            for data in nodes:
                 style = self._get_node_style(data)
                 
                 # Posicionar centro do nó
                 pos_x = x + style["width"] / 2
                 pos_y = current_y + style["height"] / 2
                 
-                positions[node] = (pos_x, pos_y)
+                positions[data.idx] = (pos_x, pos_y)
                 x += style["width"] + horizontal_spacing
             
             # Avançar para próximo nível
@@ -2177,13 +4992,13 @@ class TopologyGenerator:
         Gera estilo visual para um nó baseado em sua camada
         
         Args:
-            node_data (dict): Dados do nó
+            node_data (NodeRecord): Dados do nó
             scale_factor (float): Fator de escala para dimensionamento
             
         Returns:
             dict: {style: string, width: int, height: int}
         """
-        camada = node_data['camada']
+        camada = node_data.camada
         
         # Estilo especial para elementos sem siteid
         if camada == "SEM_SITEID":
@@ -2203,8 +5018,8 @@ class TopologyGenerator:
 
         # Determinar cor de preenchimento
         fill_color = None
-        if node_data.get('cor'):
-            fill_color = self._normalize_color(node_data['cor'])
+        if node_data.cor:
+            fill_color = self._normalize_color(node_data.cor)
         elif layer_styles.get('fillColor'):
             fill_color = self._normalize_color(layer_styles['fillColor'])
         else:
@@ -2261,14 +5076,14 @@ class TopologyGenerator:
         Gera estilo visual para uma conexão com suporte a escala
         
         Args:
-            connection (dict): Dados da conexão
+            connection (ConnectionRecord): Dados da conexão
             scale_factor (float): Fator de escala para dimensionamento
             
         Returns:
             str: String de estilo
         """
         # Determinar camada base (removendo sufixos)
-        camada_base = connection['camada'].replace("_CNX", "").split('_', 1)[0]
+        camada_base = connection.camada.replace("_CNX", "").split('_', 1)[0]
         
         # Obter estilo base da camada ou padrão
         base_style = self.config["CONNECTION_STYLES"].get(
@@ -2278,14 +5093,14 @@ class TopologyGenerator:
         
         # Normalizar cor da conexão
         stroke_color = (
-            self._normalize_color(connection["strokeColor"]) 
-            if connection["strokeColor"] 
+            self._normalize_color(connection.strokeColor) 
+            if connection.strokeColor 
             else self._normalize_color(base_style["color"])
         )
         
         # Obter tamanho base da fonte (com fallback)
         try:
-            base_font_size = int(connection.get('fontSize', '14'))
+            base_font_size = int(connection.fontSize)
         except (ValueError, TypeError):
             base_font_size = 14
         
@@ -2297,10 +5112,10 @@ class TopologyGenerator:
         
         # Atualizar com propriedades específicas
         style_template.update({
-            "strokeWidth": connection['strokeWidth'] or base_style['strokeWidth'],
+            "strokeWidth": connection.strokeWidth or base_style['strokeWidth'],
             "strokeColor": stroke_color,
-            "dashed": connection['dashed'] or '0',
-            "fontStyle": connection['fontStyle'] or '1',
+            "dashed": connection.dashed or '0',
+            "fontStyle": connection.fontStyle or '1',
             "fontSize": str(scaled_font_size),  # USAR VALOR ESCALADO
             "fontColor": stroke_color
         })
@@ -2312,43 +5127,52 @@ class TopologyGenerator:
         """
         Gera arquivo draw.io com o layout especificado
         """
-        # Aplicar filtros antes de calcular posições
-        if self.filter_string:
-            self.apply_filters()
-            
         logger.info("🖼️ Gerando diagrama: %s", output_file)
         gen_start = time.perf_counter()
         
-        # Mapear nomes em português para chaves em inglês
-        layout_key_map = {
-            'circular': 'CIRCULAR_LAYOUT',
-            'organico': 'ORGANIC_LAYOUT',
-            'geografico': 'GEOGRAPHIC_LAYOUT',
-            'hierarquico': 'HIERARCHICAL_LAYOUT'
-        }
+        content, _ = self.build_drawio(layout_type)
+        if content is None:
+            return False
+            
+        # Escrever arquivo final
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(content))
+        
+        # Registrar tempo de geração
+        gen_time = time.perf_counter() - gen_start
+        file_size = os.path.getsize(output_file) / 1024
+        logger.info("✅ Diagrama gerado em %.2fs (%.1fKB)", gen_time, file_size)
+        return True
+
+    def build_drawio(self, layout_type):
+        """
+        Monta em memória o conteúdo draw.io de um layout
+        
+        Args:
+            layout_type (str): circular, organico, geografico ou hierarquico
+            
+        Returns:
+            tuple: (trechos do arquivo, a unir com '\\n'; posições índice -> (x, y)),
+                   ou (None, None) em caso de falha
+        """
+        # Aplicar filtros antes de calcular posições (dispensado se já aplicados na leitura)
+        if self.filter_string and self.ingest_filter is None:
+            self.apply_filters()
         
-        layout_key = layout_key_map.get(layout_type)
+        # Mapear nomes em português para chaves em inglês
+        layout_key = LAYOUT_CONFIG_KEYS.get(layout_type)
         if not layout_key:
             logger.error("Tipo de layout inválido: %s", layout_type)
-            return False
+            return None, None
             
+        positions = {}
         try:
             # Selecionar algoritmo de layout
-            if layout_type == 'circular':
-                positions = self.calculate_circular_positions()
-            elif layout_type == 'organico':
-                positions = self.calculate_organico_positions()
-            elif layout_type == 'geografico':
-                positions = self.calculate_geographic_positions()
-            elif layout_type == 'hierarquico':
-                positions = self.calculate_hierarchical_positions()
-            else:
-                logger.error("Tipo de layout inválido: %s", layout_type)
-                return False
+            positions = self.calculate_positions(layout_type)
                    
             if not positions:
                 logger.error("Nenhuma posição calculada para %s", layout_type)
-                return False
+                return None, None
                 
             # Obter fator de escala e status de bloqueio para este layout
             layout_config = self.config[layout_key]
@@ -2362,34 +5186,297 @@ class TopologyGenerator:
             content = [
                 DRAWIO_HEADER.format(
                     timestamp=datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
-                    etag=str(uuid.uuid4())
+                    etag=stable_id(f"etag\x1f{os.path.basename(self.conexoes_file)}\x1f{layout_type}")
                 )
             ]
 
+            # Índice das camadas existentes, compartilhado pelas páginas
+            self.layer_index = PrefixIndex(self.layers)
+            
             # Gerar cada página definida no config
-            for page_def in self.config["PAGE_DEFINITIONS"]:
+            compress = self.config.get("COMPRESS_PAGES", False)
+            for page_def in self.page_definitions:
                 page_content = self._generate_page(page_def, positions, layout_type, scale_factor, locked)
                 if page_content is not None:  # Adicionar apenas páginas não vazias
-                    content.append(page_content)
+                    content.append(deflate_diagram(page_content) if compress else page_content)
                 
             content.append(DRAWIO_FOOTER)
-            
-            # Escrever arquivo final
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write('\n'.join(content))
-            
-            # Registrar tempo de geração
-            gen_time = time.perf_counter() - gen_start
-            file_size = os.path.getsize(output_file) / 1024
-            logger.info("✅ Diagrama gerado em %.2fs (%.1fKB)", gen_time, file_size)
-            return True
+            return content, positions
             
         except Exception as e:
             logger.exception("💥 ERRO CRÍTICO durante geração")
             logger.error("Contexto: layout=%s, nodes=%d, connections=%d",
                        layout_type, len(positions), len(self.connections))
+            return None, None
+
+    def update_drawio(self, drawio_file):
+        """
+        Atualiza um .drawio gerado anteriormente com os dados lidos (--update)
+        
+        O arquivo é lido em fluxo (iterparse) e reescrito em uma única passada:
+        cada célula é processada e descartada assim que termina, de modo que a
+        memória não cresce com o tamanho do desenho. As páginas são casadas
+        com PAGE_DEFINITIONS pelo id (ou pelo nome) e as células com nós e
+        conexões pelo id estável; a geometria existente é mantida (ver
+        DrawioPagePatcher). Páginas agregadas (visão por site) e páginas que
+        não constam do config são copiadas sem alteração. O resultado
+        substitui o arquivo apenas ao final, sem erros.
+        
+        Args:
+            drawio_file (str): Arquivo .drawio a atualizar
+            
+        Returns:
+            bool: True se o arquivo foi atualizado
+        """
+        if self.filter_string and self.ingest_filter is None:
+            self.apply_filters()
+
+        logger.info("🛠️ Atualizando diagrama: %s", drawio_file)
+        update_start = time.perf_counter()
+
+        # Fator de escala do layout indicado no nome do arquivo (_<layout>.drawio)
+        scale_factor = 1
+        stem = os.path.splitext(os.path.basename(drawio_file))[0]
+        for layout_type, layout_key in LAYOUT_CONFIG_KEYS.items():
+            if stem.endswith(f"_{layout_type}"):
+                scale_factor = self.config[layout_key].get("node_scale_factor", 1)
+                break
+
+        self.layer_index = PrefixIndex(self.layers)
+        pages_by_id = {page_def["id"]: page_def for page_def in self.page_definitions}
+        pages_by_name = {page_def["name"]: page_def for page_def in self.page_definitions}
+        cell_nodes = {data.cell_id: data for data in self.node_list if data is not None}
+        edge_slots = EdgeSlots(self.adjacency, self.collapse_links)
+        seen_pages = set()
+        totals = [0, 0, 0, 0]
+
+        def new_patcher(diagram):
+            page_def = pages_by_id.get(diagram.get('id')) or pages_by_name.get(diagram.get('name'))
+            if page_def is None:
+                logger.info("Página '%s' não consta do config e será mantida como está", diagram.get('name'))
+                return None
+            seen_pages.add(page_def["id"])
+            if page_def.get("aggregate"):
+                return None
+            return DrawioPagePatcher(self, page_def, cell_nodes, edge_slots, scale_factor)
+
+        def finish_page(out, diagram, patcher):
+            if patcher is None:
+                return
+            out.write(patcher.finish())
+            totals[0] += patcher.kept
+            totals[1] += patcher.updated
+            totals[2] += patcher.removed
+            totals[3] += patcher.added
+            logger.debug("Página '%s': %d mantidas, %d atualizadas, %d removidas, %d novas",
+                         diagram.get('name'), patcher.kept, patcher.updated, patcher.removed, patcher.added)
+
+        tmp_file = drawio_file + '.tmp'
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as out:
+                out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+                depth = 0
+                mxfile = diagram = root = patcher = None
+                for event, elem in ET.iterparse(drawio_file, events=('start', 'end')):
+                    if event == 'start':
+                        depth += 1
+                        if depth == 1:
+                            mxfile = elem
+                            elem.set('modified', datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"))
+                            out.write(xml_start_tag(elem) + '\n')
+                        elif depth == 2:
+                            diagram = elem
+                            root = patcher = None
+                            out.write('  ' + xml_start_tag(elem) + '\n')
+                        elif depth == 3:
+                            out.write('    ' + xml_start_tag(elem) + '\n')
+                        elif depth == 4:
+                            root = elem
+                            patcher = new_patcher(diagram)
+                            out.write('      <root>\n')
+                        continue
+
+                    # Fim de elemento
+                    if depth == 5:
+                        out.write(patcher.cell(elem) if patcher is not None else xml_cell(elem))
+                        root.remove(elem)
+                    elif depth == 4:
+                        finish_page(out, diagram, patcher)
+                        out.write('      </root>\n')
+                    elif depth == 3:
+                        out.write(f'    </{elem.tag}>\n')
+                    elif depth == 2:
+                        if root is None and (elem.text or '').strip():
+                            # Página comprimida pelo draw.io: regravada descomprimida
+                            model = inflate_diagram(elem.text.strip())
+                            model_root = model.find('root')
+                            patcher = new_patcher(diagram)
+                            model.remove(model_root)
+                            out.write('    ' + xml_start_tag(model) + '\n      <root>\n')
+                            for cell in list(model_root):
+                                out.write(patcher.cell(cell) if patcher is not None else xml_cell(cell))
+                            finish_page(out, diagram, patcher)
+                            out.write('      </root>\n    </mxGraphModel>\n')
+                        out.write('  </diagram>\n')
+                        mxfile.remove(elem)
+                    elif depth == 1:
+                        out.write(f'</{elem.tag}>\n')
+                    depth -= 1
+            os.replace(tmp_file, drawio_file)
+        except Exception:
+            logger.exception("💥 ERRO ao atualizar %s (arquivo original mantido)", drawio_file)
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
             return False
 
+        for page_def in self.page_definitions:
+            if page_def["id"] not in seen_pages:
+                logger.warning("Página '%s' não existe no arquivo e não foi criada (gere o diagrama de novo para incluí-la)",
+                               page_def["name"])
+
+        update_time = time.perf_counter() - update_start
+        logger.info("✅ Diagrama atualizado em %.2fs | Células: %d mantidas, %d atualizadas, %d removidas, %d novas",
+                    update_time, *totals)
+        return True
+
+    def _expand_visible_layers(self, page_def):
+        """Camadas visíveis da página, incluindo as regionais (_REGIAO) e as de conexão (_CNX)"""
+        visible_layers = set(self.layers.keys()) if page_def["visible_layers"] is None else set(page_def["visible_layers"])
+        layer_index = self.layer_index or PrefixIndex(self.layers)
+        expanded_visible_layers = set()
+        for layer in visible_layers:
+            expanded_visible_layers.add(layer)
+            # Incluir camadas regionais
+            expanded_visible_layers.update(layer_index.keys_with_prefix(layer + '_'))
+            # Incluir camadas de conexão
+            cnx_layer_base = f"{layer}_CNX"
+            if cnx_layer_base in self.layers:
+                expanded_visible_layers.add(cnx_layer_base)
+        return expanded_visible_layers
+
+    def _background_cells(self, layout_type):
+        """Células XML da imagem de fundo (apenas no layout geográfico)"""
+        if layout_type != 'geografico':
+            return []
+        bg_cfg = self.config.get("GEOGRAPHIC_LAYOUT", {}).get("background_image", {})
+        if self.conexoes_records is None and os.path.exists('brasil-map.png'):
+            bg_cfg = bg_cfg.copy()
+            bg_cfg["url"] = 'brasil-map.png'
+            logger.info("Usando imagem local como fundo")
+        elif bg_cfg.get("url", "").startswith("http"):
+            logger.info("Usando imagem remota como fundo")
+        else:
+            logger.warning("Imagem de fundo não encontrada")
+            return []
+
+        bg_id = stable_id("fundo")
+        return [
+            f'        <mxCell id="{bg_id}" value="" style="shape=image;image={xml_escape(bg_cfg["url"])};',
+            f'          imageAspect=0;aspect=fixed;verticalLabelPosition=bottom;verticalAlign=top;',
+            f'          opacity={bg_cfg.get("opacity", 30)};" vertex="1" parent="1" visible="1">',
+            f'          <mxGeometry x="{bg_cfg["x"]}" y="{bg_cfg["y"]}" width="{bg_cfg["width"]}" height="{bg_cfg["height"]}" as="geometry"/>',
+            f'        </mxCell>'
+        ]
+
+    def _edge_cell(self, conn, conn_index, total_conns, label, base_style, positions,
+                   origem_id, destino_id):
+        """
+        Linhas XML de uma curva de conexão
+        
+        Args:
+            conn (ConnectionRecord): Conexão desenhada
+            conn_index (int): Posição da curva entre as conexões do mesmo par (origem, destino)
+            total_conns (int): Total de curvas do par (> 1 desenha curvas afastadas)
+            label (str): Rótulo já escapado
+            base_style (str): Estilo da conexão (_get_connection_style)
+            positions (dict): Índice do nó -> centro (x, y), consultado só para curvas
+            origem_id, destino_id (str): Ids das células dos nós
+            
+        Returns:
+            list: Linhas do mxCell da conexão
+        """
+        # Fator de espaçamento entre as linhas (em pixels)
+        spacing_factor = 20
+        style = base_style
+        
+        # Geometria padrão
+        geometry_xml = '<mxGeometry relative="1" as="geometry"/>'
+
+        if total_conns > 1:
+            # Obter as coordenadas dos nós de origem e destino
+            x1, y1 = positions[conn.origem]
+            x2, y2 = positions[conn.destino]
+
+            # Calcular o ponto médio
+            mid_x = (x1 + x2) / 2
+            mid_y = (y1 + y2) / 2
+
+            # Calcular um offset para distribuir as linhas
+            # A fórmula abaixo centra o grupo de linhas. Ex para 3 linhas (índices 0, 1, 2):
+            # offset ficará proporcional a -1, 0, 1.
+            offset_magnitude = spacing_factor * (conn_index - (total_conns - 1) / 2.0)
+
+            # Usar direção real da conexão (origem->destino)
+            dx_ref = x2 - x1
+            dy_ref = y2 - y1
+            length_ref = math.sqrt(dx_ref**2 + dy_ref**2) or 1.0
+
+            # Vetor perpendicular unitário (giro de 90°)
+            perp_x = -dy_ref / length_ref
+            perp_y = dx_ref / length_ref
+
+            # Calcular ponto de controle
+            point_x = mid_x + perp_x * offset_magnitude
+            point_y = mid_y + perp_y * offset_magnitude
+
+            # Forçar estilo curvo e criar a nova geometria com o ponto de controle
+            style += ";curved=1"
+            geometry_xml = (
+                '          <mxGeometry relative="1" as="geometry">\n'
+                '            <Array as="points">\n'
+                f'              <mxPoint x="{point_x:.2f}" y="{point_y:.2f}"/>\n'
+                '            </Array>\n'
+                '          </mxGeometry>'
+            )
+        
+        return [
+            f'        <mxCell id="{stable_id(f"{origem_id}{destino_id}{conn_index}")}" '
+            f'value="{label}" style="{style}" edge="1"',
+            f'          parent="{self.layer_ids[conn.camada]}" source="{origem_id}"',
+            f'          target="{destino_id}">',
+            f'          {geometry_xml}',
+            '        </mxCell>'
+        ]
+
+    def _layer_cell(self, layer, locked=0):
+        """Linhas XML do objeto de camada (camadas _CNX ocultas com -o c)"""
+        layer_visible = "1"
+        if self.hide_connection_layers and layer.endswith("_CNX"):
+            layer_visible = "0"
+        return [
+            f'        <object id="{self.layer_ids[layer]}" label="{self.layer_labels[layer]}">',
+            f'          <mxCell style="locked={locked};" parent="0" visible="{layer_visible}"/>',
+            f'        </object>'
+        ]
+
+    def _node_cell(self, data, x, y, scale_factor=1.0):
+        """Linhas XML do vértice de um nó centrado em (x, y)"""
+        style = self._get_node_style(data, scale_factor)
+        
+        # Usar apelido se disponível, senão usar nome original (já escapado)
+        label = ""
+        if not self.hide_node_names:
+            label = data.rotulo
+        
+        return [
+            f'        <object id="{data.cell_id}" label="{label}">',
+            f'          <mxCell style="{style["style"]}" vertex="1" parent="{self.layer_ids[data.camada]}">',
+            f'            <mxGeometry x="{x - style["width"]/2}" y="{y - style["height"]/2}" ',
+            f'width="{style["width"]}" height="{style["height"]}" as="geometry"/>',
+            f'          </mxCell>',
+            f'        </object>'
+        ]
+
     def _generate_page(self, page_def, positions, layout_type, scale_factor=1.0, locked=0):
         """
         Gera conteúdo XML para uma página específica
@@ -2404,196 +5491,72 @@ class TopologyGenerator:
         Returns:
             str: Conteúdo XML da página
         """
+        if page_def.get("aggregate"):
+            return self._generate_site_page(page_def, positions, layout_type, scale_factor, locked)
+
         diagram_content = DRAWIO_DIAGRAM_TEMPLATE.format(
-            page_name=page_def["name"],
-            diagram_id=str(uuid.uuid4())
+            page_name=page_def["label"],
+            diagram_id=page_def["id"]
         )
         node_count = 0
         connection_count = 0
         page_content = [diagram_content]
-        visible_layers = set(self.layers.keys()) if page_def["visible_layers"] is None else set(page_def["visible_layers"])
-
-        
-        # Expandir camadas visíveis
-        expanded_visible_layers = set()
-        for layer in visible_layers:
-            expanded_visible_layers.add(layer)
-            # Incluir camadas regionais
-            for existing_layer in self.layers.keys():
-                if existing_layer.startswith(layer + '_'):
-                    expanded_visible_layers.add(existing_layer)
-            # Incluir camadas de conexão
-            cnx_layer_base = f"{layer}_CNX"
-            if cnx_layer_base in self.layers:
-                expanded_visible_layers.add(cnx_layer_base)
+        expanded_visible_layers = self._expand_visible_layers(page_def)
         
         # Adicionar imagem de fundo para layout geográfico
-        if layout_type == 'geografico':
-            bg_cfg = self.config.get("GEOGRAPHIC_LAYOUT", {}).get("background_image", {})
-            if os.path.exists('brasil-map.png'):
-                bg_cfg = bg_cfg.copy()
-                bg_cfg["url"] = 'brasil-map.png'
-                logger.info("Usando imagem local como fundo")
-            elif bg_cfg.get("url", "").startswith("http"):
-                logger.info("Usando imagem remota como fundo")
-            else:
-                logger.warning("Imagem de fundo não encontrada")
-                bg_cfg = None
-
-            if bg_cfg:
-                bg_id = str(uuid.uuid4())
-                page_content.extend([
-                    f'        <mxCell id="{bg_id}" value="" style="shape=image;image={bg_cfg["url"]};',
-                    f'          imageAspect=0;aspect=fixed;verticalLabelPosition=bottom;verticalAlign=top;',
-                    f'          opacity={bg_cfg.get("opacity", 30)};" vertex="1" parent="1" visible="1">',
-                    f'          <mxGeometry x="{bg_cfg["x"]}" y="{bg_cfg["y"]}" width="{bg_cfg["width"]}" height="{bg_cfg["height"]}" as="geometry"/>',
-                    f'        </mxCell>'
-                ])
+        page_content.extend(self._background_cells(layout_type))
 
         # Adicionar objetos de camada em ordem alfabética
-        sorted_layers = sorted(self.layer_ids.items(), key=lambda x: x[0])
-        for layer, lid in sorted_layers:
-            # Determinar visibilidade da camada
-            layer_visible = "1"
-            if self.hide_connection_layers:
-                layer_visible = "1"
-                if layer.endswith("_CNX") and self.hide_connection_layers:
-                    layer_visible = "0"
-                
+        for layer in sorted(self.layer_ids):
             if layer not in expanded_visible_layers:
                 continue
-                
-            page_content.extend([
-                f'        <object id="{lid}" label="{layer}">',
-                f'          <mxCell style="locked={locked};" parent="0" visible="{layer_visible}"/>',
-                f'        </object>'
-            ])
+            page_content.extend(self._layer_cell(layer, locked))
 
         # Precomputar nós a serem gerados
-        generated_nodes = set()
-        for node in positions:
-            if node in self.nodes and self.nodes[node]['camada'] in expanded_visible_layers:
-                generated_nodes.add(node)
+        node_list = self.node_list
+        generated_nodes = [
+            node_list[idx] for idx in positions
+            if node_list[idx] is not None and node_list[idx].camada in expanded_visible_layers
+        ]
         
         # --- INÍCIO DA MODIFICAÇÃO ---
         # Lógica para tratar múltiplas conexões
         
-        # 1. Contar quantas conexões existem entre cada par de nós
-        connection_counts = defaultdict(int)
-        connection_directions = {}  # Rastrear direções únicas
-
-        for conn in self.connections:
-            key = (conn['origem'], conn['destino'])  # Tupla DIRECIONAL
-            connection_counts[key] += 1
-            connection_directions[key] = (conn['origem'], conn['destino'])
-        # 2. Manter o controle do índice da conexão atual que estamos desenhando
-        connection_indices = defaultdict(int)
+        # Quantas conexões existem entre cada par DIRECIONAL de nós e a posição
+        # de cada conexão no seu grupo (pré-calculados na adjacência)
+        pair_counts = self.adjacency.pair_count.tolist()
+        pair_ranks = self.adjacency.pair_rank.tolist()
         
-        # Fator de espaçamento entre as linhas (em pixels)
-        spacing_factor = 20
+        collapse = self.collapse_links
         # --- FIM DA MODIFICAÇÃO ---
 
         # Adicionar conexões apenas se ambos os nós existirem
-        for conn in self.connections:
-            if (conn['camada'] not in expanded_visible_layers or
-                conn['origem'] not in self.node_ids or
-                conn['destino'] not in self.node_ids):
+        for conn_pos, conn in enumerate(self.connections):
+            if (conn.camada not in expanded_visible_layers or
+                node_list[conn.origem] is None or
+                node_list[conn.destino] is None):
                 continue
-            connection_count += 1
-            # --- INÍCIO DA MODIFICAÇÃO ---
-            origem_node = conn['origem']
-            destino_node = conn['destino']
-            
-            # Obter o estilo original da conexão
-            style = self._get_connection_style(conn, scale_factor)
-            
-            # Geometria padrão
-            geometry_xml = '<mxGeometry relative="1" as="geometry"/>'
-
-            # Chave para este par de conexões
-            key = (origem_node, destino_node)  # Usar tupla direcional
-            total_conns = connection_counts[key]
-            
-            if total_conns > 1:
-                # Obter as coordenadas dos nós de origem e destino
-                x1, y1 = positions[origem_node]
-                x2, y2 = positions[destino_node]
-
-                # Calcular o ponto médio
-                mid_x = (x1 + x2) / 2
-                mid_y = (y1 + y2) / 2
-
-                # Calcular o vetor da linha e seu comprimento
-                dx = x2 - x1
-                dy = y2 - y1
-                length = math.sqrt(dx**2 + dy**2)
-                
-                # Obter o índice desta conexão específica
-                conn_index = connection_indices[key]
-
-                # Calcular um offset para distribuir as linhas
-                # A fórmula abaixo centra o grupo de linhas. Ex para 3 linhas (índices 0, 1, 2):
-                # offset ficará proporcional a -1, 0, 1.
-                offset_magnitude = spacing_factor * (conn_index - (total_conns - 1) / 2.0)
-
-                # Usar direção real da conexão (origem->destino)
-                x1_ref, y1_ref = positions[origem_node]
-                x2_ref, y2_ref = positions[destino_node]
-                dx_ref = x2_ref - x1_ref
-                dy_ref = y2_ref - y1_ref
-                length_ref = math.sqrt(dx_ref**2 + dy_ref**2) or 1.0
-
-                # Vetor perpendicular unitário (giro de 90°)
-                perp_x = -dy_ref / length_ref
-                perp_y = dx_ref / length_ref
-
-                # Calcular ponto de controle
-                point_x = mid_x + perp_x * offset_magnitude
-                point_y = mid_y + perp_y * offset_magnitude
-
-                # Forçar estilo curvo e criar a nova geometria com o ponto de controle
-                style += ";curved=1"
-                geometry_xml = (
-                    '          <mxGeometry relative="1" as="geometry">\n'
-                    '            <Array as="points">\n'
-                    f'              <mxPoint x="{point_x:.2f}" y="{point_y:.2f}"/>\n'
-                    '            </Array>\n'
-                    '          </mxGeometry>'
-                )
-                
-                # Incrementar o índice para a próxima conexão entre este mesmo par
-                connection_indices[key] += 1
-            # --- FIM DA MODIFICAÇÃO ---
-                
-            page_content.extend([
-                f'        <mxCell id="{uuid.uuid4()}" value="{conn["texto_conexao"]}" style="{style}" edge="1"',
-                f'          parent="{self.layer_ids[conn["camada"]]}" source="{self.node_ids[conn["origem"]]}"',
-                f'          target="{self.node_ids[conn["destino"]]}">',
-                f'          {geometry_xml}',
-                '        </mxCell>'
-            ])
-
-        # CORREÇÃO: Aplicar nós sem nomes
-        for node in generated_nodes:
-            data = self.nodes[node]
-            apelido = data.get('apelido', '')  # Obter apelido se existir
-            style = self._get_node_style(data, scale_factor)
-            x, y = positions[node]
-            node_count += 1
-            
-            # Usar apelido se disponível, senão usar nome original
-            label = ""
-            if not self.hide_node_names:
-                label = apelido if apelido else node  # Priorizar apelido
-            
-            page_content.extend([
-                f'        <object id="{self.node_ids[node]}" label="{label}">',
-                f'          <mxCell style="{style["style"]}" vertex="1" parent="{self.layer_ids[data["camada"]]}">',
-                f'            <mxGeometry x="{x - style["width"]/2}" y="{y - style["height"]/2}" ',
-                f'width="{style["width"]}" height="{style["height"]}" as="geometry"/>',
-                f'          </mxCell>',
-                f'        </object>'
-            ])
+            connection_count += conn.count
+            origem_id = node_list[conn.origem].cell_id
+            destino_id = node_list[conn.destino].cell_id
+            
+            # Obter o estilo original da conexão
+            base_style = self._get_connection_style(conn, scale_factor)
+            # Conexões agregadas (-a) são expandidas em conn.count curvas;
+            # com -o a o registro é desenhado uma única vez, como linha simples
+            total_conns = 1 if collapse else pair_counts[conn_pos]
+            for copy_index in range(1 if collapse else conn.count):
+                page_content.extend(self._edge_cell(
+                    conn, pair_ranks[conn_pos] + copy_index, total_conns,
+                    conn.rotulo if copy_index == 0 else '', base_style,
+                    positions, origem_id, destino_id
+                ))
+
+        # CORREÇÃO: Aplicar nós sem nomes
+        for data in generated_nodes:
+            x, y = positions[data.idx]
+            node_count += 1
+            page_content.extend(self._node_cell(data, x, y, scale_factor))
 
         # Calcular bounding box para posicionar legenda
         min_x = float('inf')
@@ -2601,9 +5564,9 @@ class TopologyGenerator:
         max_x = float('-inf')
         max_y = float('-inf')
         
-        for node in generated_nodes:
-            x, y = positions[node]
-            style = self._get_node_style(self.nodes[node], scale_factor)
+        for data in generated_nodes:
+            x, y = positions[data.idx]
+            style = self._get_node_style(data, scale_factor)
             width = style["width"]
             height = style["height"]
             
@@ -2622,7 +5585,7 @@ class TopologyGenerator:
             max_x = max_y = 1000
 
         # Criar camada LEGENDA
-        legenda_layer_id = str(uuid.uuid4())
+        legenda_layer_id = stable_id("camada\x1fLEGENDA")
         page_content.extend([
             f'        <object id="{legenda_layer_id}" label="LEGENDA">',
             f'          <mxCell style="locked={locked};" parent="0" visible="1"/>',
@@ -2651,7 +5614,7 @@ class TopologyGenerator:
         
         if base_layers:
             # Título da legenda com o nome da página
-            page_name = page_def["name"].replace('"', '&quot;')
+            page_name = page_def["label"]
             page_content.extend([
                 f'        <mxCell id="legend-title" value="{page_name}" style="text;html=1;strokeColor=none;fillColor=none;'
                 f'align=left;verticalAlign=middle;fontStyle=1;fontSize=16;" vertex="1" parent="{legenda_layer_id}">',
@@ -2669,7 +5632,7 @@ class TopologyGenerator:
                 )
                 
                 # Criar nó fictício para obter estilo
-                fake_node_data = {'camada': base_layer, 'cor': None, 'tipo': 'Exemplo'}
+                fake_node_data = NodeRecord(-1, 'Exemplo', base_layer, None)
                 style_dict = self._get_node_style(fake_node_data, scale_factor=1.0)
                 
                 # Ajustar estilo para item de legenda
@@ -2681,7 +5644,7 @@ class TopologyGenerator:
                 new_style_str = ';'.join(new_parts)
                 
                 # Adicionar ícone
-                item_id = str(uuid.uuid4())
+                item_id = stable_id(f"legenda\x1f{base_layer}\x1ficone")
                 page_content.extend([
                     f'        <object id="{item_id}" label="">',
                     f'          <mxCell style="{new_style_str}" vertex="1" parent="{legenda_layer_id}">',
@@ -2691,8 +5654,8 @@ class TopologyGenerator:
                 ])
                 
                 # Adicionar texto
-                text_id = str(uuid.uuid4())
-                layer_name = base_layer.replace("-", " ")
+                text_id = stable_id(f"legenda\x1f{base_layer}\x1ftexto")
+                layer_name = xml_escape(base_layer.replace("-", " "))
                 page_content.extend([
                     f'        <mxCell id="{text_id}" value="{layer_name}" style="text;html=1;strokeColor=none;fillColor=none;'
                     f'align=left;verticalAlign=middle;fontSize=14;" vertex="1" parent="{legenda_layer_id}">',
@@ -2713,11 +5676,348 @@ class TopologyGenerator:
             return None               
         return '\n'.join(page_content)
 
+    def _site_key(self, node_data, key_field):
+        """Chave de agrupamento do nó na visão por site ('' se o nó não tem siteid)"""
+        siteid = node_data.siteid
+        if not siteid or key_field == 'siteid':
+            return siteid
+        loc_data = self.localidades_map.get(siteid)
+        return loc_data['localidade'] if loc_data is not None else siteid
+
+    def _generate_site_page(self, page_def, positions, layout_type, scale_factor=1.0, locked=0):
+        """
+        Gera a página agregada (page_def["aggregate"]): um vértice por siteid ou Localidade
+        
+        Cada vértice fica no centróide dos seus elementos no layout e mostra a
+        quantidade de elementos; as conexões entre sites são somadas em uma única
+        aresta ponderada por par, numa passada vetorizada sobre a adjacência.
+        Elementos sem siteid não entram na visão.
+        
+        Args:
+            page_def (dict): Definição da página do config (com "aggregate")
+            positions (dict): Mapeamento nó -> posição
+            layout_type (str): Tipo de layout usado
+            scale_factor (float): Fator de escala para dimensionamento de nós
+            locked (int): Status de bloqueio das camadas (0=editável, 1=bloqueado)
+            
+        Returns:
+            str: Conteúdo XML da página (None se vazia)
+        """
+        key_field = page_def["aggregate"]
+        expanded_visible_layers = self._expand_visible_layers(page_def)
+        node_list = self.node_list
+
+        # Agrupar os nós visíveis por chave do site
+        group_of = np.full(len(node_list), -1, dtype=np.int64)
+        group_index = {}
+        group_keys = []
+        representatives = []  # nó de menor nível de cada grupo (define a cor)
+        representative_levels = []
+        members, xs, ys = [], [], []
+        without_key = 0
+        for idx, (x, y) in positions.items():
+            data = node_list[idx]
+            if data is None or data.camada not in expanded_visible_layers:
+                continue
+            key = self._site_key(data, key_field)
+            if not key:
+                without_key += 1
+                continue
+            nivel = data.nivel if data.nivel is not None else math.inf
+            gid = group_index.get(key)
+            if gid is None:
+                gid = group_index[key] = len(group_keys)
+                group_keys.append(key)
+                representatives.append(data)
+                representative_levels.append(nivel)
+            elif nivel < representative_levels[gid]:
+                representatives[gid] = data
+                representative_levels[gid] = nivel
+            group_of[idx] = gid
+            members.append(gid)
+            xs.append(x)
+            ys.append(y)
+
+        if not group_keys:
+            logger.info(f"Página '{page_def['name']}' está vazia e será omitida.")
+            return None
+        if without_key:
+            logger.info("Página '%s': %d elementos sem siteid fora da visão por site",
+                       page_def["name"], without_key)
+
+        members = np.array(members, dtype=np.int64)
+        group_count = len(group_keys)
+        counts = np.bincount(members, minlength=group_count)
+        center_x = (np.bincount(members, weights=xs, minlength=group_count) / counts).tolist()
+        center_y = (np.bincount(members, weights=ys, minlength=group_count) / counts).tolist()
+        counts = counts.tolist()
+
+        # Arestas ponderadas entre sites (só conexões de camadas visíveis)
+        visible_connections = np.fromiter(
+            (conn.camada in expanded_visible_layers for conn in self.connections),
+            dtype=bool, count=len(self.connections))
+        edge_a, edge_b, edge_weight = self.adjacency.group_edges(group_of, visible_connections)
+
+        page_content = [DRAWIO_DIAGRAM_TEMPLATE.format(
+            page_name=page_def["label"],
+            diagram_id=page_def["id"]
+        )]
+        page_content.extend(self._background_cells(layout_type))
+
+        sites_layer_id = stable_id("camada\x1fSITES")
+        links_layer_id = stable_id("camada\x1fSITES_CNX")
+        links_visible = "0" if self.hide_connection_layers else "1"
+        page_content.extend([
+            f'        <object id="{links_layer_id}" label="SITES_CNX">',
+            f'          <mxCell style="locked={locked};" parent="0" visible="{links_visible}"/>',
+            f'        </object>',
+            f'        <object id="{sites_layer_id}" label="SITES">',
+            f'          <mxCell style="locked={locked};" parent="0" visible="1"/>',
+            f'        </object>'
+        ])
+
+        site_ids = [stable_id(f"site\x1f{key_field}\x1f{key}") for key in group_keys]
+        default_cnx = self.config["CONNECTION_STYLES"]["default"]
+        edge_template = self.config["CONNECTION_STYLE_BASE"].copy()
+        edge_template.update({
+            "endArrow": "none",
+            "strokeColor": self._normalize_color(default_cnx["color"]),
+            "fontColor": self._normalize_color(default_cnx["color"]),
+            "fontSize": str(max(1, int(int(edge_template.get("fontSize", 14)) * scale_factor)))
+        })
+        for a, b, weight in zip(edge_a.tolist(), edge_b.tolist(), edge_weight.tolist()):
+            edge_template["strokeWidth"] = f"{min(1 + math.log2(weight), 10):.1f}"
+            style = ";".join(f"{key}={value}" for key, value in edge_template.items())
+            page_content.extend([
+                f'        <mxCell id="{stable_id(site_ids[a] + site_ids[b])}" value="{weight if weight > 1 else ""}" style="{style}" edge="1"',
+                f'          parent="{links_layer_id}" source="{site_ids[a]}" target="{site_ids[b]}">',
+                f'          <mxGeometry relative="1" as="geometry"/>',
+                '        </mxCell>'
+            ])
+
+        base_font_size = int(self.config["NODE_STYLE"].get("fontSize", 14))
+        font_size = max(1, int(base_font_size * scale_factor))
+        for gid, key in enumerate(group_keys):
+            camada_base = representatives[gid].camada.split('_', 1)[0]
+            layer_styles = self.config["LAYER_STYLES"].get(camada_base, self.config["LAYER_STYLES"].get("default", {}))
+            fill_color = self._normalize_color(layer_styles.get('fillColor') or self.config["LAYER_COLORS"].get(
+                camada_base, self.config["LAYER_COLORS"]["default"]))
+            size = min(40 + 12 * math.sqrt(counts[gid]), 200) * scale_factor
+            site_label = xml_escape(str(key))
+            label = str(counts[gid]) if self.hide_node_names else f"{site_label} ({counts[gid]})"
+            page_content.extend([
+                f'        <object id="{site_ids[gid]}" label="{label}">',
+                f'          <mxCell style="ellipse;html=1;fillColor={fill_color};strokeColor=#FFFFFF;strokeWidth=2;'
+                f'verticalLabelPosition=bottom;verticalAlign=top;fontStyle=1;fontSize={font_size};" '
+                f'vertex="1" parent="{sites_layer_id}">',
+                f'            <mxGeometry x="{center_x[gid] - size/2}" y="{center_y[gid] - size/2}" ',
+                f'width="{size}" height="{size}" as="geometry"/>',
+                f'          </mxCell>',
+                f'        </object>'
+            ])
+
+        page_content.append("      </root>")
+        page_content.append("    </mxGraphModel>")
+        page_content.append("  </diagram>")
+        logger.info("Página '%s': %d sites, %d elementos, %d ligações entre sites",
+                   page_def["name"], group_count, len(members), len(edge_weight))
+        return '\n'.join(page_content)
+
+# =====================================================
+# PLANEJADOR ADAPTATIVO (PLANNER)
+# =====================================================
+
+# Orçamentos padrão (seção PLANNER do config.json)
+PLANNER_DEFAULTS = {
+    "enabled": False,           # Opt-in: sem a seção PLANNER tudo roda como configurado
+    "time_budget": 120,         # Segundos por layout
+    "memory_budget_mb": 0,      # 0 = PLANNER_MEMORY_FRACTION da memória disponível
+    "compress_above_mb": 100    # Páginas comprimidas acima deste tamanho estimado de saída
+}
+PLANNER_MEMORY_FRACTION = 0.7
+PLANNER_LAYOUT_SHARE = 0.5        # Fração do tempo de cada layout para o cálculo de posições
+# Custos medidos (networkx 3, CPython 3.11); servem para ordens de grandeza
+ORGANIC_PAIR_SECONDS = 5e-8       # spring_layout: por par de nós e iteração
+ORGANIC_DENSE_PAIR_BYTES = 48     # Pico de memória do spring_layout denso por par de nós
+ORGANIC_DENSE_MAX_NODES = 499     # Maior grafo resolvido pelo spring_layout denso
+ORGANIC_MIN_ITERATIONS = 50
+OVERLAP_PAIR_SECONDS = 1e-6       # Prevenção de sobreposição do geográfico: por par e passada
+CONNECTION_ROW_BYTES = 300        # Memória por linha de conexão lida sem agregação
+DRAWIO_CELL_BYTES = 500           # Tamanho médio de um nó ou conexão no .drawio
+ESTIMATE_SAMPLE_BYTES = 64 * 1024
+
+
+class ExecutionPlanner:
+    """
+    Escolhe motor, iterações, agregação e compressão para caber nos orçamentos
+    
+    Desligado por padrão; ativado com "enabled": true na seção PLANNER.
+    O plano é expresso como ajustes de config (as mesmas chaves que o usuário
+    pode definir à mão), aplicados a uma cópia do config de cada arquivo.
+    As estimativas de custo são ordens de grandeza, então um ajuste pode ser
+    aplicado a redes que caberiam no orçamento por pouco; cada ajuste é
+    registrado no log.
+    """
+
+    def __init__(self, config):
+        self.settings = dict(PLANNER_DEFAULTS, **config.get("PLANNER", {}))
+        self.enabled = bool(self.settings["enabled"])
+        self.time_budget = float(self.settings["time_budget"])
+        self.layout_budget = self.time_budget * PLANNER_LAYOUT_SHARE
+        self.memory_budget = self._memory_budget()
+
+    def _memory_budget(self):
+        """Orçamento de memória em bytes (None se desconhecido)"""
+        configured = self.settings["memory_budget_mb"]
+        if configured:
+            return configured * 1024 * 1024
+        if PSUTIL_AVAILABLE:
+            return psutil.virtual_memory().available * PLANNER_MEMORY_FRACTION
+        return None
+
+    @staticmethod
+    def estimate_rows(conexoes_file):
+        """Linhas do arquivo de conexões, estimadas pelo tamanho médio das primeiras linhas"""
+        try:
+            size = os.path.getsize(conexoes_file)
+            with open(conexoes_file, 'rb') as f:
+                sample = f.read(ESTIMATE_SAMPLE_BYTES)
+        except OSError:
+            return 0
+        lines = sample.count(b'\n')
+        if not lines or len(sample) >= size:
+            return max(lines - 1, 0)
+        return int(size / (len(sample) / lines))
+
+    def plan_ingest(self, conexoes_file, aggregate_links):
+        """
+        Decide a leitura agregada antes da leitura das conexões
+        
+        Returns:
+            bool: True se a leitura deve ser agregada
+        """
+        if aggregate_links or not self.enabled or self.memory_budget is None:
+            return aggregate_links
+        rows = self.estimate_rows(conexoes_file)
+        needed = rows * CONNECTION_ROW_BYTES
+        # A leitura pode usar metade do orçamento; o restante fica para a geração
+        if needed > self.memory_budget / 2:
+            logger.info("📋 Plano: leitura agregada (~%d linhas, ~%.0fMB estimados; orçamento %.0fMB)",
+                       rows, needed / 2**20, self.memory_budget / 2**20)
+            return True
+        return False
+
+    def plan(self, generator, layout_types):
+        """
+        Ajusta o config do gerador para os layouts pedidos, conforme o tamanho do grafo
+        
+        Args:
+            generator (TopologyGenerator): Gerador com os dados já lidos
+            layout_types (list): Layouts que serão gerados
+            
+        Returns:
+            dict: Config com os ajustes (o original se nada mudou)
+        """
+        if not self.enabled:
+            return generator.config
+        config = dict(generator.config)
+        num_nodes = len(generator.nodes)
+        num_connections = len(generator.connections)
+        
+        if 'organico' in layout_types:
+            sizes = [len(component) for component in generator.organic_components()]
+            self._plan_organic(config, sizes)
+        if 'geografico' in layout_types:
+            located = sum(1 for data in generator.nodes.values() if data.coordenadas is not None)
+            self._plan_geographic(config, located)
+        
+        # Saída: páginas comprimidas quando o arquivo estimado é grande
+        pages = sum(1 for page_def in generator.page_definitions if not page_def.get("aggregate"))
+        output_bytes = pages * (num_nodes + num_connections) * DRAWIO_CELL_BYTES
+        too_big = output_bytes > self.settings["compress_above_mb"] * 1024 * 1024
+        too_heavy = self.memory_budget is not None and 2 * output_bytes > self.memory_budget
+        if not config.get("COMPRESS_PAGES") and (too_big or too_heavy):
+            config["COMPRESS_PAGES"] = True
+            logger.info("📋 Plano: páginas comprimidas (saída estimada %.0fMB por layout)", output_bytes / 2**20)
+        
+        logger.info("📋 Plano para %d nós e %d conexões (orçamento: %.0fs por layout, %s de memória)",
+                   num_nodes, num_connections, self.time_budget,
+                   f"{self.memory_budget / 2**20:.0f}MB" if self.memory_budget else "sem limite")
+        return config if config != generator.config else generator.config
+
+    def _plan_organic(self, config, component_sizes):
+        """
+        Iterações e motor (networkx no grafo todo ou em amostra) do layout orgânico
+        
+        Cada componente conexo é calculado isoladamente, então o custo é a soma
+        dos quadrados dos tamanhos e o motor denso só precisa comportar o maior.
+        Com amostragem, todo componente maior que sample_nodes roda na sua
+        própria amostra: a amostra e as iterações são escolhidas para que todas
+        as amostras e os componentes inteiros caibam juntos no orçamento.
+        """
+        cfg = dict(config.get("ORGANIC_LAYOUT", {}))
+        num_nodes = sum(component_sizes)
+        largest = max(component_sizes, default=0)
+        iterations = organic_parameters(cfg, largest)[1]
+        pair_cost = ORGANIC_PAIR_SECONDS * sum(size * size for size in component_sizes)
+        fit = int(self.layout_budget / pair_cost) if pair_cost else iterations
+        dense_fits = largest <= ORGANIC_DENSE_MAX_NODES and (
+            self.memory_budget is None or ORGANIC_DENSE_PAIR_BYTES * largest ** 2 < self.memory_budget)
+        solvable = dense_fits or SCIPY_AVAILABLE
+        
+        if solvable and fit >= min(iterations, ORGANIC_MIN_ITERATIONS):
+            if fit >= iterations:
+                logger.info("📋 Plano: orgânico com networkx, %d iterações (~%.1fs)", iterations, iterations * pair_cost)
+                return
+            cfg["iterations_min"] = cfg["iterations_max"] = fit
+            logger.info("📋 Plano: orgânico com networkx, %d iterações em vez de %d (~%.1fs)",
+                       fit, iterations, fit * pair_cost)
+        else:
+            # Maior amostra em que todos os componentes cabem com o mínimo de iterações
+            low = 1
+            high = min(largest - 1, ORGANIC_DENSE_MAX_NODES if not SCIPY_AVAILABLE else largest)
+            min_cost = ORGANIC_PAIR_SECONDS * ORGANIC_MIN_ITERATIONS
+            while low < high:
+                middle = (low + high + 1) // 2
+                if min_cost * self._sampled_pair_count(component_sizes, middle) <= self.layout_budget:
+                    low = middle
+                else:
+                    high = middle - 1
+            sample = low
+            sampled = sum(1 for size in component_sizes if size > sample)
+            sample_pair_cost = ORGANIC_PAIR_SECONDS * self._sampled_pair_count(component_sizes, sample)
+            sample_iterations = min(iterations, max(ORGANIC_MIN_ITERATIONS, int(self.layout_budget / sample_pair_cost)))
+            cfg["sample_nodes"] = sample
+            cfg["iterations_min"] = cfg["iterations_max"] = sample_iterations
+            logger.info("📋 Plano: orgânico em amostras de %d nós (%d componentes, %d nós), %d iterações (~%.1fs)%s",
+                       sample, sampled, num_nodes, sample_iterations, sample_iterations * sample_pair_cost,
+                       "" if SCIPY_AVAILABLE else "; scipy ausente")
+        config["ORGANIC_LAYOUT"] = cfg
+
+    @staticmethod
+    def _sampled_pair_count(component_sizes, sample):
+        """Pares de nós por iteração com amostra: componentes maiores contam sample²"""
+        return sum(min(size, sample) ** 2 for size in component_sizes)
+
+    def _plan_geographic(self, config, located):
+        """Passadas da prevenção de sobreposição (custo quadrático nos nós com coordenadas)"""
+        cfg = config.get("GEOGRAPHIC_LAYOUT", {})
+        passes = cfg.get("overlap_iterations", 20)
+        pass_cost = OVERLAP_PAIR_SECONDS * located * (located - 1) / 2
+        fit = int(self.layout_budget / pass_cost) if pass_cost else passes
+        if fit < passes:
+            config["GEOGRAPHIC_LAYOUT"] = dict(cfg, overlap_iterations=fit)
+            logger.info("📋 Plano: geográfico com %d passadas de prevenção de sobreposição em vez de %d",
+                       fit, passes)
+
+
 def process_file(conexoes_file, config, include_orphans=False, layouts_choice="cog", 
                 regionalization=False, elementos_file='elementos.csv', 
                 localidades_file='localidades.csv', hide_node_names=False, 
                 hide_connection_layers=False, ignore_optional=False,
-                filter_string=None):
+                filter_string=None, aggregate_links=False, focus_nodes=None, focus_hops=2,
+                geo_crop=None, site_view=None, collapse_links=False, update_file=None,
+                outputs=None, timestamp=None):
     """
     Processa um arquivo de conexões completo
     
@@ -2729,6 +6029,16 @@ def process_file(conexoes_file, config, include_orphans=False, layouts_choice="c
         regionalization (bool): Ativar regionalização
         elementos_file (str): Caminho para arquivo de elementos
         localidades_file (str): Caminho para arquivo de localidades
+        aggregate_links (bool): Leitura agregada de conexões paralelas
+        focus_nodes (list): Nós centrais do diagrama focado (--focus)
+        focus_hops (int): Distância máxima a partir dos nós de foco (--hops)
+        geo_crop (str): Recorte geográfico (--crop); None usa GEOGRAPHIC_LAYOUT.crop
+        site_view (str): Agrupamento da página de visão por site (--sites): siteid ou localidade
+        collapse_links (bool): Uma única ligação por par de nós (-o a)
+        update_file (str): Diagrama existente a atualizar (--update) em vez de gerar layouts
+        outputs (list): Se informada, recebe os caminhos dos arquivos gerados/atualizados
+        timestamp (str): Carimbo no nome dos arquivos gerados (padrão: agora); o modo
+            --watch fixa um por arquivo para regravar sempre as mesmas saídas
     """
     file_start = time.perf_counter()
     logger.info("⏱️ [INICIO] Processando arquivo: %s", conexoes_file)
@@ -2737,6 +6047,10 @@ def process_file(conexoes_file, config, include_orphans=False, layouts_choice="c
                 hide_node_names, hide_connection_layers)
     
     try:
+        planner = ExecutionPlanner(config)
+        if not update_file:
+            aggregate_links = planner.plan_ingest(conexoes_file, aggregate_links)
+        
         generator = TopologyGenerator(
             elementos_file, 
             conexoes_file, 
@@ -2747,7 +6061,13 @@ def process_file(conexoes_file, config, include_orphans=False, layouts_choice="c
             hide_node_names,
             hide_connection_layers,
             ignore_optional=ignore_optional,
-            filter_string=filter_string
+            filter_string=filter_string,
+            aggregate_links=aggregate_links,
+            focus_nodes=focus_nodes,
+            focus_hops=focus_hops,
+            geo_crop=geo_crop,
+            site_view=site_view,
+            collapse_links=collapse_links
         )
         
         if not generator.valid:
@@ -2758,9 +6078,18 @@ def process_file(conexoes_file, config, include_orphans=False, layouts_choice="c
             
         if not generator.read_conexoes():
             return False
+        
+        if update_file:
+            success = generator.update_drawio(update_file)
+            if success and outputs is not None:
+                outputs.append(update_file)
+            logger.info("✅ [SUCESSO] Arquivo processado em %.2fs | Atualizado: %s | Nós: %d | Conexões: %d",
+                      time.perf_counter() - file_start, update_file,
+                      len(generator.nodes), len(generator.connections))
+            return success
             
         base_name = os.path.splitext(conexoes_file)[0]
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        timestamp = timestamp or datetime.now().strftime("%Y%m%d%H%M%S")
         
         success = True
         
@@ -2784,12 +6113,16 @@ def process_file(conexoes_file, config, include_orphans=False, layouts_choice="c
                         continue
                 layouts_to_process.append((layout_key, layout_name))
         
+        generator.config = planner.plan(generator, [layout_key for layout_key, _ in layouts_to_process])
+        
         generated_layouts = []
         # Gerar apenas os layouts selecionados
         for layout_key, layout_name in layouts_to_process:
             output_file = f"{base_name}_{timestamp}_{layout_key}.drawio"
             if generator.generate_drawio(output_file, layout_key):
                 generated_layouts.append(layout_name)
+                if outputs is not None:
+                    outputs.append(output_file)
             else:
                 success = False
         
@@ -2814,6 +6147,592 @@ def process_file(conexoes_file, config, include_orphans=False, layouts_choice="c
                    layouts_choice, regionalization, elementos_file)
         return False
 
+# =====================================================
+# API PARA USO COMO BIBLIOTECA
+# =====================================================
+
+class RenderResult:
+    """
+    Resultado de render_topology
+    
+    Attributes:
+        drawio (bytes | None): Arquivo .drawio em UTF-8 (None se gravado em output)
+        names (list): Nomes dos nós desenhados, alinhados a xy
+        xy (np.ndarray): Centros dos nós no diagrama, float64 de forma (n, 2)
+    """
+    __slots__ = ('drawio', 'names', 'xy')
+
+    def __init__(self, drawio, names, xy):
+        self.drawio = drawio
+        self.names = names
+        self.xy = xy
+
+
+def render_topology(links, config, nodes=None, sites=None, layout='circular', output=None,
+                    name='topologia', **options):
+    """
+    Gera um diagrama a partir de registros em memória, sem arquivos intermediários
+    
+    Os registros são dicionários com as mesmas colunas dos CSVs; o resultado é
+    o mesmo da CLI para os CSVs equivalentes. Nada é gravado em disco, nenhum
+    handler de log é configurado e erros são levantados como exceções.
+    
+    Args:
+        links (iterable): Registros do conexoes.csv (ponta-a, ponta-b, textoconexao, ...)
+        config (dict): Configuração no formato do config.json (não é alterada)
+        nodes (iterable): Registros do elementos.csv (elemento, camada, nivel, ...)
+        sites (iterable): Registros do localidades.csv (siteid, Localidade, RegiaoGeografica, ...)
+        layout (str): circular, organico, geografico ou hierarquico
+        output: Objeto de arquivo binário que recebe o .drawio (ex: BytesIO, resposta HTTP)
+        name (str): Nome da topologia (entra no etag do arquivo)
+        **options: Demais opções do TopologyGenerator (include_orphans, regionalization,
+            filter_string, aggregate_links, focus_nodes, geo_crop, site_view, ...)
+        
+    Returns:
+        RenderResult: Diagrama (bytes, se output não foi informado) e posições dos nós
+        
+    Raises:
+        ValueError: Layout inválido, registros sem as colunas obrigatórias ou falha na geração
+    """
+    if layout not in LAYOUT_CONFIG_KEYS:
+        raise ValueError(f"Tipo de layout inválido: {layout}")
+    generator = TopologyGenerator(
+        None, name, normalize_config(json.loads(json.dumps(config))),
+        localidades_file=None,
+        elementos_records=nodes, conexoes_records=links,
+        localidades_records=sites,
+        **options
+    )
+    if not generator.valid:
+        raise ValueError("Opções inválidas para os registros informados (ver log)")
+    if not generator.read_elementos() or not generator.read_conexoes():
+        raise ValueError("Falha na leitura dos registros de nós/conexões")
+    if layout == 'geografico' and not generator.has_geographic_data:
+        raise ValueError("Layout geográfico sem dados geográficos (sites/siteid)")
+    
+    content, positions = generator.build_drawio(layout)
+    if content is None:
+        raise ValueError(f"Falha na geração do layout {layout}")
+    
+    node_list = generator.node_list
+    names = [node_list[idx].nome for idx in positions]
+    xy = np.array([positions[idx] for idx in positions], dtype=np.float64).reshape(-1, 2)
+    if output is None:
+        return RenderResult('\n'.join(content).encode('utf-8'), names, xy)
+    for i, part in enumerate(content):
+        output.write((part if not i else '\n' + part).encode('utf-8'))
+    return RenderResult(None, names, xy)
+
+
+# =====================================================
+# MODO WATCH (--watch)
+# =====================================================
+
+WATCH_POLL_INTERVAL = 0.5  # Segundos entre verificações dos arquivos
+WATCH_DEBOUNCE = 1.0       # Segundos sem novas gravações antes de gerar
+
+
+def file_signature(path):
+    """(mtime_ns, tamanho) do arquivo, ou None se ele não existe"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def watch_changes(paths, interval=WATCH_POLL_INTERVAL, debounce=WATCH_DEBOUNCE):
+    """
+    Monitora arquivos por polling de mtime/tamanho
+    
+    Uma rajada de gravações (ex: editor salvando em etapas, cópia de vários
+    CSVs) só é entregue depois de debounce segundos sem nenhuma alteração.
+    
+    Args:
+        paths (list): Arquivos monitorados (podem ainda não existir)
+        interval (float): Segundos entre verificações
+        debounce (float): Segundos de estabilidade exigidos
+        
+    Yields:
+        tuple: (conjunto de arquivos alterados, instante da primeira alteração em epoch)
+    """
+    signatures = {path: file_signature(path) for path in paths}
+    while True:
+        time.sleep(interval)
+        current = {path: file_signature(path) for path in paths}
+        if current == signatures:
+            continue
+        stable_since = time.monotonic()
+        while time.monotonic() - stable_since < debounce:
+            time.sleep(interval)
+            latest = {path: file_signature(path) for path in paths}
+            if latest != current:
+                current = latest
+                stable_since = time.monotonic()
+        changed = {path for path in paths if current[path] != signatures[path]}
+        signatures = current
+        if changed:
+            mtimes = [current[path][0] / 1e9 for path in changed if current[path] is not None]
+            yield changed, min(mtimes) if mtimes else time.time()
+
+
+def run_watch(conexoes_files, config, config_file, elementos_file, localidades_file,
+              process_kwargs, timestamps):
+    """
+    Modo --watch: gera de novo os diagramas a cada alteração das entradas
+    
+    Alterações em um arquivo de conexões regeneram só as saídas dele; no
+    config.json, elementos.csv ou localidades.csv, as de todos os arquivos.
+    As saídas são regravadas com o mesmo nome (timestamps fixos por arquivo).
+    Índices de elementos/localidades, encodings e layouts ficam em cache no
+    processo: entradas inalteradas não são relidas e um layout cujo grafo e
+    parâmetros não mudaram não é recalculado.
+    
+    Args:
+        conexoes_files (list): Arquivos de conexões monitorados
+        config (dict): Configuração carregada
+        config_file (str): Caminho do config.json
+        elementos_file (str): Caminho do elementos.csv
+        localidades_file (str): Caminho do localidades.csv
+        process_kwargs (dict): Demais parâmetros de process_file
+        timestamps (dict): Arquivo de conexões -> carimbo usado no nome das saídas
+    """
+    shared_inputs = [path for path in (config_file, elementos_file, localidades_file) if path]
+    watched = list(dict.fromkeys(list(conexoes_files) + shared_inputs))
+    logger.info("👀 Monitorando %d arquivos (Ctrl+C para sair)", len(watched))
+    print(f"Monitorando {len(watched)} arquivos (Ctrl+C para sair)")
+    try:
+        for changed, changed_at in watch_changes(watched):
+            logger.info("🔄 Alteração detectada: %s", ', '.join(os.path.basename(path) for path in sorted(changed)))
+            if config_file in changed:
+                try:
+                    config = load_config(config_file)
+                except (OSError, ValueError):
+                    logger.error("config.json inválido; mantendo a configuração anterior")
+            if changed & set(shared_inputs):
+                affected = conexoes_files
+            else:
+                affected = [path for path in conexoes_files if path in changed]
+            for conexoes_file in affected:
+                if not os.path.exists(conexoes_file):
+                    logger.warning("Arquivo de conexões removido: %s", conexoes_file)
+                    continue
+                success = process_file(conexoes_file, config, timestamp=timestamps[conexoes_file],
+                                       **process_kwargs)
+                latency = time.time() - changed_at
+                logger.info("%s %s: saída atualizada %.2fs após a alteração",
+                            "✅" if success else "⛔", os.path.basename(conexoes_file), latency)
+                print(f"{'OK' if success else 'FALHA'} {os.path.basename(conexoes_file)}: "
+                      f"{latency:.2f}s após a alteração")
+    except KeyboardInterrupt:
+        logger.info("Monitoramento encerrado")
+
+
+# =====================================================
+# MODO DAEMON (--daemon)
+# =====================================================
+
+DAEMON_DEFAULT_ADDRESS = '127.0.0.1:8765'
+DAEMON_MAX_PENDING = 256           # Jobs aguardando worker antes de recusar novos (HTTP 503)
+DAEMON_LATENCY_WINDOW = 1000       # Últimos jobs considerados no p50/p99
+DAEMON_MAX_BODY = 256 * 1024 * 1024
+
+# Campo do job (JSON) -> parâmetro de process_file
+DAEMON_JOB_FIELDS = {
+    'layouts': 'layouts_choice',
+    'orfaos': 'include_orphans',
+    'regionalizacao': 'regionalization',
+    'ignorar_opcionais': 'ignore_optional',
+    'filtro': 'filter_string',
+    'agregada': 'aggregate_links',
+    'focus': 'focus_nodes',
+    'hops': 'focus_hops',
+    'crop': 'geo_crop',
+    'sites': 'site_view',
+    'update': 'update_file',
+}
+
+
+class DaemonProgressHandler(logging.Handler):
+    """Encaminha os logs de um job, do processo worker para o daemon"""
+
+    def __init__(self, queue, job_id):
+        super().__init__(logging.INFO)
+        self.queue = queue
+        self.job_id = job_id
+
+    def emit(self, record):
+        try:
+            self.queue.put((self.job_id, record.levelname, record.getMessage()))
+        except Exception:
+            self.handleError(record)
+
+
+def _daemon_worker_init(verbose, elementos_file, localidades_file):
+    """Inicialização de cada worker: nível de log, cache de layouts e índices de referência"""
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
+    enable_layout_cache()
+    try:
+        if localidades_file and os.path.exists(localidades_file):
+            load_localidades(localidades_file)
+        if elementos_file and os.path.exists(elementos_file):
+            load_elementos_index(elementos_file, detect_encoding(elementos_file))
+    except Exception:
+        logger.exception("Falha ao pré-carregar índices no worker")
+
+
+def _daemon_ping():
+    """Tarefa vazia usada para iniciar os workers antes do primeiro job"""
+    return os.getpid()
+
+
+def _daemon_job(job_id, job, config, defaults, progress):
+    """
+    Executa um job de renderização em um processo worker
+    
+    Args:
+        job_id (int): Identificador do job no daemon
+        job (dict): Job validado (ver RenderDaemon.validate_job)
+        config (dict): Configuração corrente do daemon
+        defaults (dict): Arquivos de elementos/localidades padrão do daemon
+        progress: Fila (multiprocessing) para os logs do job
+        
+    Returns:
+        dict: sucesso, arquivos e, para CSV enviado no corpo, o conteúdo gerado
+    """
+    handler = DaemonProgressHandler(progress, job_id)
+    logger.addHandler(handler)
+    work_dir = None
+    try:
+        if 'conexoes_csv' in job:
+            # CSV enviado no corpo: processado em diretório temporário
+            work_dir = tempfile.mkdtemp(prefix='gerador_')
+            conexoes_file = os.path.join(work_dir, os.path.basename(job.get('nome') or 'conexoes.csv'))
+            with open(conexoes_file, 'w', encoding='utf-8') as f:
+                f.write(job['conexoes_csv'])
+        else:
+            conexoes_file = job['conexoes']
+
+        kwargs = {param: job[field] for field, param in DAEMON_JOB_FIELDS.items() if field in job}
+        kwargs.setdefault('layouts_choice', 'cogh')
+        if isinstance(kwargs.get('focus_nodes'), str):
+            kwargs['focus_nodes'] = [name.strip() for name in kwargs['focus_nodes'].split(',') if name.strip()]
+        opcoes = job.get('opcoes', '')
+        outputs = []
+        success = process_file(
+            conexoes_file,
+            config,
+            elementos_file=job.get('elementos', defaults['elementos']),
+            localidades_file=job.get('localidades', defaults['localidades']),
+            hide_node_names='n' in opcoes,
+            hide_connection_layers='c' in opcoes,
+            collapse_links='a' in opcoes,
+            outputs=outputs,
+            **kwargs
+        )
+        result = {'sucesso': bool(success), 'arquivos': outputs}
+        if work_dir:
+            result['arquivos'] = [os.path.basename(path) for path in outputs]
+            result['conteudo'] = {}
+            for path in outputs:
+                with open(path, 'r', encoding='utf-8') as f:
+                    result['conteudo'][os.path.basename(path)] = f.read()
+        return result
+    finally:
+        logger.removeHandler(handler)
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        progress.put((job_id, None, None))  # Fim dos logs do job
+
+
+class RenderDaemon:
+    """
+    Servidor local de renderização (--daemon)
+
+    Mantém carregados, entre um job e outro, o config, os índices de
+    localidades/elementos, os caches de encoding e estilo e os próprios
+    processos worker (com networkx já importado), eliminando o custo fixo
+    de cada execução da CLI. Os jobs chegam por HTTP em localhost (ou
+    socket Unix) e são executados em um pool de processos com paralelismo
+    limitado; os excedentes aguardam em fila.
+
+    Protocolo:
+        POST /render  corpo JSON com o job; resposta em NDJSON, uma linha por
+                      evento: fila, inicio, log (um por mensagem) e fim (ou erro)
+        GET /stats    JSON com contadores e latência p50/p99 dos últimos jobs
+    """
+
+    def __init__(self, config_file='config.json', workers=None, verbose=False,
+                 elementos_file='elementos.csv', localidades_file='localidades.csv'):
+        self.config_file = config_file
+        self.config = load_config(config_file)
+        self.config_mtime = os.path.getmtime(config_file)
+        self.workers = max(1, workers or min(4, os.cpu_count() or 1))
+        self.verbose = verbose
+        self.defaults = {'elementos': elementos_file, 'localidades': localidades_file}
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=DAEMON_LATENCY_WINDOW)
+        self.job_events = {}  # job_id -> asyncio.Queue com os eventos de log
+        self.next_job_id = 1
+        self.loop = None
+        self.pool = None
+        self.slots = None
+        self.manager = None
+        self.progress = None
+
+    def current_config(self):
+        """Config em memória, recarregado quando o arquivo muda (mantém o anterior se inválido)"""
+        try:
+            mtime = os.path.getmtime(self.config_file)
+            if mtime != self.config_mtime:
+                self.config = load_config(self.config_file)
+                self.config_mtime = mtime
+        except (OSError, ValueError):
+            logger.error("Falha ao recarregar %s; mantendo a configuração anterior", self.config_file)
+        return self.config
+
+    @staticmethod
+    def validate_job(job):
+        """
+        Valida um job recebido
+        
+        Args:
+            job (dict): Corpo JSON do pedido
+            
+        Returns:
+            str | None: Mensagem de erro ou None se o job é válido
+        """
+        if not isinstance(job, dict):
+            return "O corpo deve ser um objeto JSON"
+        if 'conexoes_csv' in job:
+            if not isinstance(job['conexoes_csv'], str):
+                return "conexoes_csv deve ser texto"
+        elif not isinstance(job.get('conexoes'), str):
+            return "Informe 'conexoes' (caminho) ou 'conexoes_csv' (conteúdo)"
+        elif not os.path.isfile(job['conexoes']):
+            return f"Arquivo não encontrado: {job['conexoes']}"
+        layouts = job.get('layouts', 'cogh')
+        if not isinstance(layouts, str) or not layouts or any(char not in 'cogh' for char in layouts):
+            return "layouts deve conter apenas c, o, g, h"
+        if job.get('sites') not in (None,) + SITE_AGGREGATION_KEYS:
+            return f"sites deve ser um de: {', '.join(SITE_AGGREGATION_KEYS)}"
+        if 'conexoes_csv' in job and job.get('update'):
+            return "update exige 'conexoes' (caminho)"
+        return None
+
+    def stats(self):
+        """Contadores do daemon e latência (fila + execução) dos últimos jobs"""
+        p50 = p99 = None
+        if self.latencies:
+            p50, p99 = np.percentile(np.fromiter(self.latencies, dtype=float), [50, 99]).tolist()
+        return {
+            'workers': self.workers,
+            'em_execucao': self.running,
+            'na_fila': self.pending,
+            'concluidos': self.completed,
+            'falhas': self.failed,
+            'p50_ms': None if p50 is None else round(p50 * 1000, 1),
+            'p99_ms': None if p99 is None else round(p99 * 1000, 1),
+        }
+
+    def _drain_progress(self):
+        """Thread que repassa os logs dos workers para a fila de eventos de cada job"""
+        while True:
+            item = self.progress.get()
+            if item is None:
+                return
+            job_id, level, message = item
+            events = self.job_events.get(job_id)
+            if events is None:
+                continue
+            event = None if level is None else {'evento': 'log', 'nivel': level, 'mensagem': message}
+            self.loop.call_soon_threadsafe(events.put_nowait, event)
+
+    async def _send(self, writer, event):
+        writer.write((json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8'))
+        await writer.drain()
+
+    async def _respond(self, writer, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('ascii') + body)
+        await writer.drain()
+
+    async def _render(self, writer, job):
+        """Enfileira o job e transmite os eventos até o resultado"""
+        if self.pending >= DAEMON_MAX_PENDING:
+            await self._respond(writer, '503 Service Unavailable', {'erro': 'Fila cheia'})
+            return
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        events = asyncio.Queue()
+        self.job_events[job_id] = events
+        accepted = time.perf_counter()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson; charset=utf-8\r\n"
+                     b"Connection: close\r\n\r\n")
+        self.pending += 1
+        try:
+            await self._send(writer, {'evento': 'fila', 'job': job_id, 'posicao': self.pending})
+            async with self.slots:
+                self.pending -= 1
+                self.running += 1
+                started = time.perf_counter()
+                try:
+                    await self._send(writer, {'evento': 'inicio', 'job': job_id,
+                                              'espera_s': round(started - accepted, 3)})
+                    future = self.loop.run_in_executor(
+                        self.pool, _daemon_job, job_id, job, self.current_config(), self.defaults, self.progress)
+                    getter = None
+                    while True:
+                        if getter is None:
+                            getter = asyncio.ensure_future(events.get())
+                        waiting = {getter} if future.done() else {getter, future}
+                        done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                        if getter in done:
+                            event = getter.result()
+                            getter = None
+                            if event is None:
+                                break
+                            await self._send(writer, event)
+                        elif future.exception() is not None:
+                            getter.cancel()  # Worker falhou sem encerrar os logs
+                            break
+                    result = await future
+                finally:
+                    self.running -= 1
+        except Exception as e:
+            self.failed += 1
+            logger.exception("💥 Job %d falhou", job_id)
+            await self._send(writer, {'evento': 'erro', 'job': job_id, 'erro': str(e)})
+            return
+        finally:
+            self.job_events.pop(job_id, None)
+
+        finished = time.perf_counter()
+        latency = finished - accepted
+        self.latencies.append(latency)
+        self.completed += 1
+        if not result['sucesso']:
+            self.failed += 1
+        stats = self.stats()
+        logger.info("Job %d concluído em %.2fs (sucesso=%s) | p50 %.0fms | p99 %.0fms | %d jobs",
+                    job_id, latency, result['sucesso'], stats['p50_ms'], stats['p99_ms'], len(self.latencies))
+        await self._send(writer, {'evento': 'fim', 'job': job_id, 'segundos': round(latency, 3),
+                                  'execucao_s': round(finished - started, 3), **result})
+
+    async def _handle(self, reader, writer):
+        """Atende uma conexão HTTP (um pedido por conexão)"""
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+            if len(request_line) < 2:
+                await self._respond(writer, '400 Bad Request', {'erro': 'Pedido inválido'})
+                return
+            method, path = request_line[0], request_line[1].split('?', 1)[0]
+
+            if method == 'GET' and path == '/stats':
+                await self._respond(writer, '200 OK', self.stats())
+            elif method == 'POST' and path == '/render':
+                length = int(headers.get('content-length', 0))
+                if length > DAEMON_MAX_BODY:
+                    await self._respond(writer, '413 Payload Too Large', {'erro': 'Corpo muito grande'})
+                    return
+                try:
+                    job = json.loads(await reader.readexactly(length))
+                except (ValueError, asyncio.IncompleteReadError):
+                    await self._respond(writer, '400 Bad Request', {'erro': 'JSON inválido'})
+                    return
+                error = self.validate_job(job)
+                if error:
+                    await self._respond(writer, '400 Bad Request', {'erro': error})
+                    return
+                await self._render(writer, job)
+            else:
+                await self._respond(writer, '404 Not Found', {'erro': 'Use POST /render ou GET /stats'})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            logger.debug("Cliente desconectou antes do fim da resposta")
+        finally:
+            writer.close()
+
+    async def serve(self, address=DAEMON_DEFAULT_ADDRESS):
+        """
+        Inicia o pool de workers e atende pedidos até ser interrompido
+        
+        Args:
+            address (str): "host:porta", "porta" ou caminho de socket Unix
+                (contendo "/"); o host deve ser local
+        """
+        self.loop = asyncio.get_running_loop()
+        context = multiprocessing.get_context('spawn')
+        self.manager = context.Manager()
+        self.progress = self.manager.Queue()
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_daemon_worker_init,
+            initargs=(self.verbose, self.defaults['elementos'], self.defaults['localidades'])
+        )
+        self.slots = asyncio.Semaphore(self.workers)
+        drain_thread = threading.Thread(target=self._drain_progress, daemon=True)
+        drain_thread.start()
+        unix_path = address if '/' in address else None
+        try:
+            # Aquecer os workers antes de aceitar pedidos
+            start = time.perf_counter()
+            await asyncio.gather(*(self.loop.run_in_executor(self.pool, _daemon_ping)
+                                   for _ in range(self.workers)))
+            logger.info("Workers prontos: %d em %.2fs", self.workers, time.perf_counter() - start)
+
+            if unix_path:
+                server = await asyncio.start_unix_server(self._handle, path=unix_path)
+            else:
+                host, _, port = address.rpartition(':')
+                host = host or '127.0.0.1'
+                if host not in ('127.0.0.1', 'localhost', '::1'):
+                    raise ValueError(f"O daemon aceita apenas endereços locais: {host}")
+                server = await asyncio.start_server(self._handle, host, int(port))
+            logger.info("🛰️ Daemon ouvindo em %s (%d workers)", address, self.workers)
+            print(f"Daemon ouvindo em {address} ({self.workers} workers) - POST /render, GET /stats")
+            stop = asyncio.Event()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    self.loop.add_signal_handler(sig, stop.set)
+                except (NotImplementedError, RuntimeError):
+                    pass  # Windows: Ctrl+C interrompe asyncio.run
+            async with server:
+                await stop.wait()
+            logger.info("Daemon encerrado | %s", json.dumps(self.stats()))
+        finally:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.progress.put(None)
+            drain_thread.join(timeout=5)
+            self.manager.shutdown()
+            if unix_path and os.path.exists(unix_path):
+                os.remove(unix_path)
+
+
+def run_daemon(address, config_file='config.json', workers=None, verbose=False,
+               elementos_file='elementos.csv', localidades_file='localidades.csv'):
+    """Executa o daemon de renderização até Ctrl+C"""
+    try:
+        daemon = RenderDaemon(config_file, workers, verbose, elementos_file, localidades_file)
+    except (OSError, ValueError):
+        sys.exit(1)
+    try:
+        asyncio.run(daemon.serve(address))
+    except KeyboardInterrupt:
+        logger.info("Daemon encerrado")
+
+
 def main():
     global_start = time.perf_counter()
     verificar_dependencias() 
@@ -2885,7 +6804,7 @@ def main():
         '-o', 
         metavar='OPÇÕES', 
         default='', 
-        help='Opções: n (nós sem nomes), c (ocultar camadas de conexão)'
+        help='Opções: n (nós sem nomes), c (ocultar camadas de conexão), a (uma ligação por par de nós)'
     )
     parser.add_argument(
         '-d', 
@@ -2903,8 +6822,65 @@ def main():
         '-f',
         metavar='FILTRO',
         default=None,
-        help='Filtrar nós/camadas: in/rn/ic/rc "filtro1;filtro2"'
+        help='Filtrar nós/camadas: in/rn/ic/rc "filtro1;filtro2" ou expressão com E/OU/NAO'
     )    
+    parser.add_argument(
+        '-a',
+        action='store_true',
+        help='Leitura agregada: agrupa conexões paralelas (mesma origem, destino e estilo) durante a leitura'
+    )
+    parser.add_argument(
+        '--focus',
+        metavar='NÓ[,NÓ]',
+        default=None,
+        help='Gerar apenas a vizinhança dos nós informados (separados por vírgula)'
+    )
+    parser.add_argument(
+        '--hops',
+        metavar='K',
+        type=int,
+        default=2,
+        help='Distância máxima (em conexões) a partir dos nós de --focus. Padrão: 2'
+    )
+    parser.add_argument(
+        '--crop',
+        metavar='RECORTE',
+        default=None,
+        help='Recorte geográfico: lat_min,lon_min,lat_max,lon_max | lat,lon,raio_km | SITEID,raio_km'
+    )
+    parser.add_argument(
+        '--sites',
+        metavar='CHAVE',
+        default=None,
+        choices=SITE_AGGREGATION_KEYS,
+        help='Adiciona a página de visão por site, agrupando por siteid ou localidade'
+    )
+    parser.add_argument(
+        '--update',
+        metavar='ARQUIVO.drawio',
+        default=None,
+        help='Atualiza um diagrama existente mantendo a geometria (ignora -t)'
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help='Após gerar, monitora CSVs e config.json e gera de novo a cada alteração'
+    )
+    parser.add_argument(
+        '--daemon',
+        metavar='ENDERECO',
+        nargs='?',
+        const=DAEMON_DEFAULT_ADDRESS,
+        default=None,
+        help=f'Servidor local de renderização (HTTP em host:porta ou socket Unix). Padrão: {DAEMON_DEFAULT_ADDRESS}'
+    )
+    parser.add_argument(
+        '--workers',
+        metavar='N',
+        type=int,
+        default=None,
+        help='Jobs simultâneos no modo --daemon (padrão: núcleos, até 4)'
+    )
     
     # Tentar analisar os argumentos
     try:
@@ -3008,7 +6984,7 @@ def main():
     logger.debug("="*50)
     
     # Se não houver arquivos para processar, executar GUI
-    if not conexoes_files:
+    if not conexoes_files and not args.daemon:
         logger.info("Nenhum arquivo de conexões encontrado, iniciando GUI")
         run_gui()
         return
@@ -3058,13 +7034,33 @@ def main():
             logger.info("  -s %s (localidades)", args.s)
         if args.o:
             logger.info("  -o %s (visualização)", args.o)
+        if args.a:
+            logger.info("  -a (leitura agregada de conexões)")
+        if args.focus:
+            logger.info("  --focus %s --hops %d (diagrama focado)", args.focus, args.hops)
+        if args.crop:
+            logger.info("  --crop %s (recorte geográfico)", args.crop)
+        if args.sites:
+            logger.info("  --sites %s (visão por site)", args.sites)
+        if args.update:
+            logger.info("  --update %s (atualização de diagrama)", args.update)
+        if args.watch:
+            logger.info("  --watch (monitoramento das entradas)")
     
     # Registrar informações do sistema
     logger.debug("Sistema: %s %s", sys.platform, platform.platform())
     logger.debug("Python: %s", sys.version)
     logger.debug("Dependências: networkx=%s", nx.__version__)
     
-    config = load_config(args.c) if hasattr(args, 'c') else load_config()
+    # Modo daemon: atende jobs até ser interrompido
+    if args.daemon:
+        run_daemon(args.daemon, args.c, args.workers, args.verbose, elementos_file, localidades_file)
+        return
+    
+    try:
+        config = load_config(args.c) if hasattr(args, 'c') else load_config()
+    except (OSError, ValueError):
+        sys.exit(1)
     
     # Validar escolha de layouts
     valid_layouts = {'c', 'o', 'g', 'h'}
@@ -3088,25 +7084,61 @@ def main():
         print("Erro: Nenhum arquivo CSV válido")
         sys.exit(1)
     
+    # Nós de foco (--focus/--hops)
+    focus_nodes = [name.strip() for name in args.focus.split(',') if name.strip()] if args.focus else []
+    if args.hops < 0:
+        logger.error("Opção --hops deve ser maior ou igual a zero: %d", args.hops)
+        print(f"Erro: opção --hops deve ser maior ou igual a zero: {args.hops}")
+        sys.exit(1)
+    
+    # Atualização de diagrama existente (--update)
+    update_file = apply_base_dir(args.update) if args.update else None
+    if update_file:
+        if not os.path.isfile(update_file):
+            logger.error("Arquivo a atualizar não encontrado: %s", update_file)
+            print(f"Erro: arquivo a atualizar não encontrado: {update_file}")
+            sys.exit(1)
+        if len(valid_files) > 1:
+            logger.error("--update aceita apenas um arquivo de conexões (recebidos: %d)", len(valid_files))
+            print("Erro: --update aceita apenas um arquivo de conexões")
+            sys.exit(1)
+    
     # Processar opções de visualização
     hide_node_names = 'n' in args.o
     hide_connection_layers = 'c' in args.o
+    collapse_links = 'a' in args.o
     
     # Processar cada arquivo com as novas opções
+    process_kwargs = dict(
+        include_orphans=args.y,
+        layouts_choice=layouts_choice,
+        regionalization=args.r,
+        elementos_file=elementos_file,
+        localidades_file=localidades_file,
+        hide_node_names=hide_node_names,
+        hide_connection_layers=hide_connection_layers,
+        ignore_optional=args.d,
+        filter_string=args.f,
+        aggregate_links=args.a,
+        focus_nodes=focus_nodes,
+        focus_hops=args.hops,
+        geo_crop=args.crop,
+        site_view=args.sites,
+        collapse_links=collapse_links,
+        update_file=update_file
+    )
+    # No modo --watch cada arquivo mantém o mesmo nome de saída em todos os ciclos
+    timestamps = {}
+    if args.watch:
+        enable_layout_cache()
+        timestamps = {f: datetime.now().strftime("%Y%m%d%H%M%S") for f in valid_files}
     results = []
     for conexoes_file in valid_files:
         results.append(process_file(
             conexoes_file, 
             config, 
-            args.y, 
-            layouts_choice, 
-            args.r,
-            elementos_file,
-            localidades_file,
-            hide_node_names,
-            hide_connection_layers,
-            ignore_optional=args.d,
-            filter_string=args.f
+            timestamp=timestamps.get(conexoes_file),
+            **process_kwargs
         ))
     
     # Relatório final de execução
@@ -3119,6 +7151,10 @@ def main():
     logger.info("   Tempo total: %.2f segundos", total_time)
     log_memory_usage("Final do processamento")
     
+    if args.watch:
+        run_watch(valid_files, config, args.c, elementos_file, localidades_file, process_kwargs, timestamps)
+        return
+    
     if success_count < total_files:
         logger.error("⛔ Um ou mais arquivos falharam no processamento")
         sys.exit(1)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# GeradorTopologias.py fica na raiz do repositório (script único)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,54 @@
+import codecs
+import json
+import os
+
+import pytest
+
+import GeradorTopologias as gt
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.json')
+
+ELEMENTOS = (
+    "elemento;camada;nivel;cor;siteid;apelido\n"
+    "RTIC-SÃO-01;INNER-CORE;1;;S001;Núcleo\n"
+    "RTOC-X0002-01;OUTER-CORE;2;;S002;\n"
+    "ÓRFÃO-01;INNER-CORE;1;;S001;\n"
+)
+CONEXOES = "ponta-a;ponta-b;textoconexao\nRTIC-SÃO-01;RTOC-X0002-01;L1\n"
+
+
+@pytest.fixture
+def config():
+    with open(CONFIG_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('bom', [b'', codecs.BOM_UTF8], ids=['utf8', 'utf8-bom'])
+def test_utf8_elementos_is_indexed(tmp_path, bom):
+    path = tmp_path / 'elementos.csv'
+    path.write_bytes(bom + ELEMENTOS.encode('utf-8'))
+    encoding = gt.detect_encoding(str(path))
+    assert encoding == 'utf-8-sig'
+
+    index = gt.ElementosIndex.build(str(path), encoding)
+    assert index is not None
+    assert index.header[0] == 'elemento'  # BOM fora do nome da coluna
+    assert set(index.offsets) == {'RTIC-SÃO-01', 'RTOC-X0002-01', 'ÓRFÃO-01'}
+    with open(path, 'rb') as handle:
+        row, = index.read_rows(handle, 'RTIC-SÃO-01')
+    assert row['apelido'] == 'Núcleo'
+
+
+def test_utf8_generator_takes_indexed_path(tmp_path, config):
+    elementos = tmp_path / 'elementos.csv'
+    conexoes = tmp_path / 'conexoes.csv'
+    elementos.write_bytes(codecs.BOM_UTF8 + ELEMENTOS.encode('utf-8'))
+    conexoes.write_text(CONEXOES, encoding='utf-8')
+
+    generator = gt.TopologyGenerator(str(elementos), str(conexoes), config,
+                                     localidades_file=str(tmp_path / 'localidades.csv'))
+    assert generator.read_elementos()
+    assert generator.elementos_index is not None
+    assert generator.read_conexoes()
+    assert set(generator.nodes) == {'RTIC-SÃO-01', 'RTOC-X0002-01'}
+    assert generator.nodes['RTIC-SÃO-01'].camada == 'INNER-CORE'
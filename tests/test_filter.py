@@ -0,0 +1,73 @@
+import pytest
+
+import GeradorTopologias as gt
+
+# nome -> (camada, siteid, nivel)
+NODES = {
+    'RTIC-SPO-01': ('CORE', 'SPO', 1),
+    'RTIC-RJO-01': ('CORE', 'RJO', 1),
+    'RTOC-SPO-01': ('METRO', 'SPO', 2),
+    'RTOC-BHE-01': ('METRO', 'BHE', 3),
+    'SWT-LAB12': ('ACESSO', 'TMP', 4),
+    'SWT-POA-01': ('ACESSO', 'POA', None),
+}
+REGIONS = {'SPO': 'SUDESTE', 'RJO': 'SUDESTE', 'BHE': 'SUDESTE', 'POA': 'SUL'}
+
+
+@pytest.fixture(scope='module')
+def index():
+    nodes = {}
+    layers = {}
+    for idx, (nome, (camada, siteid, nivel)) in enumerate(NODES.items()):
+        nodes[nome] = gt.NodeRecord(idx, nome, camada, nivel, siteid=siteid)
+        layers.setdefault(camada, set()).add(idx)
+    return gt.NodeSelectionIndex(nodes, layers, lambda siteid: REGIONS.get(siteid, ''))
+
+
+def matched(expression):
+    return {nome for nome, (camada, siteid, nivel) in NODES.items()
+            if expression.matches(nome, camada, REGIONS.get(siteid, ''), siteid, nivel)}
+
+
+def selected(expression, index):
+    names = {idx: nome for nome, idx in index.names.items()}
+    return {names[idx] for idx in expression.select(index)}
+
+
+@pytest.mark.parametrize('filter_string, expected', [
+    # AND tem precedência sobre OR
+    ('camada:METRO OR camada:CORE AND siteid:RJO', {'RTOC-SPO-01', 'RTOC-BHE-01', 'RTIC-RJO-01'}),
+    ('(camada:METRO OR camada:CORE) AND siteid:SPO', {'RTIC-SPO-01', 'RTOC-SPO-01'}),
+    ('camada:CORE siteid:SPO', {'RTIC-SPO-01'}),
+    ('NOT camada:ACESSO', {'RTIC-SPO-01', 'RTIC-RJO-01', 'RTOC-SPO-01', 'RTOC-BHE-01'}),
+    ('NAO NAO camada:CORE', {'RTIC-SPO-01', 'RTIC-RJO-01'}),
+    ('camada:METRO E NÃO regiao:sudeste OU nivel:4', {'SWT-LAB12'}),
+    ('nivel:2-3', {'RTOC-SPO-01', 'RTOC-BHE-01'}),
+    ('re:"-LAB[0-9]+$"', {'SWT-LAB12'}),
+    # Tipos originais
+    ('in:RTIC;RTOC', {'RTIC-SPO-01', 'RTIC-RJO-01', 'RTOC-SPO-01', 'RTOC-BHE-01'}),
+    ('in:RTIC ; RTOC', {'RTIC-SPO-01', 'RTIC-RJO-01', 'RTOC-SPO-01', 'RTOC-BHE-01'}),
+    ('rn:RTIC;SWT', {'RTOC-SPO-01', 'RTOC-BHE-01'}),
+    ('ic:ACESSO', {'SWT-LAB12', 'SWT-POA-01'}),
+    ('rc:CORE;METRO', {'SWT-LAB12', 'SWT-POA-01'}),
+])
+def test_matches_and_select_agree(index, filter_string, expected):
+    expression = gt.compile_filter(filter_string)
+    assert matched(expression) == expected
+    assert selected(expression, index) == expected
+
+
+def test_quoted_value_is_not_normalised():
+    expression = gt.compile_filter('re:"A ; B"')
+    assert expression.values == ('A ; B',)
+    assert expression.matches('A ; B')
+    assert not expression.matches('A;B')
+
+
+@pytest.mark.parametrize('filter_string', [
+    'nome:', 'in:;', 're:""', 'camada:CORE AND siteid:', '', 'camada:CORE AND',
+    '(camada:CORE', 'camada:CORE)', 'cor:azul', 'RTIC', 're:"["', 'nivel:x',
+])
+def test_invalid_filters_raise(filter_string):
+    with pytest.raises(ValueError):
+        gt.compile_filter(filter_string)
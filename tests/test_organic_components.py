@@ -0,0 +1,104 @@
+import json
+import os
+
+import pytest
+
+import GeradorTopologias as gt
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.json')
+
+
+def two_islands(size):
+    """Registros de conexões com duas ilhas em anel de size nós cada"""
+    links = []
+    for island in 'AB':
+        for i in range(size):
+            links.append({'ponta-a': f'RTIC-{island}{i}-01', 'ponta-b': f'RTIC-{island}{(i + 1) % size}-01',
+                          'textoconexao': ''})
+    return links
+
+
+def test_pack_rectangles_do_not_overlap():
+    sizes = [(300, 200), (50, 50), (120, 400), (0, 0), (80, 10)]
+    gap = 20
+    offsets = gt.pack_rectangles(sizes, gap)
+    boxes = [(x, y, x + w, y + h) for (x, y), (w, h) in zip(offsets, sizes)]
+    for i, a in enumerate(boxes):
+        for b in boxes[i + 1:]:
+            separated = (a[2] + gap <= b[0] or b[2] + gap <= a[0] or
+                         a[3] + gap <= b[1] or b[3] + gap <= a[1])
+            assert separated
+
+
+def test_library_call_does_not_spawn_processes(monkeypatch):
+    def forbidden(*args, **kwargs):
+        raise AssertionError("render_topology não deve criar processos por padrão")
+    monkeypatch.setattr(gt, 'ProcessPoolExecutor', forbidden)
+    monkeypatch.setattr(gt, 'ORGANIC_PARALLEL_MIN_SECONDS', 0)
+    monkeypatch.setattr(gt.os, 'cpu_count', lambda: 8)
+    with open(CONFIG_FILE, encoding='utf-8') as f:
+        config = json.load(f)
+    config["ORGANIC_LAYOUT"] = dict(config.get("ORGANIC_LAYOUT", {}), iterations_min=20, iterations_max=20)
+    result = gt.render_topology(two_islands(30), config, layout='organico')
+    assert len(result.names) == 60
+
+
+@pytest.mark.parametrize('sizes', [[600] * 4, [2000, 600, 600, 50, 50], [5000] + [3] * 2000])
+def test_planner_sampling_fits_budget(monkeypatch, sizes):
+    monkeypatch.setattr(gt, 'SCIPY_AVAILABLE', False)
+    planner = gt.ExecutionPlanner({"PLANNER": {"time_budget": 120, "memory_budget_mb": 4096}})
+    config = {"ORGANIC_LAYOUT": {}}
+    planner._plan_organic(config, sizes)
+    cfg = config["ORGANIC_LAYOUT"]
+    sample = cfg["sample_nodes"]
+    assert sample <= gt.ORGANIC_DENSE_MAX_NODES
+    # Todo componente maior que a amostra roda na sua própria amostra
+    cost = gt.ORGANIC_PAIR_SECONDS * cfg["iterations_max"] * sum(min(size, sample) ** 2 for size in sizes)
+    assert cost <= planner.layout_budget
+
+
+def test_organic_graph_built_once_and_dropped_on_change(tmp_path):
+    with open(CONFIG_FILE, encoding='utf-8') as f:
+        config = json.load(f)
+    generator = gt.TopologyGenerator(None, 'ilhas', config, localidades_file=None,
+                                     conexoes_records=two_islands(5))
+    assert generator.read_elementos() and generator.read_conexoes()
+    graph = generator.organic_graph()
+    assert generator.organic_graph() is graph
+    generator._restrict_nodes({generator.nodes[f'RTIC-A{i}-01'].idx for i in range(5)})
+    smaller = generator.organic_graph()
+    assert smaller is not graph and len(smaller) == 5
+    generator.adjacency = generator.adjacency
+    assert generator.organic_graph() is not smaller
+
+
+def test_components_shared_by_planner_and_layout(monkeypatch):
+    with open(CONFIG_FILE, encoding='utf-8') as f:
+        config = json.load(f)
+    config["ORGANIC_LAYOUT"] = dict(config.get("ORGANIC_LAYOUT", {}), iterations_min=20, iterations_max=20)
+    generator = gt.TopologyGenerator(None, 'ilhas', config, localidades_file=None,
+                                     conexoes_records=two_islands(5))
+    assert generator.read_elementos() and generator.read_conexoes()
+    calls = []
+    connected_components = gt.nx.connected_components
+    monkeypatch.setattr(gt.nx, 'connected_components', lambda G: calls.append(1) or connected_components(G))
+
+    generator.config = gt.ExecutionPlanner({"PLANNER": {"enabled": True}}).plan(generator, ['organico'])
+    positions = generator.calculate_organico_positions()
+    assert len(positions) == 10
+    assert [len(nodes) for nodes in generator.organic_components()] == [5, 5]
+    assert len(calls) == 1
+
+
+def test_planner_is_opt_in(tmp_path):
+    with open(CONFIG_FILE, encoding='utf-8') as f:
+        config = json.load(f)
+    config["PLANNER"] = {"time_budget": 1e-6, "memory_budget_mb": 1e-6, "compress_above_mb": 0}
+    generator = gt.TopologyGenerator(None, 'ilhas', config, localidades_file=None,
+                                     conexoes_records=two_islands(5))
+    assert generator.read_elementos() and generator.read_conexoes()
+    planner = gt.ExecutionPlanner(config)
+    assert planner.plan(generator, ['organico', 'geografico']) is generator.config
+    conexoes = tmp_path / 'conexoes.csv'
+    conexoes.write_text('ponta-a;ponta-b;textoconexao\n' + 'A;B;x\n' * 100, encoding='utf-8')
+    assert planner.plan_ingest(str(conexoes), False) is False
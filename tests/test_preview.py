@@ -0,0 +1,27 @@
+import codecs
+
+import GeradorTopologias as gt
+
+
+def write_conexoes(path, rows, bom=b''):
+    lines = ["ponta-a;ponta-b;textoconexao"]
+    lines.extend(f"R{i};R{i + 1};LÍNK-{i}" for i in range(rows))
+    path.write_bytes(bom + ('\n'.join(lines) + '\n').encode('utf-8'))
+
+
+def test_small_file_is_read_whole(tmp_path):
+    path = tmp_path / 'conexoes.csv'
+    write_conexoes(path, 50)
+    assert gt.sample_conexoes_rows(str(path), max_rows=100, block_rows=10) is None
+
+
+def test_large_file_is_sampled_in_blocks(tmp_path):
+    path = tmp_path / 'conexoes.csv'
+    write_conexoes(path, 5000, bom=codecs.BOM_UTF8)
+    rows = gt.sample_conexoes_rows(str(path), max_rows=200, block_rows=20)
+    assert 0 < len(rows) <= 200
+    assert set(rows[0]) == {'ponta-a', 'ponta-b', 'textoconexao'}  # Cabeçalho sem o BOM
+    assert rows[0]['ponta-a'] == 'R0'
+    assert all(row['textoconexao'] == f"LÍNK-{row['ponta-a'][1:]}" for row in rows)  # Só linhas inteiras
+    # Blocos espalhados pelo arquivo todo, não só o início
+    assert max(int(row['ponta-a'][1:]) for row in rows) > 4000
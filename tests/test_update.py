@@ -0,0 +1,118 @@
+import json
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import GeradorTopologias as gt
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.json')
+
+ELEMENTOS = "elemento;camada;nivel;cor;siteid;apelido\n"
+CONEXOES = "ponta-a;ponta-b;textoconexao\n"
+
+
+def write_inputs(tmp_path, nodes, links):
+    elementos = tmp_path / 'elementos.csv'
+    conexoes = tmp_path / 'rede.csv'
+    elementos.write_text(ELEMENTOS + ''.join(f"{name};{layer};1;;S1;\n" for name, layer in nodes),
+                         encoding='utf-8')
+    conexoes.write_text(CONEXOES + ''.join(f"{a};{b};{a}-{b}\n" for a, b in links), encoding='utf-8')
+    return str(elementos), str(conexoes)
+
+
+def pages(tree):
+    """Página -> lista de (elemento, mxCell) na ordem do arquivo"""
+    result = {}
+    for diagram in tree.getroot().iter('diagram'):
+        cells = []
+        for elem in diagram.find('mxGraphModel').find('root'):
+            cells.append((elem, elem if elem.tag == 'mxCell' else elem.find('mxCell')))
+        result[diagram.get('name')] = cells
+    return result
+
+
+def label(elem):
+    return elem.get('value') if elem.tag == 'mxCell' else elem.get('label')
+
+
+def vertices(cells):
+    """Vértices de nós (legenda e títulos ficam de fora)"""
+    return {label(elem): (elem, inner) for elem, inner in cells
+            if inner.get('vertex') == '1' and label(elem).startswith('RT')}
+
+
+def edges(cells):
+    return {label(elem): inner for elem, inner in cells if inner.get('edge') == '1'}
+
+
+@pytest.fixture
+def config():
+    with open(CONFIG_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def test_update_round_trip(tmp_path, config):
+    elementos, conexoes = write_inputs(
+        tmp_path, [('RTIC-A', 'INNER-CORE'), ('RTIC-B', 'INNER-CORE'), ('RTOC-C', 'OUTER-CORE')],
+        [('RTIC-A', 'RTIC-B'), ('RTIC-B', 'RTOC-C')])
+    outputs = []
+    assert gt.process_file(conexoes, config, layouts_choice='c', elementos_file=elementos,
+                           localidades_file=None, outputs=outputs, timestamp='20250101000000')
+    drawio, = outputs
+
+    # O usuário move RTIC-A na página CORE
+    tree = ET.parse(drawio)
+    elem, inner = vertices(pages(tree)['CORE'])['RTIC-A']
+    geometry = inner.find('mxGeometry')
+    geometry.set('x', '1234')
+    geometry.set('y', '567')
+    tree.write(drawio, encoding='utf-8', xml_declaration=True)
+    geometry_b = dict(vertices(pages(tree)['CORE'])['RTIC-B'][1].find('mxGeometry').attrib)
+
+    # RTOC-C sai dos CSVs e RTOC-D entra ligado a RTIC-A
+    write_inputs(
+        tmp_path, [('RTIC-A', 'INNER-CORE'), ('RTIC-B', 'INNER-CORE'), ('RTOC-D', 'OUTER-CORE')],
+        [('RTIC-A', 'RTIC-B'), ('RTIC-A', 'RTOC-D')])
+    assert gt.process_file(conexoes, config, elementos_file=elementos, localidades_file=None,
+                           update_file=drawio)
+
+    core = pages(ET.parse(drawio))['CORE']
+    nodes = vertices(core)
+    assert set(nodes) == {'RTIC-A', 'RTIC-B', 'RTOC-D'}
+    moved = nodes['RTIC-A'][1].find('mxGeometry')
+    assert (moved.get('x'), moved.get('y')) == ('1234', '567')
+    assert dict(nodes['RTIC-B'][1].find('mxGeometry').attrib) == geometry_b
+
+    links = edges(core)
+    assert set(links) == {'RTIC-A-RTIC-B', 'RTIC-A-RTOC-D'}
+    ids = {name: elem.get('id') for name, (elem, _) in nodes.items()}
+    new_link = links['RTIC-A-RTOC-D']
+    assert (new_link.get('source'), new_link.get('target')) == (ids['RTIC-A'], ids['RTOC-D'])
+
+
+def test_update_writes_vertices_before_edges(tmp_path, config):
+    elementos, conexoes = write_inputs(tmp_path, [('RTIC-A', 'INNER-CORE'), ('RTIC-B', 'INNER-CORE')],
+                                       [('RTIC-A', 'RTIC-B')])
+    outputs = []
+    assert gt.process_file(conexoes, config, layouts_choice='c', elementos_file=elementos,
+                           localidades_file=None, outputs=outputs, timestamp='20250101000000')
+    drawio, = outputs
+
+    write_inputs(tmp_path, [('RTIC-A', 'INNER-CORE'), ('RTIC-B', 'INNER-CORE'),
+                            ('RTIC-E', 'INNER-CORE'), ('RTIC-F', 'INNER-CORE')],
+                 [('RTIC-A', 'RTIC-B'), ('RTIC-A', 'RTIC-E'), ('RTIC-E', 'RTIC-F')])
+    assert gt.process_file(conexoes, config, elementos_file=elementos, localidades_file=None,
+                           update_file=drawio)
+
+    updated = {name: cells for name, cells in pages(ET.parse(drawio)).items() if 'RTIC-A' in vertices(cells)}
+    assert 'CORE' in updated
+    for name, cells in updated.items():
+        seen = set()
+        for elem, inner in cells:
+            # Curvas novas vêm depois dos vértices novos que elas ligam
+            if label(elem) in ('RTIC-A-RTIC-E', 'RTIC-E-RTIC-F'):
+                assert inner.get('source') in seen and inner.get('target') in seen, name
+            seen.add(elem.get('id'))
+        assert {'RTIC-E', 'RTIC-F'} <= set(vertices(cells)), name
+        assert 'RTIC-E-RTIC-F' in edges(cells), name
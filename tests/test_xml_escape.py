@@ -0,0 +1,92 @@
+import json
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import GeradorTopologias as gt
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.json')
+LAYOUTS = ['circular', 'organico', 'geografico', 'hierarquico']
+
+HOSTILE = 'a&b <c> "d" \'e\'\tf\ng\x01h\x1f'
+CLEAN = 'a&b <c> "d" \'e\'\tf\ngh'  # Caracteres de controle não são válidos em XML 1.0
+
+
+def hostile(tag):
+    return f"{tag} {HOSTILE}"
+
+
+def clean(tag):
+    return f"{tag} {CLEAN}"
+
+
+NODES = [
+    {'elemento': hostile('R1'), 'camada': hostile('CAMADA'), 'nivel': '1',
+     'cor': '#FF0000" onload="x', 'siteid': 'S1', 'apelido': hostile('APELIDO')},
+    {'elemento': hostile('R2'), 'camada': hostile('CAMADA'), 'nivel': '2',
+     'cor': '', 'siteid': 'S2', 'apelido': ''},
+    {'elemento': 'R3 & <x>', 'camada': '', 'nivel': '', 'cor': '', 'siteid': 'S2', 'apelido': ''},
+]
+LINKS = [
+    {'ponta-a': hostile('R1'), 'ponta-b': hostile('R2'), 'textoconexao': hostile('L1')},
+    {'ponta-a': hostile('R1'), 'ponta-b': hostile('R2'), 'textoconexao': hostile('L2')},
+    {'ponta-a': hostile('R2'), 'ponta-b': 'R3 & <x>', 'textoconexao': '<&>'},
+]
+SITES = [
+    {'siteid': 'S1', 'Localidade': hostile('LOCAL'), 'RegiaoGeografica': hostile('REGIAO'),
+     'Latitude': '23.32.56.S', 'Longitude': '46.38.20.W'},
+    {'siteid': 'S2', 'Localidade': 'Sé & <Centro>', 'RegiaoGeografica': 'SUL',
+     'Latitude': '22.54.10.S', 'Longitude': '43.12.27.W'},
+]
+
+
+@pytest.fixture(scope='module')
+def config():
+    with open(CONFIG_FILE, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def cell_values(drawio):
+    """Rótulos de todas as células de todas as páginas (value do mxCell ou label do object)"""
+    root = ET.fromstring(drawio)
+    values = {cell.get('value') for cell in root.iter('mxCell') if cell.get('value')}
+    values.update(obj.get('label') for obj in root.iter('object') if obj.get('label'))
+    return values
+
+
+@pytest.mark.parametrize('layout', LAYOUTS)
+@pytest.mark.parametrize('options', [
+    {},
+    {'regionalization': True},
+    {'collapse_links': True},
+    {'site_view': 'siteid'},
+    {'site_view': 'localidade', 'collapse_links': True},
+], ids=['padrao', 'regional', 'o-a', 'sites', 'sites-localidade-o-a'])
+def test_hostile_labels_round_trip(config, layout, options):
+    result = gt.render_topology(LINKS, config, NODES, SITES, layout=layout, name=hostile('nome'), **options)
+    values = cell_values(result.drawio)
+
+    assert clean('APELIDO') in values
+    assert clean('R2') in values
+    assert 'R3 & <x>' in values
+    if not options.get('collapse_links'):
+        assert clean('L1') in values
+        assert '<&>' in values
+    assert not any(char in value for value in values for char in '\x01\x1f')
+    assert any(clean('CAMADA') in value for value in values)
+    # A cor entra no estilo sem abrir um novo atributo
+    assert not any('onload' in element.attrib for element in ET.fromstring(result.drawio).iter())
+
+
+def test_hostile_site_view_labels(config):
+    result = gt.render_topology(LINKS, config, NODES, SITES, layout='circular', site_view='localidade')
+    text = ' '.join(cell_values(result.drawio))
+    assert 'Sé & <Centro>' in text
+    assert clean('LOCAL') in text
+
+
+def test_xml_escape_translate():
+    assert gt.xml_escape(HOSTILE) == 'a&amp;b &lt;c&gt; &quot;d&quot; &apos;e&apos;&#x9;f&#xa;gh'
+    plain = 'RTIC-X0001-01'
+    assert gt.xml_escape(plain) is plain